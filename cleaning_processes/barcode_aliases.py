@@ -0,0 +1,175 @@
+import os
+import re
+import csv
+import time
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style, init
+from watermark import load_watermark, save_watermark, advance_watermark, appended_since, read_new_rows
+from category_tree import load_category_tree, category_codes
+from normalize_barcodes import normalize_barcode_values
+from surrogate_keys import add_key_ids, KEY_ID_COLUMNS, TRANSACTION_KEY_COLUMNS
+
+# Initialize colorama
+init(autoreset=True)
+
+# Versioned alias tables (barcode-aliases-v<N>.pkl.gz)
+alias_dir = 'Output/Aliases'
+ALIAS_FILE_PATTERN = re.compile(r'barcode-aliases-v(\d+)\.pkl\.gz$')
+
+
+def build_alias_table(items_df, duplicate_keys=('MODIFIED_SHORT_DESC', 'ar_short_desc')):
+    """
+    Alias table of the cleaned items: source_barcode -> canonical_barcode (the MAX_barcode) and the merge reason.
+
+    reason is 'canonical' for the barcode kept for the product, the first duplicate key the item shares with
+    another item of the same product, or 'cluster' when it was only linked through other items or as a near-duplicate.
+    """
+    items_df = items_df.dropna(subset=['barcode'])
+    # The last row wins for repeated barcodes, like the barcode mapping in update_transactions_df
+    items_df = items_df.drop_duplicates(subset='barcode', keep='last')
+
+    reason = pd.Series('cluster', index=items_df.index, dtype=object)
+    unassigned = items_df['barcode'] != items_df['MAX_barcode']
+    reason[~unassigned] = 'canonical'
+    for key_column in duplicate_keys:
+        if key_column not in items_df.columns:
+            continue
+        # The key value is shared with another item of the same product
+        shared = items_df.duplicated(subset=['MAX_barcode', key_column], keep=False) & items_df[key_column].notna()
+        reason[unassigned & shared] = key_column
+        unassigned &= ~shared
+
+    return pd.DataFrame({
+        'source_barcode': items_df['barcode'].values,
+        'canonical_barcode': items_df['MAX_barcode'].values,
+        'reason': pd.Categorical(reason.values),
+    })
+
+
+def alias_versions():
+    # Versions of the alias tables on disk, oldest first
+    if not os.path.isdir(alias_dir):
+        return []
+    return sorted(int(match.group(1)) for match in map(ALIAS_FILE_PATTERN.match, os.listdir(alias_dir)) if match)
+
+
+def alias_file(version):
+    return os.path.join(alias_dir, f'barcode-aliases-v{version}.pkl.gz')
+
+
+def load_alias_table(version=None):
+    # Load the given version of the alias table, the latest by default; returns (version, table)
+    versions = alias_versions()
+    if not versions:
+        raise FileNotFoundError(f"No barcode alias table found in {alias_dir}, run the full cleanup process first.")
+    version = versions[-1] if version is None else version
+    return version, pd.read_pickle(alias_file(version))
+
+
+def save_alias_table(items_df, duplicate_keys=('MODIFIED_SHORT_DESC', 'ar_short_desc')):
+    """Save the alias table of the cleaned items as a new version, unless it equals the latest one. Returns the version."""
+    alias_table = build_alias_table(items_df, duplicate_keys)
+    versions = alias_versions()
+    if versions:
+        latest_version, latest_table = load_alias_table(versions[-1])
+        if latest_table.equals(alias_table):
+            print(f"{Fore.CYAN}Barcode alias table unchanged, still version {latest_version}.\n")
+            return latest_version
+
+    version = versions[-1] + 1 if versions else 1
+    os.makedirs(alias_dir, exist_ok=True)
+    alias_table.to_pickle(alias_file(version), compression='gzip')
+    merged_count = (alias_table['reason'] != 'canonical').sum()
+    print(f"{Fore.GREEN}Barcode alias table version {version} saved to {alias_file(version)} "
+          f"({len(alias_table)} barcodes, {merged_count} merged into another barcode).\n")
+    return version
+
+
+def remap_barcodes(transactions_df, alias_table, not_found_log='Logs/not_found_items.csv'):
+    """
+    Keep the transactions with a known item_barcode and replace it by its canonical barcode.
+    Unknown barcodes are written to not_found_log once each. Returns the remapped transactions.
+    """
+    barcode_to_canonical = pd.Series(alias_table['canonical_barcode'].values, index=alias_table['source_barcode'])
+    found = transactions_df['item_barcode'].isin(barcode_to_canonical.index)
+
+    not_found_items = transactions_df.loc[~found, 'item_barcode'].unique()
+    if len(not_found_items):
+        print(f"{Fore.RED}Total removed transactions that do not exist in items file: {(~found).sum()}\n")
+        with open(not_found_log, 'w', newline='', encoding='utf-8-sig') as log_file:
+            writer = csv.writer(log_file)
+            writer.writerow(['item_barcode'])  # Column header
+            writer.writerows([item] for item in not_found_items)
+
+    transactions_df = transactions_df[found].copy()
+    transactions_df['item_barcode'] = transactions_df['item_barcode'].map(barcode_to_canonical)
+    return transactions_df
+
+
+def read_updated_transactions(updated_transactions_file):
+    # The updated transactions as strings with the missing values of load_csv, so rewriting them gives the output
+    # of a full run, and with the integer category and key ids they were written with
+    columns = pd.read_csv(updated_transactions_file, nrows=0, encoding='utf-8-sig').columns
+    id_columns = [column for column in ['category_id', *KEY_ID_COLUMNS.values()] if column in columns]
+    return pd.read_csv(updated_transactions_file, dtype={column: np.int32 if column in id_columns else str for column in columns},
+                       encoding='utf-8-sig', low_memory=False)
+
+
+def apply_aliases_to_new_transactions(transactions_file, updated_transactions_file):
+    """
+    Apply the latest alias table to the transactions added to transactions_file since the watermark of
+    updated_transactions_file and append them to it. Only the new rows are read, so the cost follows the
+    size of the new batch. Returns the appended transactions, or None when no watermark was recorded yet or
+    transactions_file was rewritten since.
+    """
+    start_time = time.time()
+    watermark = load_watermark(updated_transactions_file)
+    if watermark is None or watermark['input_file'] != transactions_file or not os.path.exists(updated_transactions_file):
+        print(f"{Fore.RED}No watermark recorded for {transactions_file}, run the full cleanup process first.")
+        return None
+    if not appended_since(transactions_file, watermark):
+        print(f"{Fore.RED}{transactions_file} was rewritten since the last run, run the full cleanup process.")
+        return None
+
+    alias_version, alias_table = load_alias_table()
+    # The updated transactions carry the leaf category of their item when the full cleanup process wrote one
+    category_tree = load_category_tree()
+    updated_columns = pd.read_csv(updated_transactions_file, nrows=0, encoding='utf-8-sig').columns
+    with_categories = category_tree is not None and 'category_id' in updated_columns
+    # The same goes for the integer ids of the barcodes and customers
+    key_columns = {column: key for column, key in TRANSACTION_KEY_COLUMNS.items() if KEY_ID_COLUMNS[key] in updated_columns}
+
+    # The alias table changed since the last run, the already updated transactions are moved to the new canonical barcodes
+    if alias_version != watermark['alias_version']:
+        print(f"{Fore.YELLOW}Barcode alias table changed (v{watermark['alias_version']} -> v{alias_version}), "
+              f"remapping {updated_transactions_file}...\n")
+        updated_df = read_updated_transactions(updated_transactions_file)
+        canonical = pd.Series(alias_table['canonical_barcode'].values, index=alias_table['source_barcode'])
+        updated_df['item_barcode'] = updated_df['item_barcode'].map(canonical).fillna(updated_df['item_barcode'])
+        if with_categories:
+            updated_df['category_id'] = category_codes(updated_df['item_barcode'], category_tree)
+        add_key_ids(updated_df, key_columns)
+        updated_df.to_csv(updated_transactions_file, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
+    # Only the rows past the watermark are read
+    new_transactions_df, transactions_bytes = read_new_rows(transactions_file, watermark, dtype=str, low_memory=False)
+    print(f"{Fore.YELLOW}New transactions to apply: {len(new_transactions_df)}\n")
+    watermark = advance_watermark(transactions_file, transactions_bytes, watermark, new_transactions_df,
+                                  alias_version=alias_version)
+
+    # The source barcodes of the alias table are normalized item barcodes
+    new_transactions_df['item_barcode'] = normalize_barcode_values(new_transactions_df['item_barcode'])
+    new_transactions_df = remap_barcodes(new_transactions_df, alias_table)
+    if with_categories:
+        new_transactions_df['category_id'] = category_codes(new_transactions_df['item_barcode'], category_tree)
+    add_key_ids(new_transactions_df, key_columns)
+
+    # Append to the updated transactions, the header and BOM are already in the file
+    new_transactions_df.to_csv(updated_transactions_file, mode='a', header=False, index=False,
+                               quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8')
+
+    save_watermark(updated_transactions_file, watermark)
+    print(f"{Fore.GREEN}Appended {len(new_transactions_df)} transactions to {updated_transactions_file} "
+          f"in {time.time() - start_time:.2f} seconds.{Style.RESET_ALL}")
+    return new_transactions_df
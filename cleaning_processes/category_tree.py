@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style, init
+from correct_category_levels import CATEGORY_LEVELS
+
+init(autoreset=True)
+
+category_tree_file = 'Output/category_tree.pkl.gz'
+
+
+def build_category_tree(items_df):
+    """
+    Dictionary-encode the category hierarchy of the items. Every distinct path level1, level1/level2, ...
+    is a node with an integer id, numbered level by level, so a parent always has a lower id than its
+    children. Returns a dict with:
+      nodes            DataFrame indexed by node_id: parent_id (-1 at level 1), level (1-4) and name
+      ancestors        int32 array, ancestors[node_id, depth] is the node of the path at level depth + 1
+                       (-1 below the level of the node), so rolling up to any level is one lookup
+      item_categories  Series barcode -> leaf node id (the level 4 node) of every item
+    """
+    parent_ids = np.full(len(items_df), -1, dtype=np.int64)  # Node of every item at the level above
+    nodes = []
+    for depth, level in enumerate(CATEGORY_LEVELS, start=1):
+        # A node is a (parent node, name) pair, missing names are a name of their own
+        name_codes, names = pd.factorize(items_df[level], use_na_sentinel=False)
+        node_codes, node_keys = pd.factorize(parent_ids * len(names) + name_codes)
+        first_id = sum(len(level_nodes) for level_nodes in nodes)
+        nodes.append(pd.DataFrame({
+            'parent_id': (node_keys // len(names)).astype(np.int32),
+            'level': np.int8(depth),
+            'name': np.asarray(names, dtype=object)[node_keys % len(names)],
+        }, index=pd.RangeIndex(first_id, first_id + len(node_keys), name='node_id')))
+        parent_ids = first_id + node_codes
+
+    nodes = pd.concat(nodes)
+    item_categories = pd.Series(parent_ids.astype(np.int32), index=items_df['barcode'].to_numpy(), name='category_id')
+    return {'nodes': nodes, 'ancestors': category_ancestors(nodes), 'item_categories': item_categories}
+
+
+def category_ancestors(nodes):
+    # Parents have lower ids, so the ancestors of a level are copied from the finished level above
+    ancestors = np.full((len(nodes), len(CATEGORY_LEVELS)), -1, dtype=np.int32)
+    parent_ids = nodes['parent_id'].to_numpy()
+    levels = nodes['level'].to_numpy()
+    for depth in range(len(CATEGORY_LEVELS)):
+        level_nodes = np.flatnonzero(levels == depth + 1)
+        ancestors[level_nodes, :depth] = ancestors[parent_ids[level_nodes], :depth]
+        ancestors[level_nodes, depth] = level_nodes
+    return ancestors
+
+
+def same_category_tree(category_tree, other_tree):
+    # True when both trees have the same nodes and items, a missing tree equals no other tree
+    if category_tree is None or other_tree is None:
+        return False
+    return (category_tree['nodes'].equals(other_tree['nodes'])
+            and category_tree['item_categories'].equals(other_tree['item_categories']))
+
+
+def category_codes(barcodes, category_tree):
+    # Leaf node id of every barcode, -1 for barcodes that are not in the items
+    item_categories = category_tree['item_categories']
+    item_categories = item_categories[~item_categories.index.duplicated(keep='last')]
+    return barcodes.map(item_categories).fillna(-1).astype(np.int32)
+
+
+def take_known(values, positions, missing):
+    # values[positions], with missing where the position is -1
+    positions = np.asarray(positions, dtype=np.int64)
+    result = np.full(len(positions), missing, dtype=values.dtype)
+    known = positions >= 0
+    result[known] = values[positions[known]]
+    return result
+
+
+def category_rollup(category_ids, category_tree, level):
+    """Node ids at level (1-4) of the given leaf ids, by an array lookup; -1 stays -1."""
+    return take_known(category_tree['ancestors'][:, level - 1], category_ids, -1)
+
+
+def category_names(node_ids, category_tree):
+    # Names of the nodes, NaN for -1
+    return take_known(category_tree['nodes']['name'].to_numpy(dtype=object), node_ids, np.nan)
+
+
+def save_category_tree(items_df, tree_file=category_tree_file):
+    category_tree = build_category_tree(items_df)
+    os.makedirs(os.path.dirname(tree_file) or '.', exist_ok=True)
+    pd.to_pickle(category_tree, tree_file)
+    levels = category_tree['nodes']['level'].value_counts().sort_index()
+    print(f"{Fore.GREEN}Category tree saved to {tree_file} "
+          f"({', '.join(f'{count} level {level}' for level, count in levels.items())} nodes).{Style.RESET_ALL}")
+    return category_tree
+
+
+def load_category_tree(tree_file=category_tree_file):
+    return pd.read_pickle(tree_file) if os.path.exists(tree_file) else None
@@ -1,68 +1,98 @@
+import os
+import numpy as np
 import pandas as pd
 from colorama import Fore, Style, init
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
-def check_transaction_items(transactions_file, items_file):
-    # Load transactions and items data
-    print(f"{Fore.YELLOW}Loading transactions and items files...\n")
-    transactions_df = pd.read_csv(transactions_file, dtype=str, low_memory=False)
-    items_df = pd.read_csv(items_file, dtype=str, low_memory=False)
+def integrity_keys(data, key_column):
+    # The barcodes to check: the key column of a DataFrame, or the keys themselves (barcodes or barcode ids)
+    if isinstance(data, pd.DataFrame):
+        data = data[key_column]
+    return np.asarray(data)
 
-    # Get set of valid barcodes from items file
-    valid_barcodes = set(items_df['barcode'])
+def check_integrity(transactions, items, log_dir=None):
+    """
+    Check the item barcodes of the transactions against the barcodes of the items, in both directions at once.
+    transactions and items are loaded DataFrames (item_barcode and barcode columns) or arrays of keys.
 
-    # Check for item_barcodes in transactions that do not exist in items_file
-    not_found_barcodes = transactions_df[~transactions_df['item_barcode'].isin(valid_barcodes)]['item_barcode'].unique()
-    df = pd.DataFrame(not_found_barcodes, columns=['item_barcode'])
+    One hash index is built over the keys of both sides, every key gets one code and the presence of every
+    code on each side is counted, so both directions come out of the same pass. Returns a dict with:
+      ok                           True when every transaction barcode exists in the items
+      transaction_barcodes         distinct barcodes of the transactions, in order of first appearance
+      missing_in_items             transaction barcodes that are not in the items
+      missing_in_transactions      item barcodes that are not in the transactions
+    With log_dir the not found and the unique transaction barcodes are written to CSV files in that folder.
+    """
+    transaction_keys = integrity_keys(transactions, 'item_barcode')
+    item_keys = integrity_keys(items, 'barcode')
 
-    # Save not found barcodes to CSV
-    df.to_csv('Logs/not_found_barcodes_in_items.csv', index=False)
+    # Missing barcodes are a key of their own, like in a set of the barcodes
+    codes, keys = pd.factorize(np.concatenate([transaction_keys.astype(object), item_keys.astype(object)]),
+                               use_na_sentinel=False)
+    transaction_codes, item_codes = codes[:len(transaction_keys)], codes[len(transaction_keys):]
+    in_transactions = np.bincount(transaction_codes, minlength=len(keys)) > 0
+    in_items = np.bincount(item_codes, minlength=len(keys)) > 0
 
-    # Check for unique barcodes in transactions
-    unique_barcodes_in_transactions = transactions_df['item_barcode'].unique()
+    # The keys of the transactions come first, in order of first appearance, then the keys only found in the items
+    transaction_key_count = int(in_transactions.sum())
+    keys = np.asarray(keys, dtype=object)
+    result = {
+        'transaction_barcodes': keys[:transaction_key_count],
+        'missing_in_items': keys[:transaction_key_count][~in_items[:transaction_key_count]],
+        'missing_in_transactions': keys[transaction_key_count:],
+    }
+    result['ok'] = len(result['missing_in_items']) == 0
 
-    # Save unique barcodes to CSV
-    unique_df = pd.DataFrame(unique_barcodes_in_transactions, columns=['unique_item_barcode'])
-    unique_df.to_csv('Logs/unique_barcodes_in_transactions.csv', index=False)
+    if log_dir:
+        write_integrity_logs(result, log_dir)
+    return result
 
-    # Output results
-    if len(not_found_barcodes) > 0:
-        print(f"{Fore.RED}item_barcodes from transactions do not exist in the items file, Total records: {len(not_found_barcodes)}")
-        return False
-    else:
-        print(f"{Fore.GREEN}All item_barcodes from transactions exist in the items file. Unique Item barcodes in transactions: {len(unique_barcodes_in_transactions)}")
-        return True
-    
-# Example usage
-def check_items_not_in_transactions(transactions_file, items_file):
-    # Load transactions and items data
-    print(f"{Fore.YELLOW}Loading transactions and items files...\n")
-    transactions_df = pd.read_csv(transactions_file, dtype=str, low_memory=False)
-    items_df = pd.read_csv(items_file, dtype=str, low_memory=False)
+def write_integrity_logs(result, log_dir):
+    os.makedirs(log_dir, exist_ok=True)
 
-    # Get set of barcodes in the transactions file
-    transaction_barcodes = set(transactions_df['item_barcode'])
+    # Save not found barcodes to CSV
+    pd.DataFrame(result['missing_in_items'], columns=['item_barcode']).to_csv(
+        os.path.join(log_dir, 'not_found_barcodes_in_items.csv'), index=False)
 
-    # Check for item barcodes in the items file that are not in the transactions file
-    not_found_barcodes_in_transactions = items_df[~items_df['barcode'].isin(transaction_barcodes)]['barcode'].unique()
-    df = pd.DataFrame(not_found_barcodes_in_transactions, columns=['item_barcode'])
+    # Save unique barcodes to CSV
+    pd.DataFrame(result['transaction_barcodes'], columns=['unique_item_barcode']).to_csv(
+        os.path.join(log_dir, 'unique_barcodes_in_transactions.csv'), index=False)
 
-    # Save to CSV
-    #df.to_csv('Logs/not_found_barcodes_in_transactions.csv', index=False)
+def print_transaction_items(result):
+    if not result['ok']:
+        print(f"{Fore.RED}item_barcodes from transactions do not exist in the items file, Total records: {len(result['missing_in_items'])}")
+    else:
+        print(f"{Fore.GREEN}All item_barcodes from transactions exist in the items file. Unique Item barcodes in transactions: {len(result['transaction_barcodes'])}")
 
-    # Output result
-    if len(not_found_barcodes_in_transactions) > 0:
-        print(f"{Fore.YELLOW}Item barcodes from the items file that do not exist in the transactions, Total records: {len(not_found_barcodes_in_transactions)}")
-        
+def print_items_not_in_transactions(result):
+    if len(result['missing_in_transactions']) > 0:
+        print(f"{Fore.YELLOW}Item barcodes from the items file that do not exist in the transactions, Total records: {len(result['missing_in_transactions'])}")
     else:
         print(f"{Fore.GREEN}All item barcodes from the items file are found in the transactions.")
-        
+
+def load_barcodes(transactions_file, items_file):
+    # Load only the barcode columns of the transactions and items data
+    print(f"{Fore.YELLOW}Loading transactions and items files...\n")
+    transactions_df = pd.read_csv(transactions_file, dtype=str, usecols=['item_barcode'], low_memory=False)
+    items_df = pd.read_csv(items_file, dtype=str, usecols=['barcode'], low_memory=False)
+    return transactions_df, items_df
+
+def check_transaction_items(transactions_file, items_file):
+    result = check_integrity(*load_barcodes(transactions_file, items_file), log_dir='Logs')
+    print_transaction_items(result)
+    return result['ok']
+
+def check_items_not_in_transactions(transactions_file, items_file):
+    result = check_integrity(*load_barcodes(transactions_file, items_file))
+    print_items_not_in_transactions(result)
 
 if __name__ == "__main__":
     transactions_file = 'Output/Cleaned_ml_transactions_outbox.csv'  # Path to your transactions file
     items_file = 'Output/Cleaned_ml_items.csv'  # Path to your items file
 
-    check_transaction_items(transactions_file, items_file)
-    check_items_not_in_transactions(transactions_file, items_file)
+    # Both directions are checked on one load of the files
+    result = check_integrity(*load_barcodes(transactions_file, items_file), log_dir='Logs')
+    print_transaction_items(result)
+    print_items_not_in_transactions(result)
@@ -84,13 +84,10 @@ def display_pretty_summary(df_cleaned):
         print(f"{Fore.CYAN}barcode: {Fore.YELLOW}{barcode}")
         print(f"{Fore.MAGENTA}{'-' * 40}")
 
-# Main method for cleaning barcodes
-def clean_barcode(input_file_path, output_file_path):
+# Method for cleaning barcodes of an already loaded DataFrame
+def clean_barcode_df(df):
     print(f"{Fore.YELLOW}Starting the barcode cleaning process...{Style.RESET_ALL}")
 
-    # Step 1: Load the data from the provided input file, forcing 'barcode' to be a string
-    df = pd.read_csv(input_file_path, dtype={'barcode': str})
-
     # Step 2: Remove rows with missing or empty barcodes
     df = remove_null_empty_barcodes(df)
 
@@ -106,6 +103,16 @@ def clean_barcode(input_file_path, output_file_path):
     # Step 6: Display a pretty summary of the cleaned data
     #display_pretty_summary(df_cleaned)
 
+    return df_cleaned
+
+# Main method for cleaning barcodes
+def clean_barcode(input_file_path, output_file_path):
+    # Step 1: Load the data from the provided input file, forcing 'barcode' to be a string
+    df = pd.read_csv(input_file_path, dtype={'barcode': str})
+
+    # Steps 2-6: Remove empty and duplicate barcodes
+    df_cleaned = clean_barcode_df(df)
+
     # Step 7: Save the cleaned data to CSV with quotes around non-numeric fields
     save_csv_with_quotes(df_cleaned, output_file_path)
 
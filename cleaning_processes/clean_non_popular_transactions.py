@@ -1,65 +1,346 @@
+import os
+import sys
+import numpy as np
 import pandas as pd
+from watermark import load_watermark, save_watermark, advance_watermark, appended_since, read_new_rows
 
-def clean_transactions(input_transactions_file, output_transaction_file, non_relevant_items_file):
-    # Load the data from the CSV file
-    df = pd.read_csv(input_transactions_file)
-
-    # Step 1: Remove all transactions for customers who have <= 5 unique invoice_ids
-    invoice_count_per_customer = df.groupby('customer_barcode')['invoice_id'].nunique()
-    customers_with_few_invoices = invoice_count_per_customer[invoice_count_per_customer <= 5].index
-    step1_removed = df[df['customer_barcode'].isin(customers_with_few_invoices)].shape[0]
-    df = df[df['customer_barcode'].apply(lambda x: x not in customers_with_few_invoices)]
-    print(f"Step 1 - Removed {step1_removed} transactions for customers with <= 5 invoice_ids")
-
-    # Step 2: Remove all transactions for customers who have <= 10 total transactions
-    transaction_count_per_customer = df['customer_barcode'].value_counts()
-    customers_with_few_transactions = transaction_count_per_customer[transaction_count_per_customer <= 10].index
-    step2_removed = df[df['customer_barcode'].isin(customers_with_few_transactions)].shape[0]
-    df = df[df['customer_barcode'].apply(lambda x: x not in customers_with_few_transactions)]
-    print(f"Step 2 - Removed {step2_removed} transactions for customers with <= 10 total transactions")
-    
-    # Step 3: Remove all transactions for customers who interact with <= 5 unique items
-    unique_items_per_customer = df.groupby('customer_barcode')['item_barcode'].nunique()
-    customers_with_few_unique_items = unique_items_per_customer[unique_items_per_customer <= 5].index
-    step3_removed = df[df['customer_barcode'].isin(customers_with_few_unique_items)].shape[0]
-    df = df[df['customer_barcode'].apply(lambda x: x not in customers_with_few_unique_items)]
-    print(f"Step 3 - Removed {step3_removed} transactions for customers interacting with <= 5 unique items")
-    
-    # Step 4: Remove all barcodes that are used <= 5 times
-    barcode_count = df['item_barcode'].value_counts()
-    non_relevant_barcodes = barcode_count[barcode_count <= 5].index
-    step4_removed = df[df['item_barcode'].isin(non_relevant_barcodes)].shape[0]
-    
+# Transactions are removed for customers with <= invoices unique invoice_ids, <= transactions transactions or
+# <= unique_items unique items, and for barcodes used <= barcode_uses times
+THRESHOLDS = {'invoices': 5, 'transactions': 10, 'unique_items': 5, 'barcode_uses': 5}
+
+def encode_transactions(df):
+    # Integer codes of the customers, invoices and items, -1 for missing values
+    customers, customer_values = pd.factorize(df['customer_barcode'])
+    invoices, invoice_values = pd.factorize(df['invoice_id'])
+    items, item_values = pd.factorize(df['item_barcode'])
+    return (customers, customer_values), (invoices, invoice_values), (items, item_values)
+
+def encode_pairs(customers, values, value_count):
+    # Codes of the distinct (customer, value) pairs of every row and the customer of every pair, -1 when one is missing
+    combined = customers.astype(np.int64) * (value_count + 1) + values
+    has_pair = (customers >= 0) & (values >= 0)
+    pairs = np.full(len(customers), -1, dtype=np.int64)
+    unique_pairs, pairs[has_pair] = np.unique(combined[has_pair], return_inverse=True)
+    return pairs, unique_pairs // (value_count + 1), unique_pairs % (value_count + 1)
+
+def distinct_per_customer(pairs, pair_customers, alive, customer_count, base_pairs, base_counts):
+    # Distinct values per customer among the alive rows, on top of the base counts (pairs already in the base are not counted twice)
+    pair_alive = np.bincount(pairs[alive & (pairs >= 0)], minlength=len(pair_customers)) > 0
+    return base_counts + np.bincount(pair_customers[pair_alive & ~base_pairs], minlength=customer_count)
+
+def pruning_arrays(customers, invoices, items):
+    # Integer arrays the pruning works on, computed once per set of transactions
+    customer_count, item_count = customers.max(initial=-1) + 1, items.max(initial=-1) + 1
+    invoice_pairs, invoice_pair_customers, _ = encode_pairs(customers, invoices, invoices.max(initial=-1) + 1)
+    item_pairs, item_pair_customers, _ = encode_pairs(customers, items, item_count)
+    return {
+        'customers': customers, 'items': items,
+        'customer_count': customer_count, 'item_count': item_count,
+        'has_customer': customers >= 0, 'has_item': items >= 0,
+        'customer_rows': np.maximum(customers, 0), 'item_rows': np.maximum(items, 0),
+        'invoice_pairs': invoice_pairs, 'invoice_pair_customers': invoice_pair_customers,
+        'item_pairs': item_pairs, 'item_pair_customers': item_pair_customers,
+    }
+
+def prune_transactions(customers, invoices, items, thresholds=THRESHOLDS, base=None):
+    """
+    Remove the transactions of customers and barcodes under the thresholds until every remaining customer and
+    barcode is above them (a k-core), the four steps run in order in every iteration.
+
+    customers, invoices and items are integer codes of every row (-1 for missing values, which are never removed).
+    base holds the counts of rows that are already known to stay (see clean_transactions_incremental): per customer
+    'transactions', 'invoices' and 'unique_items', per barcode 'barcode_uses', and per pair 'invoice_pairs' and
+    'item_pairs' telling whether the pair is already among those rows.
+    Returns the mask of remaining rows, the rows removed per step and the codes of the barcodes removed in step 4.
+    """
+    return prune_arrays(pruning_arrays(customers, invoices, items), thresholds, base)
+
+def prune_arrays(arrays, thresholds=THRESHOLDS, base=None, alive=None, verbose=True):
+    # The pruning loop of prune_transactions, starting from the rows in alive (all rows by default)
+    customers, items = arrays['customers'], arrays['items']
+    customer_count, item_count = arrays['customer_count'], arrays['item_count']
+    has_customer, has_item = arrays['has_customer'], arrays['has_item']
+    if base is None:
+        base = {
+            'transactions': np.zeros(customer_count, dtype=np.int64),
+            'invoices': np.zeros(customer_count, dtype=np.int64),
+            'unique_items': np.zeros(customer_count, dtype=np.int64),
+            'barcode_uses': np.zeros(item_count, dtype=np.int64),
+            'invoice_pairs': np.zeros(len(arrays['invoice_pair_customers']), dtype=bool),
+            'item_pairs': np.zeros(len(arrays['item_pair_customers']), dtype=bool),
+        }
+
+    alive = np.ones(len(customers), dtype=bool) if alive is None else alive.copy()
+    removed = dict.fromkeys(THRESHOLDS, 0)
+    removed_barcodes = []
+
+    def remove_customers(step, counts):
+        nonlocal alive
+        removing = alive & has_customer & (counts <= thresholds[step])[arrays['customer_rows']]
+        removed[step] += iteration_removed.setdefault(step, int(removing.sum()))
+        alive &= ~removing
+
+    iteration = 0
+    while True:
+        iteration += 1
+        iteration_removed = {}
+
+        # Step 1: customers with few unique invoice_ids
+        remove_customers('invoices', distinct_per_customer(arrays['invoice_pairs'], arrays['invoice_pair_customers'], alive,
+                                                           customer_count, base['invoice_pairs'], base['invoices']))
+        # Step 2: customers with few transactions
+        remove_customers('transactions', base['transactions'] + np.bincount(customers[alive & has_customer], minlength=customer_count))
+        # Step 3: customers with few unique items
+        remove_customers('unique_items', distinct_per_customer(arrays['item_pairs'], arrays['item_pair_customers'], alive,
+                                                               customer_count, base['item_pairs'], base['unique_items']))
+
+        # Step 4: barcodes used few times
+        alive_uses = np.bincount(items[alive & has_item], minlength=item_count)
+        non_relevant = (alive_uses > 0) & (base['barcode_uses'] + alive_uses <= thresholds['barcode_uses'])
+        removed_barcodes.extend(np.flatnonzero(non_relevant).tolist())
+        removing = alive & has_item & non_relevant[arrays['item_rows']]
+        removed['barcode_uses'] += iteration_removed.setdefault('barcode_uses', int(removing.sum()))
+        alive &= ~removing
+
+        if verbose:
+            print(f"Iteration {iteration} - Removed {iteration_removed['invoices']} / {iteration_removed['transactions']} / "
+                  f"{iteration_removed['unique_items']} / {iteration_removed['barcode_uses']} transactions in steps 1-4")
+        if not any(iteration_removed.values()):
+            break
+
+    return alive, removed, removed_barcodes
+
+def sweep_thresholds(df, grid):
+    """
+    Surviving customers, items and transactions for every threshold combination of grid, without filtering df.
+
+    grid is a list of threshold dicts like THRESHOLDS, or a dict of lists (e.g. {'invoices': [3, 5, 8]}) whose
+    combinations are swept, missing keys keep the default threshold. The transactions are encoded once. A
+    combination starts from the k-core of an already swept combination with lower or equal thresholds, which
+    contains its own k-core, so each combination only prunes what the looser one kept.
+    Returns a DataFrame with the thresholds and surviving_customers, surviving_items and surviving_transactions
+    of every combination, in the order of grid.
+    """
+    if isinstance(grid, dict):
+        combinations = pd.MultiIndex.from_product([grid.get(step, [THRESHOLDS[step]]) for step in THRESHOLDS],
+                                                  names=list(THRESHOLDS)).to_frame(index=False)
+        grid = combinations.to_dict('records')
+
+    (customers, _), (invoices, _), (items, _) = encode_transactions(df)
+    arrays = pruning_arrays(customers, invoices, items)
+
+    grid = [{**THRESHOLDS, **thresholds} for thresholds in grid]
+    cores = []
+    results = [None] * len(grid)
+    # Looser combinations first, so the stricter ones can start from their k-cores
+    for position in sorted(range(len(grid)), key=lambda position: sum(grid[position].values())):
+        thresholds = grid[position]
+        looser = [(alive, alive_count) for swept, alive, alive_count in cores
+                  if all(swept[step] <= thresholds[step] for step in THRESHOLDS)]
+        start = min(looser, key=lambda core: core[1])[0] if looser else None
+
+        alive, _, _ = prune_arrays(arrays, thresholds, alive=start, verbose=False)
+        alive_count = int(alive.sum())
+        cores.append((thresholds, alive, alive_count))
+        results[position] = {
+            **thresholds,
+            'surviving_customers': len(np.unique(customers[alive & arrays['has_customer']])),
+            'surviving_items': len(np.unique(items[alive & arrays['has_item']])),
+            'surviving_transactions': alive_count,
+        }
+
+    return pd.DataFrame(results, columns=list(THRESHOLDS) + ['surviving_customers', 'surviving_items', 'surviving_transactions'])
+
+def pruning_summary(removed, remaining):
+    return {
+        "Step 1 - Removed for <=5 invoice_ids": removed['invoices'],
+        "Step 2 - Removed for <=10 transactions": removed['transactions'],
+        "Step 3 - Removed for <=5 unique items": removed['unique_items'],
+        "Step 4 - Removed barcodes used <= 5 times": removed['barcode_uses'],
+        "Remaining records": remaining
+    }
+
+def print_pruning_summary(removed, thresholds=THRESHOLDS):
+    print(f"Step 1 - Removed {removed['invoices']} transactions for customers with <= {thresholds['invoices']} invoice_ids")
+    print(f"Step 2 - Removed {removed['transactions']} transactions for customers with <= {thresholds['transactions']} total transactions")
+    print(f"Step 3 - Removed {removed['unique_items']} transactions for customers interacting with <= {thresholds['unique_items']} unique items")
+    print(f"Step 4 - Removed {removed['barcode_uses']} transactions for barcodes used <= {thresholds['barcode_uses']} times")
+
+def write_non_relevant_items(barcodes, non_relevant_items_file):
     # Save the non-relevant barcodes to a text file
     with open(non_relevant_items_file, 'w') as f:
-        for barcode in non_relevant_barcodes:
+        for barcode in barcodes:
             f.write(f"{barcode}\n")
-    
-    # Filter out non-relevant barcodes
-    df = df[df['item_barcode'].apply(lambda x: x not in non_relevant_barcodes)]
-    print(f"Step 4 - Removed {step4_removed} transactions for barcodes used <= 5 times")
+
+def clean_transactions_df(df, non_relevant_items_file, thresholds=THRESHOLDS):
+    (customers, _), (invoices, _), (items, item_values) = encode_transactions(df)
+    alive, removed, removed_barcodes = prune_transactions(customers, invoices, items, thresholds)
+    print_pruning_summary(removed, thresholds)
+
+    write_non_relevant_items(item_values[removed_barcodes], non_relevant_items_file)
+
+    df = df[alive]
+    # Show total removed records and summary after each step
+    return df, pruning_summary(removed, df.shape[0])
+
+def clean_transactions(input_transactions_file, output_transaction_file, non_relevant_items_file):
+    # Load the data from the CSV file
+    df = pd.read_csv(input_transactions_file, dtype=str, low_memory=False)
+
+    df, summary = clean_transactions_df(df, non_relevant_items_file)
 
     # Save the cleaned data to a new CSV file
     df.to_csv(output_transaction_file, index=False)
-    
-    # Show total removed records and summary after each step
-    summary = {
-        "Step 1 - Removed for <=5 invoice_ids": step1_removed,
-        "Step 2 - Removed for <=10 transactions": step2_removed,
-        "Step 3 - Removed for <=5 unique items": step3_removed,
-        "Step 4 - Removed barcodes used <= 5 times": step4_removed,
-        "Remaining records": df.shape[0]
-    }
 
     return summary
 
+# Incremental mode: the transactions file only grows, and adding transactions can only grow the k-core, so the rows
+# in the output stay there. Only the pending rows (not in the output yet) linked to the new rows are pruned again, with
+# the counts of the output rows as the base. The state keeps the distinct (customer, invoice) and (customer, item)
+# pairs and the per-customer and per-barcode counts of the output rows, and the pending rows indexed by their row
+# number in the input file.
+def state_file(output_transaction_file):
+    return f'{output_transaction_file}.state.pkl'
+
+def core_state(core_df, pending_df, state=None):
+    # Add the rows that joined the k-core to the state
+    core_df = core_df[['customer_barcode', 'invoice_id', 'item_barcode']]
+    if state is None:
+        state = {
+            'invoice_pairs': pd.DataFrame(columns=['customer_barcode', 'invoice_id']),
+            'item_pairs': pd.DataFrame(columns=['customer_barcode', 'item_barcode']),
+            'customer_transactions': pd.Series(dtype=np.int64),
+            'barcode_uses': pd.Series(dtype=np.int64),
+            'output_rows': 0,
+        }
+    state['invoice_pairs'] = pd.concat([state['invoice_pairs'], core_df[['customer_barcode', 'invoice_id']].dropna()]).drop_duplicates()
+    state['item_pairs'] = pd.concat([state['item_pairs'], core_df[['customer_barcode', 'item_barcode']].dropna()]).drop_duplicates()
+    state['customer_transactions'] = state['customer_transactions'].add(core_df['customer_barcode'].value_counts(), fill_value=0).astype(np.int64)
+    state['barcode_uses'] = state['barcode_uses'].add(core_df['item_barcode'].value_counts(), fill_value=0).astype(np.int64)
+    state['output_rows'] += len(core_df)
+    state['pending'] = pending_df
+    return state
+
+def pair_base(pairs_df, customer_values, values, pair_customers, pair_values):
+    # Which pairs of the rows are already among the output rows, and the number of those pairs per customer
+    in_base = pd.MultiIndex.from_arrays([customer_values[pair_customers], values[pair_values]]).isin(
+        pd.MultiIndex.from_frame(pairs_df))
+    base_counts = pairs_df.iloc[:, 0].value_counts().reindex(customer_values, fill_value=0).to_numpy(np.int64)
+    return in_base, base_counts
+
+def settled_keys(state, thresholds=THRESHOLDS):
+    # Customers and barcodes that pass their thresholds on the output rows alone, and so in every later run
+    invoices = state['invoice_pairs']['customer_barcode'].value_counts()
+    unique_items = state['item_pairs']['customer_barcode'].value_counts()
+    customers = state['customer_transactions'].index[state['customer_transactions'] > thresholds['transactions']]
+    customers = customers.intersection(invoices.index[invoices > thresholds['invoices']])
+    customers = customers.intersection(unique_items.index[unique_items > thresholds['unique_items']])
+    barcodes = state['barcode_uses'].index[state['barcode_uses'] > thresholds['barcode_uses']]
+    return customers, barcodes
+
+def linked_pending(pending_df, new_df, state):
+    """
+    Mask of the pending rows whose pruning can change with the new rows: the rows linked to them through customers
+    and barcodes that are not settled yet. A settled customer or barcode never removes a row again, so it does not
+    link rows. The counts of the other pending rows are the ones they were last pruned with, so they stay pending.
+    """
+    settled_customers, settled_barcodes = settled_keys(state)
+    pending_customers = pending_df['customer_barcode'].where(~pending_df['customer_barcode'].isin(settled_customers))
+    pending_barcodes = pending_df['item_barcode'].where(~pending_df['item_barcode'].isin(settled_barcodes))
+    customers = new_df['customer_barcode'].dropna().unique()
+    barcodes = new_df['item_barcode'].dropna().unique()
+
+    linked = np.zeros(len(pending_df), dtype=bool)
+    while True:
+        now_linked = (pending_customers.isin(customers) | pending_barcodes.isin(barcodes)).to_numpy()
+        if (now_linked == linked).all():
+            return linked
+        added = now_linked & ~linked
+        customers = np.union1d(customers, pending_customers[added].dropna().unique())
+        barcodes = np.union1d(barcodes, pending_barcodes[added].dropna().unique())
+        linked = now_linked
+
+def rebuild_incremental_state(input_transactions_file, output_transaction_file, non_relevant_items_file):
+    # Full run that also records the watermark and the state for the next incremental runs
+    file_bytes = os.path.getsize(input_transactions_file)
+    df = pd.read_csv(input_transactions_file, dtype=str, low_memory=False)
+    watermark = advance_watermark(input_transactions_file, file_bytes, None, df)
+
+    cleaned_df, summary = clean_transactions_df(df, non_relevant_items_file)
+    cleaned_df.to_csv(output_transaction_file, index=False)
+
+    pd.to_pickle(core_state(cleaned_df, df[~df.index.isin(cleaned_df.index)]), state_file(output_transaction_file))
+    save_watermark(output_transaction_file, watermark)
+    return summary
+
+def clean_transactions_incremental(input_transactions_file, output_transaction_file, non_relevant_items_file):
+    """
+    Clean only the transactions added to input_transactions_file since the last run and append the ones that
+    join the k-core to output_transaction_file, together with the earlier pending rows that join it now.
+    Only the pending rows linked to the new rows (see linked_pending) are pruned again, so the pruning follows the
+    new batch and what it touches; the pending rows are still scanned for the link and saved with the state.
+    Falls back to a full run when there is no state yet or the input file was rewritten.
+    Returns the same summary as clean_transactions, the removals counting the pruned rows that stay pending.
+    """
+    watermark = load_watermark(output_transaction_file)
+    if (watermark is None or not os.path.exists(state_file(output_transaction_file))
+            or watermark['input_file'] != input_transactions_file or not appended_since(input_transactions_file, watermark)):
+        print("No incremental state for the input file, running the full cleaning")
+        return rebuild_incremental_state(input_transactions_file, output_transaction_file, non_relevant_items_file)
+
+    state = pd.read_pickle(state_file(output_transaction_file))
+    new_df, file_bytes = read_new_rows(input_transactions_file, watermark, dtype=str, low_memory=False)
+    # The rows are indexed by their row number in the input file, the pending rows keep the input order
+    new_df.index = pd.RangeIndex(watermark['rows'], watermark['rows'] + len(new_df))
+    watermark = advance_watermark(input_transactions_file, file_bytes, watermark, new_df)
+    linked = linked_pending(state['pending'], new_df, state)
+    print(f"New transactions: {len(new_df)}, pending transactions: {len(state['pending'])} ({linked.sum()} linked to the new ones)")
+
+    # Prune the linked pending and new rows on top of the counts of the output rows
+    candidates = pd.concat([state['pending'][linked], new_df]).sort_index(kind='stable')
+    (customers, customer_values), (invoices, invoice_values), (items, item_values) = encode_transactions(candidates)
+    _, invoice_pair_customers, invoice_pair_values = encode_pairs(customers, invoices, invoices.max(initial=-1) + 1)
+    _, item_pair_customers, item_pair_values = encode_pairs(customers, items, items.max(initial=-1) + 1)
+    base = {
+        'transactions': state['customer_transactions'].reindex(customer_values, fill_value=0).to_numpy(np.int64),
+        'barcode_uses': state['barcode_uses'].reindex(item_values, fill_value=0).to_numpy(np.int64),
+    }
+    base['invoice_pairs'], base['invoices'] = pair_base(state['invoice_pairs'], customer_values, invoice_values,
+                                                        invoice_pair_customers, invoice_pair_values)
+    base['item_pairs'], base['unique_items'] = pair_base(state['item_pairs'], customer_values, item_values,
+                                                         item_pair_customers, item_pair_values)
+    alive, removed, removed_barcodes = prune_transactions(customers, invoices, items, THRESHOLDS, base)
+    print_pruning_summary(removed)
+
+    # Rows that joined the k-core are appended to the output, the others stay pending
+    candidates[alive].to_csv(output_transaction_file, mode='a', header=False, index=False)
+    state = core_state(candidates[alive], pd.concat([state['pending'][~linked], candidates[~alive]]).sort_index(kind='stable'), state)
+
+    write_non_relevant_items(item_values[removed_barcodes], non_relevant_items_file)
+    pd.to_pickle(state, state_file(output_transaction_file))
+    save_watermark(output_transaction_file, watermark)
+    print(f"Appended {alive.sum()} transactions to {output_transaction_file}")
+    return pruning_summary(removed, state['output_rows'])
+
 
 if(__name__ == '__main__'):
     # Run the cleaning function
     input_file = 'Output/Cleaned_ml_transactions_outbox.csv'
     output_file = 'Output/Cleaned_ml_transactions_outbox_non_relevant.csv'
     non_relevant_items_file = 'Logs/non_relevant_barcodes.txt'
-    summary = clean_transactions(input_file, output_file, non_relevant_items_file)
+    # --sweep prints the surviving counts for a grid of thresholds around the defaults, without saving anything
+    if '--sweep' in sys.argv:
+        sweep = sweep_thresholds(pd.read_csv(input_file, dtype=str, low_memory=False), {
+            'invoices': [3, 5, 8], 'transactions': [5, 10, 20], 'unique_items': [3, 5, 8], 'barcode_uses': [3, 5, 10],
+        })
+        print(sweep.to_string(index=False))
+        sys.exit()
+
+    # --incremental only processes the transactions added since the last run
+    if '--incremental' in sys.argv:
+        summary = clean_transactions_incremental(input_file, output_file, non_relevant_items_file)
+    else:
+        summary = clean_transactions(input_file, output_file, non_relevant_items_file)
 
     # Print the summary of the cleanup process
     print("Summary of cleaning process:")
@@ -69,4 +350,3 @@ if(__name__ == '__main__'):
     print(f"Cleaned transactions saved to: {output_file}")
     print(f"Non-relevant items saved to: {non_relevant_items_file}")
     print("Cleaning process completed")
-
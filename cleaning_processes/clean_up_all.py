@@ -1,41 +1,112 @@
 import os
-from delete_incorrect_products import delete_incorrect_products
-from trim_spaces_commas import trim_spaces_commas
+import sys
+import csv
+import time
+import pandas as pd
+from collections import Counter
+from delete_incorrect_products import delete_incorrect_products_df, open_deleted_items_log, delete_temp_rows, print_deleted_total
+from delete_incorrect_products import log_file_path as deleted_items_log_file
+from trim_spaces_commas import trim_spaces_commas_df, trim_text_columns, print_changes
+from normalize_barcodes import normalize_barcodes_df, normalize_barcode_values, normalize_barcodes_chunk, print_barcode_counts
+from normalize_barcodes import log_file_path as invalid_barcodes_log_file
 from colorama import Fore, Style, init
-from correct_product_description import correct_product_description
-from check_duplicates_modified_desc import run_duplication_checks
-from clean_barcode import clean_barcode
-from correct_category_levels import correct_category_levels
+from correct_product_description import correct_product_description_df
+from check_duplicates_modified_desc import run_duplication_checks_df
+from cluster_duplicates import cluster_duplicates_df
+from near_duplicates import near_duplicates_df
+from clean_barcode import clean_barcode_df
+from correct_category_levels import correct_category_levels_df
 #from translate_missing_english_fields import translate_missing_english_fields  # Import translation function
-from update_transactions_and_deduplicated_items import update_transactions  # Import transaction update function
-from check_transactions import check_transaction_items  # Import transaction check function
+from update_transactions_and_deduplicated_items import update_transactions_df  # Import transaction update function
+from barcode_aliases import save_alias_table, apply_aliases_to_new_transactions, read_updated_transactions
+from category_tree import save_category_tree, load_category_tree, same_category_tree, category_codes
+from surrogate_keys import add_key_ids, ITEM_KEY_COLUMNS, TRANSACTION_KEY_COLUMNS
+from watermark import load_watermark, save_watermark, advance_watermark, appended_since, read_new_rows
+from pipeline import load_csv, save_csv, run_stages, read_csv_chunks, write_csv_chunks, append_csv_log, restore_csv_missing_values  # Import the in-memory stage runner
+from check_transactions import check_integrity, print_transaction_items  # Import transaction check function
 
     # Define file paths for input and output at each stage
 input_file_path = 'Data/ml_items.csv'   # Original Excel file
 trimmed_output_file = 'Output/Trimmed_ml_items.csv'  # CSV after trimming
+normalized_barcodes_file = 'Output/Normalized_Barcodes_ml_items.csv'  # CSV after barcode normalization
 #cleaned_descriptions_file = 'Output/cleaned_product_descriptions.csv'  # CSV after description cleanup
 delete_incorrect_products_file = 'Output/Cleaned_ml_items_no_temp.csv'  # Log file for deleted products
 correct_product_description_file = 'Output/Cleaned_Desc_ml_items.csv'  # Corrected product description
 check_duplicates_modified_desc_file = 'Output/Cleaned_Duplicates_ml_items.csv'  # Duplicates file
+cluster_duplicates_file = 'Output/Cleaned_Clusters_ml_items.csv'  # Duplicate clusters file
+near_duplicates_file = 'Output/Cleaned_Near_Duplicates_ml_items.csv'  # Near-duplicates file
 transactions_file = 'Data/ml_transactions_outbox.csv'  # Updated transactions file
 transactions_updated_file = 'Output/Cleaned_ml_transactions_outbox.csv'  # Updated transactions file    
 correct_category_levels_file = 'Output/Cleaned_Category_ml_items.csv'  # Corrected category levels
 #final_cleaned_empty_barcode_file = 'Output/Cleaned_Empty_Barcode_ml_items.csv'  # Final CSV after barcode cleaning
 cleaned_with_max_barcode_file = 'Output/Cleaned_Max_Barcode_ml_items.csv'  # Final CSV after barcode cleaning
 final_cleaned_output_file = 'Output/Cleaned_ml_items.csv'  # Final CSV after barcode cleaning
+streamed_items_file = 'Output/Streamed_ml_items.csv'  # CSV after the streamed row-local stages (--chunksize)
+
+# Cached output of every item cleaning stage, reused on reruns while the stage input is unchanged
+stage_cache_dir = 'Cache/stages'
+# Per-row content hashes next to the output rows of the row-local stages, only new or changed rows are processed again
+row_cache_dir = 'Cache/rows'
+row_local_stages = ['trim_spaces_commas', 'correct_product_description']
+
+# Items with equal values in any of these columns are merged into one product, also transitively
+duplicate_keys = ['MODIFIED_SHORT_DESC', 'ar_short_desc']
 
 #Logs
 log_file_path = 'Logs/missing_or_corrected_category_levels.csv'  # Log file for missing or corrected category levels
+near_duplicate_candidates_file = 'Logs/near_duplicate_candidates.csv'  # Near-duplicate pairs for review
+
+# Item cleaning stages, run in this order with the DataFrame passed between them in memory
+# workers > 1 splits the row-local description stage over that many processes
+# near_duplicates is None (off), 'report' (write the candidate pairs) or 'merge' (also merge them into the clusters)
+# with row_cache_dir the row-local stages reuse the output rows of their previous run, the other stages see all rows
+def item_cleaning_stages(workers=1, near_duplicates=None, row_cache_dir=None):
+    stages = [
+        ('trim_spaces_commas', trim_spaces_commas_df, {}),
+        ('normalize_barcodes', normalize_barcodes_df, {}),
+        ('delete_incorrect_products', delete_incorrect_products_df, {}),
+        ('correct_product_description', correct_product_description_df, {'workers': workers}),
+        ('run_duplication_checks', run_duplication_checks_df, {}),
+        ('cluster_duplicates', cluster_duplicates_df, {'duplicate_keys': duplicate_keys}),
+        ('correct_category_levels', correct_category_levels_df, {'log_file_path': log_file_path}),
+        ('clean_barcode', clean_barcode_df, {}),
+    ]
+    if near_duplicates:
+        stages.insert(6, ('near_duplicates', near_duplicates_df, {'candidates_file': near_duplicate_candidates_file,
+                                                                  'merge': near_duplicates == 'merge'}))
+    if row_cache_dir:
+        for stage_name, _, params in stages:
+            if stage_name in row_local_stages:
+                params['row_cache'] = os.path.join(row_cache_dir, f'{stage_name}.pkl')
+    return stages
+
+# Log files written by the item cleaning stages, the stage cache keeps them with the output of their stage
+stage_logs = {
+    'normalize_barcodes': [invalid_barcodes_log_file],
+    'delete_incorrect_products': [deleted_items_log_file],
+    'near_duplicates': [near_duplicate_candidates_file],
+    'correct_category_levels': [log_file_path],
+}
+
+# Intermediate results are only written when requested for debugging (--keep-intermediate)
+intermediate_files = {
+    'trim_spaces_commas': trimmed_output_file,
+    'normalize_barcodes': normalized_barcodes_file,
+    'delete_incorrect_products': delete_incorrect_products_file,
+    'correct_product_description': correct_product_description_file,
+    'run_duplication_checks': check_duplicates_modified_desc_file,
+    'cluster_duplicates': cluster_duplicates_file,
+    'near_duplicates': near_duplicates_file,
+    'correct_category_levels': correct_category_levels_file,
+}
 
 # create a function to delete intermediate files
 def delete_intermediate_files():
 
     print(f"{Fore.YELLOW}Cleaning up intermediate files...")
-    os.remove(trimmed_output_file)
-    os.remove(delete_incorrect_products_file)
-    os.remove(correct_product_description_file)
-    os.remove(check_duplicates_modified_desc_file)    
-    os.remove(correct_category_levels_file)
+    for intermediate_file in [*intermediate_files.values(), streamed_items_file]:
+        if os.path.exists(intermediate_file):
+            os.remove(intermediate_file)
     
 
 def delete_logs_files():
@@ -43,8 +114,119 @@ def delete_logs_files():
      for file in os.listdir('Logs'):
             os.remove(f'Logs/{file}')    
 
+# The first item cleaning stages, run on chunks of the input file in streaming mode (--chunksize)
+streamed_stages = ['trim_spaces_commas', 'normalize_barcodes', 'delete_incorrect_products']
+
+# Run the streamed stages on chunksize rows at a time, from the input file to output_file_path, so their memory is
+# bounded by the chunk size; between the stages every chunk gets the missing values of a CSV write and re-read
+def stream_items(input_file_path, output_file_path, chunksize):
+    print(f"{Fore.YELLOW}Streaming {', '.join(streamed_stages)} in chunks of {chunksize} rows...{Style.RESET_ALL}")
+    changes, changed_barcodes, barcode_type_counts, total_deleted = Counter(), 0, 0, 0
+    invalid_barcodes_log = None
+    with open_deleted_items_log() as deleted_items_log:
+        try:
+            def cleaned_chunks():
+                nonlocal changed_barcodes, barcode_type_counts, total_deleted, invalid_barcodes_log
+                for chunk in read_csv_chunks(input_file_path, chunksize, low_memory=False):
+                    chunk, chunk_changes = trim_text_columns(chunk)
+                    changes.update(chunk_changes)
+                    chunk, chunk_changed, chunk_type_counts, invalid = normalize_barcodes_chunk(restore_csv_missing_values(chunk))
+                    changed_barcodes += chunk_changed
+                    barcode_type_counts = chunk_type_counts + barcode_type_counts
+                    invalid_barcodes_log = append_csv_log(invalid_barcodes_log, invalid, invalid_barcodes_log_file)
+                    chunk, chunk_deleted = delete_temp_rows(restore_csv_missing_values(chunk), deleted_items_log)
+                    total_deleted += chunk_deleted
+                    yield chunk
+
+            write_csv_chunks(cleaned_chunks(), output_file_path)
+        finally:
+            if invalid_barcodes_log is not None:
+                invalid_barcodes_log.close()
+    print_changes(changes)
+    print_barcode_counts(changed_barcodes, barcode_type_counts)
+    print_deleted_total(total_deleted)
+
+# Run the item cleaning stages in memory, skipping the stages whose input did not change since the last run
+# with chunksize the streamed stages run on chunks of the input file first, the other stages need all rows at once
+# and run in memory on their output
+def clean_items(keep_intermediate_files=False, use_cache=True, workers=1, near_duplicates=None, chunksize=None):
+    stages = item_cleaning_stages(workers, near_duplicates, row_cache_dir if use_cache else None)
+    if chunksize:
+        stream_items(input_file_path, streamed_items_file, chunksize)
+        items_df = load_csv(streamed_items_file)
+        stages = [stage for stage in stages if stage[0] not in streamed_stages]
+    else:
+        items_df = load_csv(input_file_path)
+    items_df = run_stages(items_df, stages,
+                          intermediate_files if keep_intermediate_files else None,
+                          stage_cache_dir if use_cache else None, stage_logs)
+
+    # the max barcode file is kept for reference and debugging
+    save_csv(items_df, cleaned_with_max_barcode_file)
+    return items_df
+
+# Update transactions with the max barcode and deduplicate the items
+# incremental: only the transactions added since the watermark of the last run are read and appended, while the
+# barcode aliases are unchanged; returns the transactions processed in this run and the deduplicated items
+def update_transactions_with_items(items_df, incremental=True):
+    start_time = time.time()
+    # keep the barcode aliases and the watermark of the processed transactions, for the new transactions option
+    alias_version = save_alias_table(items_df, duplicate_keys)
+    previous_category_tree = load_category_tree()
+
+    watermark = load_watermark(transactions_updated_file) if incremental else None
+    if watermark is not None and (watermark['input_file'] != transactions_file
+                                  or not os.path.exists(transactions_updated_file)
+                                  or watermark.get('alias_version') != alias_version
+                                  or not appended_since(transactions_file, watermark)):
+        print(f"{Fore.YELLOW}Barcode aliases or transactions file changed since the last run, updating all transactions...\n")
+        watermark = None
+
+    if watermark is None:
+        transactions_bytes = os.path.getsize(transactions_file)
+        transactions_df = pd.read_csv(transactions_file, dtype=str, low_memory=False)
+    else:
+        # Only the rows past the watermark are read
+        transactions_df, transactions_bytes = read_new_rows(transactions_file, watermark, dtype=str, low_memory=False)
+        print(f"{Fore.YELLOW}New transactions to update: {len(transactions_df)}\n")
+    new_watermark = advance_watermark(transactions_file, transactions_bytes, watermark, transactions_df,
+                                      alias_version=alias_version)
+
+    # the item barcodes were normalized by the cleaning stages, the transaction barcodes are normalized the same way
+    transactions_df['item_barcode'] = normalize_barcode_values(transactions_df['item_barcode'])
+    transactions_df, deduplicated_items = update_transactions_df(transactions_df, items_df)
+    # the category hierarchy is kept as a tree of integer nodes, transactions carry only the leaf node of their item
+    category_tree = save_category_tree(deduplicated_items)
+    transactions_df['category_id'] = category_codes(transactions_df['item_barcode'], category_tree)
+    # stable integer ids of the barcodes, item numbers and customers, the items get theirs first
+    add_key_ids(deduplicated_items, ITEM_KEY_COLUMNS)
+    add_key_ids(transactions_df, TRANSACTION_KEY_COLUMNS)
+
+    if watermark is None:
+        transactions_df.to_csv(transactions_updated_file, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+    else:
+        # the already updated transactions only need the leaf nodes of the new category tree
+        if not same_category_tree(previous_category_tree, category_tree):
+            print(f"{Fore.YELLOW}Category tree changed, updating the categories of {transactions_updated_file}...\n")
+            updated_df = read_updated_transactions(transactions_updated_file)
+            updated_df['category_id'] = category_codes(updated_df['item_barcode'], category_tree)
+            updated_df.to_csv(transactions_updated_file, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+        # Append to the updated transactions, the header and BOM are already in the file
+        transactions_df.to_csv(transactions_updated_file, mode='a', header=False, index=False,
+                               quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8')
+    save_csv(deduplicated_items, final_cleaned_output_file)
+    save_watermark(transactions_updated_file, new_watermark)
+    print(f"{Fore.GREEN}Transactions updated in {time.time() - start_time:.2f} seconds.")
+    return transactions_df, deduplicated_items
+
+# make sure all barcodes in transactions exist in items file, checked on the frames that were just saved
+def check_updated_transactions(transactions_df, deduplicated_items):
+    result = check_integrity(transactions_df, deduplicated_items, log_dir='Logs')
+    print_transaction_items(result)
+    return result['ok']
+
 # Main function for orchestrating the cleanup process
-def clean_update_all():
+def clean_update_all(keep_intermediate_files=False, use_cache=True, workers=1, near_duplicates=None, chunksize=None):
     
     print("Starting the full cleanup process...\n")
     os.makedirs('Logs', exist_ok=True)
@@ -52,25 +234,22 @@ def clean_update_all():
     
     # step 0: delete all files Logs inside  Logs folder
     delete_logs_files()
-            
-    trim_spaces_commas(input_file_path, trimmed_output_file)
-    delete_incorrect_products(trimmed_output_file, delete_incorrect_products_file)    
-    correct_product_description(delete_incorrect_products_file, correct_product_description_file) 
-    run_duplication_checks(correct_product_description_file,check_duplicates_modified_desc_file)    
-    # correct category_levels
-    correct_category_levels(check_duplicates_modified_desc_file, correct_category_levels_file, log_file_path)
 
-    clean_barcode(correct_category_levels_file, cleaned_with_max_barcode_file) 
-    update_transactions(transactions_file,cleaned_with_max_barcode_file, final_cleaned_output_file, transactions_updated_file)
+    # step 1: clean the items, unchanged stages are loaded from the stage cache
+    items_df = clean_items(keep_intermediate_files, use_cache, workers, near_duplicates, chunksize)
+
+    # step 2: update transactions with the max barcode and deduplicate the items, only the new transactions with the cache
+    transactions_df, deduplicated_items = update_transactions_with_items(items_df, use_cache)
 
     # make sure all barcodes in transactions exist in items file
 
-    is_ok= check_transaction_items(transactions_updated_file, final_cleaned_output_file)
+    is_ok= check_updated_transactions(transactions_df, deduplicated_items)
     # cleanup process and delete intermediate files
     
 
     if(is_ok):
-        delete_intermediate_files()
+        if not keep_intermediate_files:
+            delete_intermediate_files()
         print(f"Final cleaned 'products' saved to: {final_cleaned_output_file}")        
         print(f"{Fore.GREEN}Full cleanup process completed.")
     else:
@@ -78,17 +257,19 @@ def clean_update_all():
         print(f"{Fore.RED}Full cleanup process aborted.")
 
 #only update transactions  every three months
-def update_transactions_only():
+def update_transactions_only(use_cache=True):
     print("Starting the transactions update process...\n")
     os.makedirs('Logs', exist_ok=True)
     os.makedirs('output', exist_ok=True)
     delete_logs_files()
-    
-    update_transactions(transactions_file,cleaned_with_max_barcode_file, final_cleaned_output_file, transactions_updated_file)
+
+    # the items are not cleaned again, the cleaned items of the last full cleanup process are used
+    items_df = load_csv(cleaned_with_max_barcode_file)
+    transactions_df, deduplicated_items = update_transactions_with_items(items_df, use_cache)
 
     # make sure all barcodes in transactions exist in items file
 
-    is_ok= check_transaction_items(transactions_updated_file, final_cleaned_output_file)
+    is_ok= check_updated_transactions(transactions_df, deduplicated_items)
     
     if(is_ok):
         delete_intermediate_files()
@@ -97,28 +278,47 @@ def update_transactions_only():
         print(f"{Fore.RED}Error: Some item_barcodes from transactions do not exist in the items file.")
         print(f"{Fore.RED}Transactions update process aborted.")
 
+# apply the latest barcode aliases to the transactions added since the last run, without cleaning the items again
+def update_new_transactions_only():
+    print("Starting the new transactions update process...\n")
+    os.makedirs('Logs', exist_ok=True)
+    if apply_aliases_to_new_transactions(transactions_file, transactions_updated_file) is not None:
+        print(f"Final cleaned 'transactions' saved to: {transactions_updated_file}")
+    else:
+        print(f"{Fore.RED}New transactions update process aborted.")
+
 
 if __name__ == "__main__":
     # Initialize colorama
     init(autoreset=True)
+    # keep the result of every item cleaning stage on disk for debugging
+    keep_intermediate_files = '--keep-intermediate' in sys.argv
+    # rerun every item cleaning stage on every row and update all transactions, ignoring the cached outputs and watermark
+    use_cache = '--no-cache' not in sys.argv
+    # number of worker processes for the description stage, e.g. --workers=16
+    workers = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--workers=')), 1)
+    # report near-duplicate descriptions (--near-duplicates) or also merge them into one product (--merge-near-duplicates)
+    near_duplicates = 'merge' if '--merge-near-duplicates' in sys.argv else 'report' if '--near-duplicates' in sys.argv else None
+    # stream the first item cleaning stages over the input file in chunks of that many rows, e.g. --chunksize=100000
+    chunksize = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--chunksize=')), None)
     # menu
     print("Choose an option:")
     print("1. Full cleanup process (Products and Transactions)")
     print("2. Update transactions ONLY? (2)")
     print("3. or 'x' Exit")
-    choice = input("Enter your choice (1/2): 3 for exit: ")
-    while choice not in ['1', '2', '3', 'x', 'X']:
-        print(f"{Fore.RED}Invalid choice. Please enter either 1 or 2.")
-        choice = input("Enter your choice (1/2): 3 for exit: ")
+    print("4. Apply barcode aliases to NEW transactions ONLY? (4)")
+    choice = input("Enter your choice (1/2/4): 3 for exit: ")
+    while choice not in ['1', '2', '3', '4', 'x', 'X']:
+        print(f"{Fore.RED}Invalid choice. Please enter either 1, 2 or 4.")
+        choice = input("Enter your choice (1/2/4): 3 for exit: ")
     if choice == '1':
-        clean_update_all()
+        clean_update_all(keep_intermediate_files, use_cache, workers, near_duplicates, chunksize)
     elif choice == '2':
-        update_transactions_only()
+        update_transactions_only(use_cache)
+    elif choice == '4':
+        update_new_transactions_only()
     elif choice == 'x' or choice == 'X' or choice == '3':
         print(f"{Fore.YELLOW}Exiting the program...")
         exit()
     else:
-        print(f"{Fore.RED}Invalid choice. Please enter either 1 or 2.")
-
-    
-    
\ No newline at end of file
+        print(f"{Fore.RED}Invalid choice. Please enter either 1, 2 or 4.")
@@ -0,0 +1,95 @@
+import pandas as pd
+import numpy as np
+import csv  # For proper quoting
+from itertools import chain
+from colorama import Fore, Style, init  # For colored output
+
+# Initialize colorama
+init(autoreset=True)
+
+# Columns that mark two items as the same product when their values are equal
+DEFAULT_DUPLICATE_KEYS = ['MODIFIED_SHORT_DESC', 'ar_short_desc']
+
+
+def find_root(parent, node):
+    # Find the root of the node's set, pointing every node on the way directly to the root (path compression)
+    root = node
+    while parent[root] != root:
+        root = parent[root]
+    while parent[node] != root:
+        parent[node], node = root, parent[node]
+    return root
+
+
+def union(parent, size, first, second):
+    # Merge the sets of both nodes, hanging the smaller set under the larger one (union by size)
+    first_root, second_root = find_root(parent, first), find_root(parent, second)
+    if first_root == second_root:
+        return
+    if size[first_root] < size[second_root]:
+        first_root, second_root = second_root, first_root
+    parent[second_root] = first_root
+    size[first_root] += size[second_root]
+
+
+def key_edges(keys):
+    # Link every row to the first row with the same key value, rows with a missing key are not linked
+    codes, _ = pd.factorize(keys)
+    rows = np.arange(len(keys))
+    _, first_index = np.unique(codes, return_index=True)
+    first_unique_code = 1 if (codes == -1).any() else 0  # np.unique puts the missing code -1 first
+    first_row = np.full(len(keys), -1)
+    has_key = codes >= 0
+    first_row[has_key] = first_index[first_unique_code:][codes[has_key]]
+    linked = has_key & (first_row != rows)
+    return zip(rows[linked].tolist(), first_row[linked].tolist())
+
+
+def assign_clusters(df, edges):
+    # Union-find over the rows, two rows end up in the same cluster if any chain of edges links them
+    parent = list(range(len(df)))
+    size = [1] * len(df)
+    for row, other_row in edges:
+        union(parent, size, row, other_row)
+
+    roots = np.array([find_root(parent, row) for row in range(len(df))], dtype=np.int64)
+
+    # Compact cluster ids numbered in order of first appearance
+    cluster_ids, _ = pd.factorize(roots)
+    df['DUPLICATE_CLUSTER_ID'] = cluster_ids.astype(np.int32)
+
+    # One canonical barcode per cluster: the max barcode as a string, the barcodes are already normalized
+    previous_max_barcode = df['MAX_barcode'] if 'MAX_barcode' in df.columns else df['barcode']
+    df['MAX_barcode'] = df['barcode'].groupby(cluster_ids).transform('max').astype(str).values
+
+    cluster_sizes = np.bincount(cluster_ids)
+    print(f"{Fore.CYAN}Total duplicate clusters found: {(cluster_sizes > 1).sum()} "
+          f"covering {cluster_sizes[cluster_sizes > 1].sum()} items\n")
+    print(f"{Fore.CYAN}Items whose MAX_barcode changed through the clustering: "
+          f"{(previous_max_barcode.astype(str) != df['MAX_barcode']).sum()}\n")
+    return df
+
+
+def cluster_duplicates_df(df, duplicate_keys=DEFAULT_DUPLICATE_KEYS):
+    print(f"{Fore.YELLOW}Clustering duplicates over {', '.join(duplicate_keys)}...\n")
+
+    # Rows sharing a value in any of the duplicate keys are linked
+    df = assign_clusters(df, chain.from_iterable(key_edges(df[key_column]) for key_column in duplicate_keys))
+
+    print(f"{Fore.GREEN}Duplicate clustering completed.\n")
+    return df
+
+
+def cluster_duplicates(input_file_path, output_file_path, duplicate_keys=DEFAULT_DUPLICATE_KEYS):
+    # Load the CSV file into a DataFrame
+    df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
+
+    df = cluster_duplicates_df(df, duplicate_keys)
+
+    # Save the DataFrame with the new columns to a CSV file, ensuring all fields are quoted
+    df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
+    print(f"{Fore.GREEN}Results saved to {output_file_path}")
+
+# Example usage:
+# cluster_duplicates('input_file.csv', 'output_file.csv')
@@ -1,62 +1,107 @@
 import pandas as pd
+import numpy as np
 import csv
 from colorama import Fore, Style, init  # For colored output
 import os
+from pipeline import read_csv_chunks, write_csv_chunks, append_csv_log  # For streaming the file in chunks
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
-def correct_category_levels(input_file_path, output_file_path, log_file_path):
+CATEGORY_LEVELS = ['category_level1', 'category_level2', 'category_level3', 'category_level4']
+
+# Bit of every level in the corrected_levels bitmask of the log: bit 0 is a missing category_level1
+# (nothing to fill it from), bits 1-3 are category_level2..4 filled from the level above
+LEVEL_BITS = {level: np.uint8(1 << bit) for bit, level in enumerate(CATEGORY_LEVELS)}
+
+def missing_category(values):
+    # Missing, empty or "NULL" category levels (column-wise)
+    text = values.str.strip()
+    return (values.isnull() | (text == '') | (text.str.upper() == 'NULL')).to_numpy()
+
+def fill_category_levels(df):
+    """
+    Fill the missing category levels from the level above, as a cascade over the level columns: a missing,
+    empty or "NULL" level takes the trimmed value of the (filled) level above. The filled levels are assigned
+    to the level columns of df. Returns the corrected_levels bitmask of every row.
+    """
+    corrected_levels = np.zeros(len(df), dtype=np.uint8)
+    corrected_levels[missing_category(df[CATEGORY_LEVELS[0]])] |= LEVEL_BITS[CATEGORY_LEVELS[0]]
+    for parent, level in zip(CATEGORY_LEVELS, CATEGORY_LEVELS[1:]):
+        # Take the trimmed value of the filled level above where this level is missing
+        missing = missing_category(df[level])
+        df[level] = df[level].where(~missing, df[parent].str.strip())
+        corrected_levels[missing] |= LEVEL_BITS[level]
+    return corrected_levels
+
+def correct_category_levels_chunk(df):
+    corrected_levels = fill_category_levels(df)
+    # Create new column 'category_name' based on the trimmed value of the filled category_level4
+    df['category_name'] = df[CATEGORY_LEVELS[-1]].str.strip()
+
+    # Row index and corrected levels of the missing or corrected rows
+    corrected = corrected_levels > 0
+    log = pd.DataFrame({'row': df.index[corrected], 'corrected_levels': corrected_levels[corrected]})
+    missing_level1 = int(((corrected_levels & LEVEL_BITS[CATEGORY_LEVELS[0]]) > 0).sum())
+    return df, log, missing_level1
+
+def print_missing_level1(missing_level1):
+    if missing_level1:
+        print(f"{Fore.RED}Warning: category_level1 is missing for {missing_level1} records.")
+
+def correct_category_levels_df(df, log_file_path):
     print(f"{Fore.YELLOW}Correcting category levels...{Style.RESET_ALL}")
-    # Load the data into a DataFrame
-    df = pd.read_csv(input_file_path, dtype=str, low_memory=False)
 
-    
     # Create logs folder if it doesn't exist
     os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
 
-    # Track rows with missing or corrected categories
-    missing_or_corrected_rows = []
+    df, log, missing_level1 = correct_category_levels_chunk(df)
+    print_missing_level1(missing_level1)
 
-    # Check each row and fix category levels
-    for index, row in df.iterrows():
-        corrected = False
+    # Write the row index and corrected levels of the missing or corrected rows to a log file
+    if not log.empty:
+        print(f"{Fore.CYAN}Writing {len(log)} missing or corrected records to log file: {log_file_path}{Style.RESET_ALL}")
+        log.to_csv(log_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
 
-        # Check for missing or "NULL" values in category_level1
-        if pd.isnull(row['category_level1']) or row['category_level1'].strip() == '' or row['category_level1'].strip().upper() == 'NULL':
-            print(f"{Fore.RED}Warning: category_level1 is missing for record {index}.")
-            corrected = True
+    return df
 
-        # Check for missing or "NULL" values in category_level2 and fix
-        if pd.isnull(row['category_level2']) or row['category_level2'].strip() == '' or row['category_level2'].strip().upper() == 'NULL':
-            row['category_level2'] = row['category_level1'].strip()  # Take trimmed value from category_level1
-            corrected = True
+def correct_category_levels_streaming(input_file_path, output_file_path, log_file_path, chunksize):
+    # Read, correct and write chunksize rows at a time, so memory is bounded by the chunk size instead of the file size
+    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+    log_file = None
+    missing_level1 = 0
+    try:
+        def corrected_chunks():
+            nonlocal log_file, missing_level1
+            for chunk in read_csv_chunks(input_file_path, chunksize, low_memory=False):
+                chunk, log, chunk_missing_level1 = correct_category_levels_chunk(chunk)
+                missing_level1 += chunk_missing_level1
+                # The log file is only written when some rows are missing or corrected, like in a full load
+                log_file = append_csv_log(log_file, log, log_file_path)
+                yield chunk
 
-        # Check for missing or "NULL" values in category_level3 and fix
-        if pd.isnull(row['category_level3']) or row['category_level3'].strip() == '' or row['category_level3'].strip().upper() == 'NULL':
-            row['category_level3'] = row['category_level2'].strip()  # Take trimmed value from category_level2
-            corrected = True
+        write_csv_chunks(corrected_chunks(), output_file_path)
+    finally:
+        if log_file is not None:
+            log_file.close()
+    print_missing_level1(missing_level1)
 
-        # Check for missing or "NULL" values in category_level4 and fix
-        if pd.isnull(row['category_level4']) or row['category_level4'].strip() == '' or row['category_level4'].strip().upper() == 'NULL':
-            row['category_level4'] = row['category_level3'].strip()  # Take trimmed value from category_level3
-            corrected = True
+def correct_category_levels(input_file_path, output_file_path, log_file_path, chunksize=None):
+    # With chunksize the file is streamed in chunks of that many rows instead of being loaded whole
+    if chunksize:
+        print(f"{Fore.YELLOW}Correcting category levels in chunks of {chunksize} rows...{Style.RESET_ALL}")
+        correct_category_levels_streaming(input_file_path, output_file_path, log_file_path, chunksize)
+        print(f"{Fore.GREEN}Category level correction process completed. Corrected data saved to: {output_file_path}{Style.RESET_ALL}")
+        return
 
-        # Create new column 'category_name' based on the trimmed value of category_level4
-        df.at[index, 'category_name'] = row['category_level4'].strip()
+    # Load the data into a DataFrame
+    df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
 
-        # Log missing or corrected rows
-        if corrected:
-            missing_or_corrected_rows.append(row)
+    df = correct_category_levels_df(df, log_file_path)
 
     # Save the corrected DataFrame to the output file
     df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
 
-    # Write missing or corrected rows to a log file
-    if missing_or_corrected_rows:
-        print(f"{Fore.CYAN}Writing missing or corrected records to log file: {log_file_path}{Style.RESET_ALL}")
-        pd.DataFrame(missing_or_corrected_rows).to_csv(log_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
-
     print(f"{Fore.GREEN}Category level correction process completed. Corrected data saved to: {output_file_path}{Style.RESET_ALL}")
 
 # Example usage
@@ -1,88 +1,123 @@
 import pandas as pd
+import numpy as np
 import csv  # Correct import for quoting
 import re  # For detecting product numbers and cleaning up text
+from pipeline import map_changed_rows  # For running the rules on row chunks in parallel
 
-def is_informative(short_desc, full_desc):
-    # Define threshold to determine if short_desc lacks key details
-    return len(short_desc.split()) > 2
+# The columns the rules read
+DESCRIPTION_COLUMNS = ['en_short_desc', 'en_full_description', 'barcode']
+
+# Anything float() accepts: optional sign, digits with single underscores, optional fraction and exponent, inf or nan
+DIGIT_PART = r'\d(?:_?\d)*'
+NUMERIC_PATTERN = re.compile(
+    rf'[+-]?(?:(?:(?:{DIGIT_PART})?\.{DIGIT_PART}|{DIGIT_PART}\.?)(?:[eE][+-]?{DIGIT_PART})?|(?i:inf(?:inity)?|nan))'
+)
+
+def is_informative(short_desc):
+    """Short descriptions with more than two words are considered informative (column-wise)."""
+    return short_desc.str.split().str.len() > 2
 
 def extract_product_number(full_desc):
-    """Extract product number (e.g., #HL001) from the full description."""
-    match = re.search(r'#\s*\w+', full_desc)
-    return match.group(0) if match else ''
+    """Extract product number (e.g., #HL001) from the full description (column-wise)."""
+    return full_desc.str.extract(r'(#\s*\w+)', expand=False).fillna('')
 
 def clean_description(desc):
-    """Clean up the description by removing leading/trailing punctuation and spaces."""
+    """Clean up the description by removing leading/trailing punctuation and spaces (column-wise)."""
     # Remove leading/trailing dashes, colons, and extra spaces
-    return re.sub(r'^[\s\-:]+|[\s\-:]+$', '', desc)
-
-def correct_product_description(input_file_path, output_file_path):
+    return desc.str.replace(r'^[\s\-:]+|[\s\-:]+$', '', regex=True)
+
+def is_numeric(value):
+    """Check if each string is numeric, the same strings float() accepts (column-wise)."""
+    return value.str.fullmatch(NUMERIC_PATTERN)
+
+def correct_product_description_chunk(df):
+    en_short_desc = df['en_short_desc'].fillna('').astype(str)
+    en_full_desc = df['en_full_description'].fillna('').astype(str)
+
+    # Extract the product number (e.g., #HL001) from en_full_description
+    product_number = extract_product_number(en_full_desc).astype(object)
+    has_product_number = product_number != ''
+
+    # Remove product number from full description for further processing
+    en_full_desc_cleaned = pd.Series([
+        full_desc.replace(number, '') if number else full_desc
+        for full_desc, number in zip(en_full_desc, product_number)
+    ], index=df.index, dtype=object)
+
+    # Clean up leading/trailing punctuation (e.g., hyphens, colons)
+    en_full_desc_cleaned = clean_description(en_full_desc_cleaned.str.strip())
+
+    short_desc = en_short_desc.str.strip()  # Start with the original short description
+
+    # Rule 3a/3b only look at short descriptions starting with '#', check if en_full_description contains them
+    starts_with_hash = short_desc.str.startswith('#')
+    in_full_desc = np.zeros(len(df), dtype=bool)
+    in_full_desc[starts_with_hash.to_numpy()] = np.fromiter(
+        (short in full_desc for short, full_desc in zip(short_desc[starts_with_hash], en_full_desc[starts_with_hash])),
+        dtype=bool, count=int(starts_with_hash.sum())
+    )
+
+    # The rules in priority order, the first matching rule wins
+    rules = [
+        (short_desc == '') | is_numeric(short_desc),                # Rule: null, empty, or numeric -> en_full_description
+        short_desc == df['barcode'],                                 # Rule 1: equals barcode -> en_full_description
+        short_desc.str.startswith('*') & short_desc.str.endswith('*'),  # Rule 2: '*...*' is preserved, no further changes
+        starts_with_hash & in_full_desc,                             # Rule 3a: '#...' inside en_full_description -> en_full_description
+        starts_with_hash,                                            # Rule 3b: '#...' not inside -> en_full_description + en_short_desc
+    ]
+    choices = [
+        en_full_desc_cleaned,
+        en_full_desc_cleaned,
+        short_desc,
+        en_full_desc_cleaned,
+        en_full_desc_cleaned + ' ' + short_desc,
+    ]
+    modified_short_desc = pd.Series(np.select(rules, choices, default=short_desc), index=df.index, dtype=object)
+
+    # Rule 2 rows keep an empty MODIFIED_SHORT_DESC, all other rows go through the remaining steps
+    preserved = ~rules[0] & ~rules[1] & rules[2]
+    corrected = ~preserved
+
+    # New Rule: Detect non-informative short description and avoid duplication
+    # If short description lacks details, append missing details from en_full_description
+    not_informative = corrected & ~is_informative(modified_short_desc)
+    missing_details = pd.Series([
+        ' '.join([word for word in full_desc.split() if word not in short])
+        for full_desc, short in zip(en_full_desc_cleaned[not_informative], modified_short_desc[not_informative])
+    ], index=modified_short_desc[not_informative].index, dtype=object)
+    modified_short_desc[not_informative] = missing_details.str.strip() + ' ' + modified_short_desc[not_informative].str.strip()
+
+    # Ensure the product number is appended to the END of MODIFIED_SHORT_DESC (not at the beginning)
+    needs_product_number = corrected & has_product_number
+    needs_product_number = needs_product_number.to_numpy().copy()
+    needs_product_number[needs_product_number] = np.fromiter(
+        (number not in short
+         for number, short in zip(product_number[needs_product_number], modified_short_desc[needs_product_number])),
+        dtype=bool, count=int(needs_product_number.sum())
+    )
+    modified_short_desc[needs_product_number] = (modified_short_desc[needs_product_number].str.strip()
+                                                 + ' ' + product_number[needs_product_number])
+
+    # Ensure the product number stays at the end and doesn't have extra hyphen
+    modified_short_desc = clean_description(modified_short_desc)
+
+    # Convert MODIFIED_SHORT_DESC to uppercase and strip spaces
+    df['MODIFIED_SHORT_DESC'] = modified_short_desc.str.upper().str.split().str.join(' ').where(corrected, '')
+
+    return df
+
+def correct_product_description_df(df, workers=1, row_cache=None):
     print(f"Correcting product descriptions ..............")
+
+    # Every row is corrected on its own, so the rows can be split over several worker processes,
+    # and with a row cache only the new or changed rows are corrected again
+    return map_changed_rows(df, correct_product_description_chunk, workers, row_cache, DESCRIPTION_COLUMNS)
+
+def correct_product_description(input_file_path, output_file_path, workers=1):
     # Load the CSV file into a DataFrame, treating all columns as strings
     df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
 
-    # Add a new column for the modified short description
-    df['MODIFIED_SHORT_DESC'] = ''
-
-    # Function to check if a string is numeric
-    def is_numeric(value):
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
-
-    # Iterate through the DataFrame to apply the correction rules
-    for index, row in df.iterrows():
-        en_short_desc = row['en_short_desc'] if pd.notnull(row['en_short_desc']) else ''
-        en_full_desc = row['en_full_description'] if pd.notnull(row['en_full_description']) else ''
-
-        # Extract the product number (e.g., #HL001) from en_full_description
-        product_number = extract_product_number(en_full_desc)
-
-        # Remove product number from full description for further processing
-        en_full_desc_cleaned = en_full_desc.replace(product_number, '').strip()
-
-        # Clean up leading/trailing punctuation (e.g., hyphens, colons)
-        en_full_desc_cleaned = clean_description(en_full_desc_cleaned)
-
-        modified_short_desc = en_short_desc.strip()  # Start with the original short description
-
-        # Rule: If en_short_desc is null, empty, or numeric, set it to en_full_description
-        if modified_short_desc == '' or is_numeric(modified_short_desc):
-            modified_short_desc = en_full_desc_cleaned
-        
-        # Rule 1: If en_short_desc equals barcode value, set it to en_full_description
-        elif modified_short_desc == row['barcode']:
-            modified_short_desc = en_full_desc_cleaned
-
-        # Rule 2: If en_short_desc starts with '*' and ends with '*', preserve it
-        elif modified_short_desc.startswith('*') and modified_short_desc.endswith('*'):
-            continue  # Skip appending details, preserving en_short_desc as is
-        
-        # Rule 3a: If en_short_desc starts with '#', check if it contains en_full_description, then set it to en_full_description
-        elif modified_short_desc.startswith('#') and modified_short_desc in row['en_full_description']:
-            modified_short_desc = en_full_desc_cleaned
-        
-        # Rule 3b: If en_short_desc starts with '#' and doesn't contain en_full_description, concatenate en_full_description and en_short_desc
-        elif modified_short_desc.startswith('#') and modified_short_desc not in row['en_full_description']:
-            modified_short_desc = en_full_desc_cleaned + ' ' + modified_short_desc
-
-        # New Rule: Detect non-informative short description and avoid duplication
-        if not is_informative(modified_short_desc, en_full_desc_cleaned):
-            # If short description lacks details, append missing details from en_full_description
-            missing_details = ' '.join([word for word in en_full_desc_cleaned.split() if word not in modified_short_desc])
-            modified_short_desc = missing_details.strip() + ' ' + modified_short_desc.strip()
-
-        # Ensure the product number is appended to the END of MODIFIED_SHORT_DESC (not at the beginning)
-        if product_number and product_number not in modified_short_desc:
-            modified_short_desc = modified_short_desc.strip() + ' ' + product_number
-
-        # Ensure the product number stays at the end and doesn't have extra hyphen
-        modified_short_desc = clean_description(modified_short_desc)
-
-        # Convert both en_full_description and MODIFIED_SHORT_DESC to uppercase and strip spaces
-        df.at[index, 'MODIFIED_SHORT_DESC'] = ' '.join(modified_short_desc.upper().split())
+    df = correct_product_description_df(df, workers)
 
     # Save the corrected DataFrame to a new CSV file, using correct quoting for non-numeric fields
     df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
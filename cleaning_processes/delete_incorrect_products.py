@@ -2,40 +2,75 @@ import pandas as pd
 import os
 import csv
 from colorama import Fore, Style
+from pipeline import read_csv_chunks, write_csv_chunks  # For streaming the file in chunks
 
-def delete_incorrect_products(input_file_path, output_file_path):
-    # Load the CSV file into a DataFrame, treating all columns as strings
-    df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
+TEMP_DESCRIPTION = 'TEMP ITEMS TO BE DELETED'
+log_file_path = 'Logs/Items_to_be_deleted.txt'
 
+def open_deleted_items_log():
     # Create the Logs folder if it doesn't exist
     os.makedirs('Logs', exist_ok=True)
 
     # Open the log file to write the barcodes of deleted items
-    log_file_path = 'Logs/Items_to_be_deleted.txt'
-    with open(log_file_path, 'w', encoding='utf-8-sig') as log_file:
-        log_file.write('"TEMP / DELETED" ITEMS:\n\n')
-
-        # Identify rows where en_full_description is 'TEMP ITEMS TO BE DELETED'
-        temp_rows = df[df['en_full_description'] == 'TEMP ITEMS TO BE DELETED']
+    log_file = open(log_file_path, 'w', encoding='utf-8-sig')
+    log_file.write('"TEMP / DELETED" ITEMS:\n\n')
+    return log_file
 
-        # Write the barcode of each deleted row into the log file
-        for barcode in temp_rows['barcode']:
-            log_file.write(f'"{barcode}"\n')
+def delete_temp_rows(df, log_file):
+    # Identify rows where en_full_description is 'TEMP ITEMS TO BE DELETED'
+    temp_rows = df[df['en_full_description'] == TEMP_DESCRIPTION]
 
-        # Count of the rows to be deleted
-        total_deleted = temp_rows.shape[0]
+    # Write the barcode of each deleted row into the log file
+    for barcode in temp_rows['barcode']:
+        log_file.write(f'"{barcode}"\n')
 
-        # Remove rows where en_full_description is 'TEMP ITEMS TO BE DELETED'
-        df_cleaned = df[df['en_full_description'] != 'TEMP ITEMS TO BE DELETED']
-
-    # Save the cleaned DataFrame to a new TXT file
-    df_cleaned.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+    # Remove rows where en_full_description is 'TEMP ITEMS TO BE DELETED', with the count of removed rows
+    return df[df['en_full_description'] != TEMP_DESCRIPTION], temp_rows.shape[0]
 
+def print_deleted_total(total_deleted):
     # Print the total number of deleted products and save it to the log
     print(f"Total deleted products: {total_deleted}")
     #with open(log_file_path, 'a', encoding='utf-8-sig') as log_file:
      #   log_file.write(f"\nTotal deleted products: {total_deleted}")
 
-    print(f"{Fore.RED}Removed incorrect products. Updated data saved to: {output_file_path}{Style.RESET_ALL}")
-
     print(f"Details of deleted items logged to: {log_file_path}")
+
+def delete_incorrect_products_df(df):
+    with open_deleted_items_log() as log_file:
+        df_cleaned, total_deleted = delete_temp_rows(df, log_file)
+
+    print_deleted_total(total_deleted)
+
+    return df_cleaned
+
+def delete_incorrect_products_streaming(input_file_path, output_file_path, chunksize):
+    # Read, filter and write chunksize rows at a time, so memory is bounded by the chunk size instead of the file size
+    total_deleted = 0
+    with open_deleted_items_log() as log_file:
+        def cleaned_chunks():
+            nonlocal total_deleted
+            for chunk in read_csv_chunks(input_file_path, chunksize, low_memory=False):
+                chunk_cleaned, chunk_deleted = delete_temp_rows(chunk, log_file)
+                total_deleted += chunk_deleted
+                yield chunk_cleaned
+
+        write_csv_chunks(cleaned_chunks(), output_file_path, quoting=csv.QUOTE_NONNUMERIC)
+
+    print_deleted_total(total_deleted)
+
+def delete_incorrect_products(input_file_path, output_file_path, chunksize=None):
+    # With chunksize the file is streamed in chunks of that many rows instead of being loaded whole
+    if chunksize:
+        delete_incorrect_products_streaming(input_file_path, output_file_path, chunksize)
+        print(f"{Fore.RED}Removed incorrect products. Updated data saved to: {output_file_path}{Style.RESET_ALL}")
+        return
+
+    # Load the CSV file into a DataFrame, treating all columns as strings
+    df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
+
+    df_cleaned = delete_incorrect_products_df(df)
+
+    # Save the cleaned DataFrame to a new TXT file
+    df_cleaned.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
+    print(f"{Fore.RED}Removed incorrect products. Updated data saved to: {output_file_path}{Style.RESET_ALL}")
@@ -0,0 +1,157 @@
+import os
+import re
+import csv  # For proper quoting
+import zlib
+import pandas as pd
+import numpy as np
+from itertools import chain, combinations
+from colorama import Fore, Style, init  # For colored output
+from cluster_duplicates import assign_clusters, key_edges
+
+# Initialize colorama
+init(autoreset=True)
+
+# Mersenne prime used by the MinHash permutations (a * h + b) mod p
+MINHASH_PRIME = (1 << 31) - 1
+
+
+def shingle_description(description, shingle_size):
+    # Character shingles of the description with all whitespace removed, so "900 G" and "900G" match
+    text = ''.join(description.upper().split())
+    if len(text) <= shingle_size:
+        return {text}
+    return {text[start:start + shingle_size] for start in range(len(text) - shingle_size + 1)}
+
+
+def minhash_signatures(shingle_sets, num_perm, seed=1):
+    # MinHash signature of every shingle set, one column per random permutation
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingles in shingle_sets for shingle in shingles),
+                         dtype=np.uint64)
+    offsets = np.concatenate(([0], np.cumsum([len(shingles) for shingles in shingle_sets])[:-1]))
+
+    random_state = np.random.RandomState(seed)
+    a = random_state.randint(1, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+    b = random_state.randint(0, MINHASH_PRIME, size=num_perm).astype(np.uint64)
+
+    signatures = np.empty((len(shingle_sets), num_perm), dtype=np.uint64)
+    for permutation in range(num_perm):
+        permuted = (a[permutation] * hashes + b[permutation]) % MINHASH_PRIME
+        signatures[:, permutation] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def lsh_candidate_pairs(signatures, bands, max_bucket_size):
+    # Descriptions whose signatures agree on every row of at least one band become candidate pairs
+    rows_per_band = signatures.shape[1] // bands
+    candidates = set()
+    skipped_buckets = 0
+
+    for band in range(bands):
+        # Hash the rows of the band into one number, equal bands land in the same bucket
+        band_rows = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        band_hashes = np.zeros(len(signatures), dtype=np.uint64)
+        for row in range(rows_per_band):
+            band_hashes = band_hashes * np.uint64(MINHASH_PRIME) + band_rows[:, row]
+        bucket_ids, _ = pd.factorize(band_hashes)
+
+        order = np.argsort(bucket_ids, kind='stable')
+        boundaries = np.flatnonzero(np.diff(bucket_ids[order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) < 2:
+                continue
+            # Very large buckets are generic descriptions, comparing all their pairs would be quadratic
+            if len(bucket) > max_bucket_size:
+                skipped_buckets += 1
+                continue
+            candidates.update(combinations(sorted(bucket.tolist()), 2))
+
+    return candidates, skipped_buckets
+
+
+def jaccard_similarity(first, second):
+    return len(first & second) / len(first | second)
+
+
+def find_near_duplicates(descriptions, threshold, shingle_size, num_perm, bands, max_bucket_size):
+    # Verified near-duplicate pairs of descriptions as (first, second, similarity)
+    shingle_sets = [shingle_description(description, shingle_size) for description in descriptions]
+    numbers = [re.findall(r'\d+', description) for description in descriptions]
+
+    signatures = minhash_signatures(shingle_sets, num_perm)
+    candidates, skipped_buckets = lsh_candidate_pairs(signatures, bands, max_bucket_size)
+    print(f"{Fore.CYAN}Candidate pairs from LSH: {len(candidates)}\n")
+    if skipped_buckets:
+        print(f"{Fore.YELLOW}Skipped {skipped_buckets} buckets with more than {max_bucket_size} descriptions\n")
+
+    pairs = []
+    for first, second in candidates:
+        # Sizes and quantities must match, "900G" and "400G" are different products
+        if numbers[first] != numbers[second]:
+            continue
+        similarity = jaccard_similarity(shingle_sets[first], shingle_sets[second])
+        if similarity >= threshold:
+            pairs.append((first, second, similarity))
+    return pairs
+
+
+def near_duplicates_df(df, description_column='MODIFIED_SHORT_DESC', threshold=0.4, shingle_size=3,
+                       num_perm=128, bands=32, max_bucket_size=50,
+                       candidates_file='Logs/near_duplicate_candidates.csv', merge=False):
+    """
+    Find items whose descriptions are nearly the same ("NIDO MILK POWDER 900G" / "NIDO MILK PWD 900 G").
+
+    Descriptions are split into character shingles, LSH banding on their MinHash signatures gives
+    candidate pairs in roughly linear time and the candidates are verified with the exact Jaccard
+    similarity. The verified pairs are written to candidates_file for review. With merge=True they are
+    also merged into the duplicate clusters, so they share one MAX_barcode.
+    """
+    print(f"{Fore.YELLOW}Starting near-duplicate detection on {description_column}...\n")
+
+    # Work on unique descriptions, exact duplicates are already handled by the duplication checks
+    descriptions = df[description_column].dropna()
+    descriptions = descriptions[descriptions.str.strip() != '']
+    unique_descriptions = descriptions.drop_duplicates()
+    print(f"{Fore.CYAN}Unique descriptions to compare: {len(unique_descriptions)}\n")
+
+    pairs = find_near_duplicates(unique_descriptions.tolist(), threshold, shingle_size, num_perm, bands, max_bucket_size)
+    print(f"{Fore.CYAN}Near-duplicate pairs found: {len(pairs)}\n")
+
+    # First row of every description, positions are used to link the rows in the duplicate clusters
+    first_rows = df.index.get_indexer(unique_descriptions.index)
+    first_barcode = df['barcode'].iloc[first_rows].tolist()
+    unique_descriptions = unique_descriptions.tolist()
+
+    pairs_df = pd.DataFrame([
+        (first_barcode[first], unique_descriptions[first], first_barcode[second], unique_descriptions[second], round(similarity, 3))
+        for first, second, similarity in sorted(pairs, key=lambda pair: -pair[2])
+    ], columns=['barcode_1', f'{description_column}_1', 'barcode_2', f'{description_column}_2', 'similarity'])
+
+    os.makedirs(os.path.dirname(candidates_file) or '.', exist_ok=True)
+    pairs_df.to_csv(candidates_file, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+    print(f"{Fore.CYAN}Near-duplicate candidates saved to: {candidates_file}{Style.RESET_ALL}")
+
+    if merge:
+        print(f"{Fore.YELLOW}Merging near-duplicates into the duplicate clusters...\n")
+        edges = [key_edges(df[description_column])]
+        if 'DUPLICATE_CLUSTER_ID' in df.columns:
+            edges.append(key_edges(df['DUPLICATE_CLUSTER_ID']))
+        edges.append((first_rows[first], first_rows[second]) for first, second, _ in pairs)
+        df = assign_clusters(df, chain.from_iterable(edges))
+
+    print(f"{Fore.GREEN}Near-duplicate detection completed.\n")
+    return df
+
+
+def near_duplicates(input_file_path, output_file_path, merge=False):
+    # Load the CSV file into a DataFrame
+    df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
+
+    df = near_duplicates_df(df, merge=merge)
+
+    # Save the DataFrame to a CSV file, ensuring all fields are quoted
+    df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
+    print(f"{Fore.GREEN}Results saved to {output_file_path}")
+
+# Example usage:
+# near_duplicates('input_file.csv', 'output_file.csv')
@@ -0,0 +1,126 @@
+import os
+import csv
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style, init  # For colored output
+
+# Initialize colorama for colored output
+init(autoreset=True)
+
+log_file_path = 'Logs/invalid_barcodes.csv'
+
+# Whitespace, quotes and the '=' of Excel text formulas around a barcode are noise
+BARCODE_NOISE = ' \t\r\n\u00A0\'"='
+# A barcode that went through a float column: 6281234567890.0
+FLOAT_ARTIFACT = r'^([0-9]+)\.0*$'
+
+# Lengths of the EAN-8, UPC-A, EAN-13 and GTIN-14 barcodes, checked as a 14 digit GTIN padded with leading zeros
+GTIN_LENGTHS = [8, 12, 13, 14]
+GTIN_WIDTH = 14
+# Weights of the 13 digits before the check digit, from the left of the padded GTIN
+GTIN_WEIGHTS = np.array([3, 1] * 6 + [3], dtype=np.int64)
+# Leading digits of the GS1 restricted circulation numbers, the only in-store codes: EAN-8 starting with 0 or 2,
+# UPC-A with number system 2 (variable weight) or 4 (in-store) and EAN-13 with a 20-29 prefix
+INTERNAL_PREFIXES = {8: ('0', '2'), 12: ('2', '4'), 13: ('2',)}
+
+BARCODE_TYPES = ['valid', 'invalid', 'internal']
+
+
+def normalize_barcode_values(values):
+    """Strip the noise around the barcodes and the float artifacts, column-wise. Missing values stay missing."""
+    barcodes = values.astype(object).where(values.notna())
+    return barcodes.str.strip(BARCODE_NOISE).str.replace(FLOAT_ARTIFACT, r'\1', regex=True)
+
+
+def fixed_width_barcodes(barcodes, width=None):
+    # Barcodes as a numpy array of fixed-width UTF-8 bytes, width defaults to the longest barcode
+    barcodes = pd.Series(barcodes, dtype=object).fillna('').astype(str)
+    try:
+        # Barcodes are ASCII, numpy converts those directly
+        return barcodes.to_numpy().astype(f'S{width}' if width else 'S')
+    except UnicodeEncodeError:
+        encoded = barcodes.str.encode('utf-8')
+        return encoded.to_numpy().astype(f'S{width}' if width else 'S')
+
+
+def gtin_check_digits_valid(barcodes):
+    # Check digit of every GTIN (digits only, at most 14 long), computed over the whole column at once
+    padded = fixed_width_barcodes(barcodes.str.zfill(GTIN_WIDTH), GTIN_WIDTH)
+    digits = padded.view(np.uint8).reshape(-1, GTIN_WIDTH).astype(np.int64) - ord('0')
+    check_digits = (10 - (digits[:, :-1] @ GTIN_WEIGHTS) % 10) % 10
+    return check_digits == digits[:, -1]
+
+
+def barcode_types(barcodes):
+    """
+    Classify the normalized barcodes: 'internal' for in-store numbers (8, 12 or 13 digits with a restricted
+    circulation prefix, see INTERNAL_PREFIXES), 'valid' for EAN-8, UPC-A, EAN-13 and GTIN-14 barcodes with a
+    correct check digit, 'invalid' for everything else: wrong check digits, other lengths, letters, missing
+    barcodes and barcodes in scientific notation (6.28123456789E+12 lost the digits beyond its precision).
+    """
+    text = barcodes.fillna('').astype(str)
+    lengths = text.str.len().to_numpy()
+    digits_only = text.str.fullmatch('[0-9]+').to_numpy(dtype=bool)
+    gtin = digits_only & np.isin(lengths, GTIN_LENGTHS)
+
+    types = np.full(len(text), 'invalid', dtype=object)
+    valid = np.zeros(len(text), dtype=bool)
+    valid[gtin] = gtin_check_digits_valid(text[gtin])
+    types[gtin] = np.where(valid[gtin], 'valid', 'invalid')
+
+    first_digits = text.str[:1].to_numpy()
+    for length, prefixes in INTERNAL_PREFIXES.items():
+        types[gtin & (lengths == length) & np.isin(first_digits, prefixes)] = 'internal'
+    return pd.Series(pd.Categorical(types, categories=BARCODE_TYPES), index=barcodes.index)
+
+
+def normalize_barcodes_chunk(df):
+    # Normalize and classify the barcodes of df; returns df, the number of changed barcodes, the count of
+    # every barcode type and the invalid barcodes (item_number, barcode) for the log
+    barcodes = normalize_barcode_values(df['barcode'])
+    changed = int((df['barcode'].notna() & (barcodes != df['barcode'])).sum())
+
+    df['barcode'] = barcodes
+    df['barcode_type'] = barcode_types(barcodes)
+    type_counts = df['barcode_type'].value_counts().reindex(BARCODE_TYPES)
+    invalid = df.loc[df['barcode_type'] == 'invalid', ['item_number', 'barcode']]
+
+    # The barcode type is saved as text like the other columns
+    df['barcode_type'] = df['barcode_type'].astype(str)
+    return df, changed, type_counts, invalid
+
+
+def print_barcode_counts(changed, type_counts):
+    print(f"{Fore.CYAN}Barcodes normalized: {changed}{Style.RESET_ALL}")
+    for barcode_type, count in type_counts.items():
+        print(f"{Fore.CYAN}{barcode_type.capitalize()} barcodes: {count}{Style.RESET_ALL}")
+
+
+def normalize_barcodes_df(df, log_file_path=log_file_path):
+    print(f"{Fore.YELLOW}Normalizing barcodes...{Style.RESET_ALL}")
+
+    df, changed, type_counts, invalid = normalize_barcodes_chunk(df)
+    print_barcode_counts(changed, type_counts)
+
+    # Write the invalid barcodes to a log file for review
+    if not invalid.empty:
+        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+        print(f"{Fore.RED}Writing {len(invalid)} invalid barcodes to log file: {log_file_path}{Style.RESET_ALL}")
+        invalid.to_csv(log_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
+
+    return df
+
+
+def normalize_barcodes(input_file_path, output_file_path, log_file_path=log_file_path):
+    # Load the data into a DataFrame
+    df = pd.read_csv(input_file_path, dtype=str, low_memory=False)
+
+    df = normalize_barcodes_df(df, log_file_path)
+
+    # Save the normalized DataFrame to the output file
+    df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
+
+    print(f"{Fore.GREEN}Barcode normalization completed. Normalized data saved to: {output_file_path}{Style.RESET_ALL}")
+
+# Example usage
+# normalize_barcodes('input_file.csv', 'output_file.csv')
@@ -0,0 +1,292 @@
+import os
+import csv
+import glob
+import json
+import time
+import hashlib
+import inspect
+import sys
+import numpy as np
+import pandas as pd
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from colorama import Fore, Style, init
+
+# Initialize colorama for colored output
+init(autoreset=True)
+
+# Strings that pd.read_csv(dtype=str) turns into NaN by default. The stages used to hand
+# their results to each other through CSV files, so every stage expects these to be missing.
+CSV_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+
+def load_csv(input_file_path):
+    # Load a CSV file treating all columns as strings, the way every stage reads its input
+    return pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, low_memory=False)
+
+
+def save_csv(df, output_file_path):
+    # Save a DataFrame with every field quoted, the way the stages write their output
+    df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
+
+
+def read_csv_chunks(input_file_path, chunksize, **read_csv_params):
+    # Read a CSV file as strings in chunks of chunksize rows, a file without rows gives one empty chunk with its header
+    empty = True
+    for chunk in pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, chunksize=chunksize, **read_csv_params):
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str, nrows=0, **read_csv_params)
+
+
+def write_csv_chunks(chunks, output_file_path, quoting=csv.QUOTE_ALL):
+    # Append DataFrames one after another to one CSV file, with the header of the first one
+    with open(output_file_path, 'w', encoding='utf-8-sig', newline='') as output_file:
+        for position, chunk in enumerate(chunks):
+            chunk.to_csv(output_file, header=position == 0, index=False, quoting=quoting)
+
+
+def append_csv_log(log_file, log, log_file_path):
+    # Append the rows of log to the open log file, opened with the header on the first rows; returns the file
+    if log.empty:
+        return log_file
+    if log_file is None:
+        print(f"{Fore.CYAN}Writing records to log file: {log_file_path}{Style.RESET_ALL}")
+        log_file = open(log_file_path, 'w', encoding='utf-8-sig', newline='')
+        log.to_csv(log_file, index=False, quoting=csv.QUOTE_ALL)
+    else:
+        log.to_csv(log_file, header=False, index=False, quoting=csv.QUOTE_ALL)
+    return log_file
+
+
+def restore_csv_missing_values(df):
+    # Give the text columns the missing values and the DataFrame the row index they would have after a CSV write
+    # and re-read, the numeric columns were not written as text by a stage
+    df = df.reset_index(drop=True)
+    text = df.select_dtypes(include=['object', 'string'])
+    df[text.columns] = text.mask(text.isin(CSV_NA_VALUES))
+    return df
+
+
+def map_chunks(df, chunk_function, workers, **params):
+    # Run chunk_function on one chunk of df per worker in a process pool, the results in the row order of df
+    if workers <= 1 or len(df) < workers:
+        return [chunk_function(df, **params)]
+
+    chunk_size = -(-len(df) // workers)
+    chunks = [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+    print(f"{Fore.CYAN}Processing {len(df)} rows in {len(chunks)} chunks with {workers} workers...{Style.RESET_ALL}")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(chunk_function, **params), chunks))
+
+
+def row_hashes(df):
+    # Content hash of every row, equal rows hash alike wherever they are in the file
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def project_modules(module):
+    # The module and the modules of this folder it imports from, directly or through each other, and pipeline
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    found, pending = {}, [module, sys.modules[__name__]]
+    while pending:
+        module = pending.pop()
+        if module is None or module.__name__ in found:
+            continue
+        found[module.__name__] = module
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                used = value
+            elif inspect.isfunction(value) or inspect.isclass(value):
+                used = sys.modules.get(value.__module__)
+            else:
+                continue
+            used_file = getattr(used, '__file__', None)
+            if used_file and os.path.dirname(os.path.abspath(used_file)) == project_dir:
+                pending.append(used)
+    return [found[name] for name in sorted(found)]
+
+
+def code_digest(function):
+    # Source of the module of function and of every project module it uses, so editing a helper imported
+    # from another module (or the pipeline itself) also changes the digest
+    digest = hashlib.sha256()
+    for module in project_modules(inspect.getmodule(function)):
+        digest.update(module.__name__.encode('utf-8'))
+        digest.update(inspect.getsource(module).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def row_cache_key(df, chunk_function, params):
+    # The rows of a previous run are only reused for the same columns, parameters and chunk code
+    digest = hashlib.sha256('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(code_digest(chunk_function).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_row_cache(row_cache, key):
+    if not os.path.exists(row_cache):
+        return None
+    cached = pd.read_pickle(row_cache)
+    return cached if cached['key'] == key else None
+
+
+def map_changed_rows(df, chunk_function, workers=1, row_cache=None, columns=None, **params):
+    # Run a row-local chunk_function over df like map_chunks, only on the rows whose hash is not in the row_cache
+    # pickle of the previous run, the other output rows come from there; with columns only those are hashed and
+    # passed to chunk_function, its output columns are set on a copy of df
+    if columns is not None:
+        output = map_changed_rows(df[columns].copy(), chunk_function, workers, row_cache, **params)
+        df = df.copy()
+        for column in output.columns:
+            df[column] = output[column]
+        return df
+
+    if row_cache is None:
+        return pd.concat(map_chunks(df, chunk_function, workers, **params))
+
+    key = row_cache_key(df, chunk_function, params)
+    hashes = row_hashes(df)
+    previous = load_row_cache(row_cache, key)
+    if previous is None:
+        previous_positions = np.full(len(df), -1)
+    else:
+        # Position of every row in the previous output, -1 for new or changed rows
+        previous_rows = pd.Series(np.arange(len(previous['row_hashes'])), index=previous['row_hashes'])
+        previous_rows = previous_rows[~previous_rows.index.duplicated()]
+        previous_positions = previous_rows.reindex(hashes).fillna(-1).to_numpy(dtype=np.int64)
+
+    changed = previous_positions < 0
+    print(f"{Fore.CYAN}Reusing {(~changed).sum()} unchanged rows, processing {changed.sum()} new or changed rows...{Style.RESET_ALL}")
+    parts, positions = [], []
+    if changed.any():
+        parts += map_chunks(df[changed].copy(), chunk_function, workers, **params)
+        positions.append(np.flatnonzero(changed))
+    if (~changed).any():
+        parts.append(previous['output'].iloc[previous_positions[~changed]])
+        positions.append(np.flatnonzero(~changed))
+
+    # Back to the row order of df
+    result = pd.concat(parts) if parts else chunk_function(df.copy(), **params)
+    if positions:
+        result = result.iloc[np.argsort(np.concatenate(positions), kind='stable')]
+    result.index = df.index
+
+    os.makedirs(os.path.dirname(row_cache) or '.', exist_ok=True)
+    pd.to_pickle({'key': key, 'row_hashes': hashes, 'output': result}, row_cache)
+    return result
+
+
+def fingerprint_frame(df):
+    # Content hash of a DataFrame: column names plus the hash of every row
+    digest = hashlib.sha256('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def stage_cache_key(input_key, stage_name, stage_function, params):
+    # The key of a stage depends on its input, its name, its parameters and the code of its module and
+    # the project modules it uses, so editing a stage or one of its helpers invalidates its cached output
+    digest = hashlib.sha256(input_key.encode('utf-8'))
+    digest.update(stage_name.encode('utf-8'))
+    # The number of workers and the row cache do not change the output, so they are left out of the key
+    params = {name: value for name, value in params.items() if name not in ('workers', 'row_cache')}
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(code_digest(stage_function).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_cache_file(cache_dir, stage_name, key, part='output'):
+    return os.path.join(cache_dir, f'{stage_name}-{key[:32]}.{part}.pkl')
+
+
+def save_stage_cache(cache_dir, stage_name, key, df, output_key, log_files):
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Keep only the latest output of each stage
+    for old_cache_file in glob.glob(os.path.join(cache_dir, f'{stage_name}-*.pkl')):
+        os.remove(old_cache_file)
+
+    # None for a declared log the stage did not write this time
+    logs = {}
+    for path in log_files:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                logs[path] = f.read()
+        else:
+            logs[path] = None
+    pd.to_pickle({'output_key': output_key, 'logs': logs}, stage_cache_file(cache_dir, stage_name, key, 'meta'))
+    df.to_pickle(stage_cache_file(cache_dir, stage_name, key))
+
+
+def restore_stage_cache(cache_dir, stage_name, key):
+    # Rewrite the log files the stage wrote when it actually ran and return the fingerprint of its output
+    meta = pd.read_pickle(stage_cache_file(cache_dir, stage_name, key, 'meta'))
+    for path, content in meta['logs'].items():
+        if content is None:
+            remove_log_files([path])
+            continue
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+    return meta['output_key']
+
+
+def remove_log_files(log_files):
+    # A stage only writes some of its logs, e.g. when there is something to report, the old ones are removed first
+    for path in log_files:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_stages(df, stages, intermediate_files=None, cache_dir=None, stage_logs=None):
+    # Run the (stage_name, stage_function, params) stages in order, passing the DataFrame in memory; intermediate_files
+    # maps a stage name to the CSV its result is saved to, stage_logs to the log files it writes. With cache_dir a
+    # stage whose input, params and code are unchanged is skipped, its output and logs come from the cache
+    intermediate_files = intermediate_files or {}
+    stage_logs = stage_logs or {}
+    input_key = fingerprint_frame(df) if cache_dir else None
+    # Cached stage whose output has not been loaded yet
+    pending_stage = None
+
+    for stage_name, stage_function, params in stages:
+        if cache_dir:
+            key = stage_cache_key(input_key, stage_name, stage_function, params)
+            if os.path.exists(stage_cache_file(cache_dir, stage_name, key)):
+                input_key = restore_stage_cache(cache_dir, stage_name, key)
+                pending_stage = (stage_name, key)
+                print(f"{Fore.GREEN}Stage '{stage_name}' unchanged, skipped.{Style.RESET_ALL}")
+
+                if stage_name in intermediate_files:
+                    df = pd.read_pickle(stage_cache_file(cache_dir, *pending_stage))
+                    pending_stage = None
+                    save_csv(df, intermediate_files[stage_name])
+                continue
+
+        # Load the output of the last skipped stage, it is the input of this one
+        if pending_stage:
+            df = pd.read_pickle(stage_cache_file(cache_dir, *pending_stage))
+            pending_stage = None
+
+        start_time = time.time()
+        remove_log_files(stage_logs.get(stage_name, []))
+        df = restore_csv_missing_values(stage_function(df, **params))
+        print(f"{Fore.CYAN}Stage '{stage_name}' finished in {time.time() - start_time:.2f} seconds.{Style.RESET_ALL}")
+
+        if cache_dir:
+            input_key = fingerprint_frame(df)
+            save_stage_cache(cache_dir, stage_name, key, df, input_key, stage_logs.get(stage_name, []))
+
+        if stage_name in intermediate_files:
+            save_csv(df, intermediate_files[stage_name])
+            print(f"{Fore.CYAN}Intermediate result of '{stage_name}' saved to: {intermediate_files[stage_name]}{Style.RESET_ALL}")
+
+    if pending_stage:
+        df = pd.read_pickle(stage_cache_file(cache_dir, *pending_stage))
+
+    return df
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style, init
+from normalize_barcodes import fixed_width_barcodes
+
+init(autoreset=True)
+
+key_dictionary_dir = 'Output/Keys'
+
+# Every key has one dictionary, shared by all its columns (the item barcodes and barcodes of the transactions
+# and the items have the same ids), and the id column written next to the key column
+KEY_ID_COLUMNS = {'barcode': 'barcode_id', 'item_number': 'item_number_id', 'customer_barcode': 'customer_id'}
+# Key of every key column of the items and the transactions
+ITEM_KEY_COLUMNS = {'barcode': 'barcode', 'item_number': 'item_number'}
+TRANSACTION_KEY_COLUMNS = {'item_barcode': 'barcode', 'customer_barcode': 'customer_barcode'}
+
+
+def build_key_dictionary(values):
+    """
+    Dictionary-encode the distinct non-missing values, ids numbered in order of first appearance. Returns a dict with:
+      values        fixed-width bytes of every key, values[id] is the key of that id
+      sorted_values the keys in sorted order, searched with np.searchsorted
+      sorted_ids    int32 id of every key of sorted_values
+    """
+    values = pd.Series(values, dtype=object)
+    distinct = pd.unique(values[values.notna() & (values != '')].astype(str))
+    return index_key_dictionary(fixed_width_barcodes(distinct))
+
+
+def index_key_dictionary(key_values):
+    sorted_ids = np.argsort(key_values, kind='stable').astype(np.int32)
+    return {'values': key_values, 'sorted_values': key_values[sorted_ids], 'sorted_ids': sorted_ids}
+
+
+def key_ids(values, key_dictionary):
+    """
+    int32 id of every value, -1 for missing values and unknown keys. The distinct values are looked up by a
+    binary search in the sorted keys, the rows take the id of their value.
+    """
+    codes, distinct = pd.factorize(pd.Series(values, dtype=object))
+    keys = fixed_width_barcodes(distinct)
+    sorted_values = key_dictionary['sorted_values']
+    distinct_ids = np.full(len(keys) + 1, -1, dtype=np.int32)  # The last one is the id of the missing values
+    if len(sorted_values):
+        positions = np.minimum(np.searchsorted(sorted_values, keys), len(sorted_values) - 1)
+        found = sorted_values[positions] == keys
+        distinct_ids[:-1][found] = key_dictionary['sorted_ids'][positions[found]]
+    return distinct_ids[codes]
+
+
+def key_values(ids, key_dictionary):
+    # Keys of the ids as strings, by an array take; NaN for -1
+    ids = np.asarray(ids, dtype=np.int64)
+    values = np.full(len(ids), np.nan, dtype=object)
+    known = ids >= 0
+    values[known] = np.char.decode(key_dictionary['values'][ids[known]], 'utf-8')
+    return values
+
+
+def key_dictionary_file(key, dictionary_dir=key_dictionary_dir):
+    return os.path.join(dictionary_dir, f'{key}.pkl.gz')
+
+
+def load_key_dictionary(key, dictionary_dir=key_dictionary_dir):
+    # The saved dictionary of the key, an empty one when none was saved yet
+    path = key_dictionary_file(key, dictionary_dir)
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+    return build_key_dictionary([])
+
+
+def assign_key_ids(values, key, dictionary_dir=key_dictionary_dir):
+    """
+    Stable int32 ids of the values: keys keep the id they got the first time they were seen, new keys get the
+    next ids and are added to the saved dictionary of the key. Missing values get -1.
+    """
+    key_dictionary = load_key_dictionary(key, dictionary_dir)
+    ids = key_ids(values, key_dictionary)
+
+    new_keys = pd.Series(values, dtype=object)[ids < 0]
+    new_keys = pd.unique(new_keys[new_keys.notna() & (new_keys != '')].astype(str))
+    if len(new_keys):
+        new_keys = fixed_width_barcodes(new_keys)
+        width = max(key_dictionary['values'].dtype.itemsize, new_keys.dtype.itemsize)
+        key_dictionary = index_key_dictionary(np.concatenate([key_dictionary['values'].astype(f'S{width}'),
+                                                              new_keys.astype(f'S{width}')]))
+        os.makedirs(dictionary_dir, exist_ok=True)
+        pd.to_pickle(key_dictionary, key_dictionary_file(key, dictionary_dir))
+        print(f"{Fore.CYAN}{len(new_keys)} new {key} keys added to {key_dictionary_file(key, dictionary_dir)} "
+              f"({len(key_dictionary['values'])} keys).{Style.RESET_ALL}")
+        ids = key_ids(values, key_dictionary)
+    return ids
+
+
+def add_key_ids(df, key_columns, dictionary_dir=key_dictionary_dir):
+    # Add the id column of every (column, key) pair of key_columns, e.g. {'item_barcode': 'barcode'}
+    for column, key in key_columns.items():
+        df[KEY_ID_COLUMNS[key]] = assign_key_ids(df[column], key, dictionary_dir)
+    return df
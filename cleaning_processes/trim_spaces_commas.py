@@ -1,43 +1,97 @@
 import pandas as pd
 import csv
 from colorama import Fore, Style, init
-import re  # Import regex module to handle multi-space replacements
+import re  # For finding the values that need the translation table
+from collections import Counter
+from pipeline import map_changed_rows, read_csv_chunks, write_csv_chunks  # For reusing the trimmed rows of the previous run and streaming
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
+# Columns for which leading and trailing spaces should be trimmed
+COLUMNS_TO_TRIM = [
+    "en_full_description", "ar_full_description",
+    "en_short_desc", "ar_short_desc", "brand",
+    "category_level1", "category_level2", "category_level3", "category_level4"
+]
+
+# Non-breaking spaces and newlines become spaces, backticks and acute accents are removed
+TEXT_TRANSLATION = str.maketrans({'\u00A0': ' ', '\n': ' ', '\r': ' ', '`': None, '´': None})
+# translate() looks up every character of the value, so it only runs on values holding one of these
+TRANSLATED_CHARACTERS = re.compile('[\u00A0\n\r`´]')
+
+def normalize_text(value):
+    # Translate the characters, then trim and collapse whitespace runs into one space
+    if TRANSLATED_CHARACTERS.search(value):
+        value = value.translate(TEXT_TRANSLATION)
+    return ' '.join(value.split())
+
+def trim_text_columns(df):
+    # Normalize each specified column, counting the values that changed (missing values are left out)
+    changes = {}
+    for column in COLUMNS_TO_TRIM:
+        if column in df.columns:
+            values = df[column]
+            present = values.notna().to_numpy()
+            normalized = values.to_numpy(dtype=object, copy=True)
+            normalized[present] = [normalize_text(value) for value in normalized[present]]
+            normalized = pd.Series(normalized, index=df.index, dtype=object)
+            changes[column] = int((present & (normalized != values)).sum())
+            df[column] = normalized
+    return df, changes
+
+def print_changes(changes):
+    for column, count in changes.items():
+        print(f"{Fore.CYAN}{column}: {count} values changed{Style.RESET_ALL}")
+
 # Function to trim leading/trailing spaces, remove commas, semicolons, newlines, and ensure no multi-spaces
-def trim_spaces_commas(input_file_path, output_file_path):
+def trim_spaces_commas_chunk(df):
+    df, changes = trim_text_columns(df)
+    print_changes(changes)
+    return df
+
+def trim_spaces_commas_df(df, row_cache=None):
     print(f"{Fore.BLUE}Starting the trimming process for specified columns...{Style.RESET_ALL}")
 
+    # Every row is trimmed on its own, so with a row cache only the new or changed rows are trimmed again
+    return map_changed_rows(df, trim_spaces_commas_chunk, row_cache=row_cache)
+
+def trim_spaces_commas_streaming(input_file_path, output_file_path, chunksize):
+    # Read, trim and write chunksize rows at a time, so memory is bounded by the chunk size instead of the file size
+    changes = Counter()
+
+    def trimmed_chunks():
+        for chunk in read_csv_chunks(input_file_path, chunksize):
+            chunk, chunk_changes = trim_text_columns(chunk)
+            changes.update(chunk_changes)
+            yield chunk
+
+    write_csv_chunks(trimmed_chunks(), output_file_path)
+    print_changes(changes)
+
+def trim_spaces_commas(input_file_path, output_file_path, chunksize=None):
+    # With chunksize the file is streamed in chunks of that many rows instead of being loaded whole
+    if chunksize:
+        try:
+            print(f"{Fore.CYAN}Trimming {input_file_path} in chunks of {chunksize} rows...{Style.RESET_ALL}")
+            trim_spaces_commas_streaming(input_file_path, output_file_path, chunksize)
+            print(f"{Fore.GREEN}Trimming is finished. Cleaned data saved to: {output_file_path}{Style.RESET_ALL}")
+        except Exception as e:
+            print(f"{Fore.RED}Error trimming file: {e}{Style.RESET_ALL}")
+        return
+
     # Step 1: Load the data from the provided input file
     try:
-        df = pd.read_csv(input_file_path,dtype=str)
+        df = pd.read_csv(input_file_path, encoding='utf-8-sig', dtype=str)
         print(f"{Fore.CYAN}Data successfully loaded from: {input_file_path}{Style.RESET_ALL}")
     except Exception as e:
         print(f"{Fore.RED}Error loading file: {e}{Style.RESET_ALL}")
         return
 
-    # Step 2: Define the columns for which leading and trailing spaces should be trimmed
-    columns_to_trim = [
-        "en_full_description", "ar_full_description",  
-         "en_short_desc", "ar_short_desc", "brand"
-        "category_level1", "category_level2", "category_level3", "category_level4"
-    ]
+    # Step 2: Trim spaces, remove commas, semicolons, newlines, and handle multi-spaces
+    df = trim_spaces_commas_df(df)
 
-    # Step 3: Process each specified column to trim spaces, remove commas, semicolons, newlines, and handle multi-spaces
-    for column in columns_to_trim:
-        if column in df.columns:
-            print(f"{Fore.CYAN}Processing column: {column}...{Style.RESET_ALL}")
-            # Clean column: remove non-breaking spaces, commas, semicolons, newlines, trim, and handle multiple spaces
-            df[column] = (df[column].astype(str)
-                          .str.replace('\u00A0', ' ')  # Replace non-breaking spaces with normal spaces                        
-                          .str.replace('\n', ' ').str.replace('\r', ' ')  # Remove newlines
-                          .str.replace('`', '').str.replace('´', '')  # Remove commas and semicolons
-                          .str.strip()  # Remove leading/trailing spaces
-                          .str.replace(r'\s+', ' ', regex=True))  # Replace multiple spaces with a single space
-
-    # Step 4: Save the cleaned DataFrame to the output CSV file
+    # Step 3: Save the cleaned DataFrame to the output CSV file
     try:
         print(f"{Fore.CYAN}Saving the cleaned data to: {output_file_path}{Style.RESET_ALL}")
         df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
@@ -1,65 +1,58 @@
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 from colorama import Fore, Style, init
 import csv
 import time
 import os
+from surrogate_keys import build_key_dictionary, key_ids  # Dictionary-encoded barcodes for the join
 
 # Initialize colorama
 init(autoreset=True)
 
-def update_transactions(transactions_file,cleaned_with_max_barcode_file, items_file, output_updated_transactions_file_path):
-    start_time = time.time()
-
-    # Load the transactions and items data
-    print(f"{Fore.YELLOW}Loading transactions and items files...\n")
-    transactions_df = pd.read_csv(transactions_file, dtype=str, low_memory=False)
-    items_df = pd.read_csv(cleaned_with_max_barcode_file, dtype=str, low_memory=False)
-
-    
+# Drop the transactions whose item_barcode is not in items_df and move the others to their MAX_barcode, then deduplicate
+# the items; returns (transactions_df, deduplicated_items).
+# Logs/not_found_items.csv has an item_barcode header and every barcode of the dropped transactions once, in the order
+# they first appear, without missing barcodes; it is only written when a transaction was dropped. (The loop before
+# the vectorized remap looked for them after the dropping and so never found one, the file was never written.)
+def update_transactions_df(transactions_df, items_df):
     # Step 1: Remove transactions that do not have a corresponding item_barcode in cleaned_with_max_barcode_file
     initial_transaction_count = transactions_df.shape[0]
-    valid_barcodes = set(items_df['barcode'])
+    # The item barcodes are dictionary-encoded, the transactions find their item by a binary search on the sorted keys
+    item_keys = build_key_dictionary(items_df['barcode'])
+    barcode_ids = key_ids(transactions_df['item_barcode'], item_keys)
 
     # This line was incorrect because it used ~ to filter out matching barcodes, instead it should keep matching barcodes
-    transactions_df = transactions_df[transactions_df['item_barcode'].isin(valid_barcodes)]
+    found = barcode_ids >= 0
+    # The item_barcodes not found in cleaned_with_max_barcode_file are logged, once each
+    not_found_items = transactions_df.loc[~found, 'item_barcode'].dropna().unique()
+    transactions_df = transactions_df[found]
+    barcode_ids = barcode_ids[found]
     removed_transaction_count = initial_transaction_count - transactions_df.shape[0]
 
     print(f"{Fore.RED}Total removed transactions that do not exist in items file: {removed_transaction_count}\n")
 
-
-
-    # Step 2: Update the item_barcode in the transactions file based on the barcode from the items file
-    # Prepare a log for not found items
-    not_found_items = []
-
-    # Create a dictionary for faster lookups from the items file
-    barcode_to_max_barcode = pd.Series(items_df.MAX_barcode.values, index=items_df.barcode).to_dict()
-    print(f"{Fore.YELLOW}Updating transactions file with MAX_barcode...\n")
-    total_affected = 0
-
-    for index, row in tqdm(transactions_df.iterrows(), total=transactions_df.shape[0], desc="Processing transactions", ncols=100):
-        item_barcode = row['item_barcode']
-        # Check if item_barcode exists in barcode_to_max_barcode dictionary
-        if item_barcode in barcode_to_max_barcode:
-            transactions_df.at[index, 'item_barcode'] = barcode_to_max_barcode[item_barcode]
-            total_affected += 1
-        # If the item_barcode is not found in cleaned_with_max_barcode_file, log it
-        elif item_barcode not in items_df['barcode'].values:
-            not_found_items.append(item_barcode)
-
-    # Step 3: Write not found items to a log
-    if not_found_items:
+    # Write not found items to a log
+    if len(not_found_items):
         print(f"{Fore.RED}Writing not found items to logs/not_found_items.csv...\n")
         with open('Logs/not_found_items.csv', 'w', newline='', encoding='utf-8-sig') as log_file:
             writer = csv.writer(log_file)
             writer.writerow(['item_barcode'])  # Column header
-            for item in set(not_found_items):  # Using set to remove duplicates before writing to file
-                writer.writerow([item])
+            writer.writerows([item] for item in not_found_items)
 
-    # Step 4: Save the updated transactions file
-    print(f"{Fore.GREEN}Saving the updated transactions file...\n")
-    transactions_df.to_csv(output_updated_transactions_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
+
+    # Step 2: Update the item_barcode in the transactions file based on the barcode from the items file
+    # MAX_barcode of every barcode id, the last row wins for repeated barcodes like the dictionary did
+    item_ids = key_ids(items_df['barcode'], item_keys)
+    last_rows = ~items_df['barcode'].duplicated(keep='last').to_numpy() & (item_ids >= 0)
+    max_barcodes = np.empty(len(item_keys['values']), dtype=object)
+    max_barcodes[item_ids[last_rows]] = items_df['MAX_barcode'].to_numpy()[last_rows]
+    print(f"{Fore.YELLOW}Updating transactions file with MAX_barcode...\n")
+
+    # Remap all found barcodes at once by an array take on their ids
+    transactions_df = transactions_df.copy()
+    transactions_df['item_barcode'] = max_barcodes[barcode_ids]
+    total_affected = len(barcode_ids)
 
     print(f"{Fore.CYAN}Total affected records in transactions: {total_affected}\n")
 
@@ -77,6 +70,22 @@ def update_transactions(transactions_file,cleaned_with_max_barcode_file, items_f
         print(f"{Fore.RED}Writing deleted records to logs/deleted_items.csv...\n")
         deleted_records.to_csv('logs/deleted_items.csv', index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
 
+    return transactions_df, deduplicated_items
+
+def update_transactions(transactions_file,cleaned_with_max_barcode_file, items_file, output_updated_transactions_file_path):
+    start_time = time.time()
+
+    # Load the transactions and items data
+    print(f"{Fore.YELLOW}Loading transactions and items files...\n")
+    transactions_df = pd.read_csv(transactions_file, dtype=str, low_memory=False)
+    items_df = pd.read_csv(cleaned_with_max_barcode_file, dtype=str, low_memory=False)
+
+    transactions_df, deduplicated_items = update_transactions_df(transactions_df, items_df)
+
+    # Step 4: Save the updated transactions file
+    print(f"{Fore.GREEN}Saving the updated transactions file...\n")
+    transactions_df.to_csv(output_updated_transactions_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC, encoding='utf-8-sig')
+
     # Save the deduplicated items file
     print(f"{Fore.GREEN} Saving deduplicated items/products file to {items_file}...\n")
     deduplicated_items.to_csv(items_file, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8-sig')
@@ -0,0 +1,100 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+# Format of the transaction timestamps (dd/MM/yyyy HH:mm:ss), the same one the analysis scripts parse
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Size of the blocks the input file is hashed in
+HASH_BLOCK_BYTES = 1 << 20
+
+
+def watermark_file(output_file_path):
+    # The watermark is kept alongside the output it describes
+    return f'{output_file_path}.watermark.json'
+
+
+def load_watermark(output_file_path):
+    if not os.path.exists(watermark_file(output_file_path)):
+        return None
+    with open(watermark_file(output_file_path), encoding='utf-8') as mark_file:
+        return json.load(mark_file)
+
+
+def save_watermark(output_file_path, watermark):
+    with open(watermark_file(output_file_path), 'w', encoding='utf-8') as mark_file:
+        json.dump(watermark, mark_file, indent=2)
+
+
+def prefix_hash(file_path, offset):
+    # Hash of all the bytes before offset, so an edit anywhere before the mark is noticed
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as input_file:
+        while offset > 0:
+            block = input_file.read(min(HASH_BLOCK_BYTES, offset))
+            if not block:
+                break
+            digest.update(block)
+            offset -= len(block)
+    return digest.hexdigest()
+
+
+def transaction_order(df):
+    # (timestamp, invoice_id) of every row, the order the watermark is compared in
+    timestamps = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT, errors='coerce')
+    invoice_ids = pd.to_numeric(df['invoice_id'], errors='coerce')
+    return timestamps, invoice_ids
+
+
+def advance_watermark(input_file_path, file_bytes, watermark, new_rows_df, **extra):
+    """Watermark after new_rows_df was processed up to file_bytes of input_file_path; extra values are stored with it."""
+    last_timestamp = pd.Timestamp(watermark['last_timestamp']) if watermark else pd.NaT
+    last_invoice_id = watermark['last_invoice_id'] if watermark else None
+
+    timestamps, invoice_ids = transaction_order(new_rows_df)
+    if timestamps.notna().any():
+        newest = timestamps.max()
+        if pd.isna(last_timestamp) or newest > last_timestamp:
+            last_timestamp, last_invoice_id = newest, None
+        if newest == last_timestamp:
+            newest_invoice_id = invoice_ids[timestamps == newest].max()
+            if pd.notna(newest_invoice_id) and (last_invoice_id is None or newest_invoice_id > last_invoice_id):
+                last_invoice_id = newest_invoice_id
+
+    return {
+        'input_file': input_file_path,
+        'bytes': file_bytes,
+        'prefix_hash': prefix_hash(input_file_path, file_bytes),
+        'rows': (watermark['rows'] if watermark else 0) + len(new_rows_df),
+        'last_timestamp': None if pd.isna(last_timestamp) else last_timestamp.isoformat(),
+        'last_invoice_id': None if last_invoice_id is None else float(last_invoice_id),
+        **extra,
+    }
+
+
+def appended_since(input_file_path, watermark):
+    # True when input_file_path still starts with the bytes the watermark was taken on, watermarks written before
+    # the prefix hash count as rewritten
+    return (watermark['bytes'] <= os.path.getsize(input_file_path) and 'prefix_hash' in watermark
+            and prefix_hash(input_file_path, watermark['bytes']) == watermark['prefix_hash'])
+
+
+def read_new_rows(input_file_path, watermark, **read_csv_params):
+    """
+    Rows of the append-only CSV input_file_path added since the watermark; returns (new_rows_df, file_bytes).
+
+    The reading starts at the byte offset of the watermark, so only the new rows are parsed. The rows are not
+    assumed to be in time order, so a file that was rewritten since the watermark (see appended_since) has no
+    new rows to tell apart and raises ValueError, the callers run in full instead.
+    """
+    if not appended_since(input_file_path, watermark):
+        raise ValueError(f"{input_file_path} was rewritten since the watermark, it has to be processed in full.")
+    file_bytes = os.path.getsize(input_file_path)
+    columns = pd.read_csv(input_file_path, nrows=0, encoding='utf-8-sig').columns
+
+    if watermark['bytes'] == file_bytes:
+        return pd.DataFrame(columns=columns, dtype=str), file_bytes
+    with open(input_file_path, 'rb') as input_file:
+        input_file.seek(watermark['bytes'])
+        return pd.read_csv(input_file, header=None, names=columns, **read_csv_params), file_bytes
@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import sys
 from colorama import Fore, Style, init
+from excel_snapshot import read_excel_snapshot
+from excel_stream import iter_excel_batches
 
 init(autoreset=True)
 
@@ -9,8 +11,33 @@ EXCEL_PATH = 'data/FARM_ITEM_MASTE_FILE.xlsx'
 CSV_PATH = 'data/ml_transactions.csv'
 OUTPUT_DIR = 'out'
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'missing_products.txt')
+CHUNK_SIZE = 1000000  # Transaction rows read at a time
 
-def find_missing_products():
+def read_excel_barcodes(stream=False):
+    # Set of stripped barcodes of the item master; stream=True reads the workbook in batches with bounded memory
+    if not stream:
+        df_excel = read_excel_snapshot(EXCEL_PATH, columns=['barcode'], dtype={'barcode': str})
+        return set(df_excel['barcode'].dropna().str.strip())
+    barcodes = set()
+    for batch in iter_excel_batches(EXCEL_PATH, columns=['barcode'], dtype={'barcode': str}):
+        barcodes.update(batch['barcode'].dropna().str.strip())
+    return barcodes
+
+def find_missing_product_ids(excel_barcodes, chunksize=CHUNK_SIZE):
+    """
+    Product IDs of the transactions that are not in excel_barcodes. Only the product_id column is read, chunksize
+    rows at a time, so memory stays flat however long the transaction history is; chunksize=None reads it at once.
+    """
+    # Hash index of the barcodes, every chunk is looked up in one vectorized call
+    barcode_lookup = pd.Index(list(excel_barcodes), dtype=object)
+    missing = set()
+    chunks = pd.read_csv(CSV_PATH, usecols=['product_id'], dtype={'product_id': str}, chunksize=chunksize)
+    for chunk in ([chunks] if chunksize is None else chunks):
+        product_ids = chunk['product_id'].dropna().str.strip()
+        missing.update(product_ids[~product_ids.isin(barcode_lookup)].unique())
+    return missing
+
+def find_missing_products(stream=False, chunksize=CHUNK_SIZE):
     print(Fore.CYAN + "Starting comparison...")
     
     # Ensure the output directory exists
@@ -19,19 +46,13 @@ def find_missing_products():
     
     try:
         # Read the Excel and CSV files, treating barcodes and product IDs as strings
-        df_excel = pd.read_excel(EXCEL_PATH, dtype={'barcode': str})
-        df_csv = pd.read_csv(CSV_PATH, dtype={'product_id': str})
+        excel_barcodes = read_excel_barcodes(stream)
+        # Find missing product IDs in the CSV that are not in the Excel file
+        missing = find_missing_product_ids(excel_barcodes, chunksize)
     except Exception as e:
         print(Fore.RED + f"Error reading files: {e}")
         sys.exit(1)
     
-    # Get sets of barcodes and product IDs
-    excel_barcodes = set(df_excel['barcode'].dropna().str.strip())
-    csv_product_ids = set(df_csv['product_id'].dropna().str.strip())
-    
-    # Find missing product IDs in the CSV that are not in the Excel file
-    missing = csv_product_ids - excel_barcodes
-    
     if missing:
         # Write missing product IDs to the output file, quoted and with the column name
         with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
@@ -45,4 +66,7 @@ def find_missing_products():
     print(Fore.CYAN + "Comparison completed.")
 
 if __name__ == "__main__":
-    find_missing_products()
+    # --stream reads the item master in batches instead of loading the whole workbook
+    # --chunksize=N sets the transaction rows read at a time, --chunksize=0 reads them at once
+    chunksize = next((int(arg.split('=', 1)[1]) for arg in sys.argv if arg.startswith('--chunksize=')), CHUNK_SIZE)
+    find_missing_products(stream='--stream' in sys.argv, chunksize=chunksize or None)
@@ -6,7 +6,13 @@ from tqdm import tqdm
 # Function to load data
 def load_data(file_path):
     print(f"Loading data from {file_path}...")
-    return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    transactions_df = pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    # customer_id is the stable integer key of customer_barcode written by the cleanup, the customer group-bys run on it
+    if 'customer_id' not in transactions_df.columns:
+        raise ValueError(f"{file_path} has no customer_id column, run the full cleanup process to add it.")
+    # Missing customer barcodes have the id -1, those transactions belong to no customer like a missing barcode
+    transactions_df['customer_id'] = transactions_df['customer_id'].astype('int32').replace(-1, pd.NA).astype('Int32')
+    return transactions_df
 
 # Function to calculate customer features and create a pivot table
 def create_customer_feature_table(transactions_df, output_file):
@@ -27,7 +33,8 @@ def create_customer_feature_table(transactions_df, output_file):
 
     # Progress bar for groupby operations
     print("Calculating customer statistics...")
-    customer_stats = transactions_df.groupby('customer_barcode').agg(
+    customer_stats = transactions_df.groupby('customer_id').agg(
+        customer_barcode=('customer_barcode', 'first'),       # Barcode of the customer
         total_orders=('invoice_id', 'nunique'),                # Total number of unique orders
         total_items=('quantity', 'sum'),                      # Total number of items purchased
         total_spent=('amount', 'sum'),                        # Total money spent
@@ -58,14 +65,14 @@ def create_customer_feature_table(transactions_df, output_file):
 
     # Calculate Monthly Spending Mean and Std
     print("Calculating monthly spending statistics...")
-    monthly_spending = transactions_df.groupby(['customer_barcode', 'month'])['amount'].sum().reset_index()
-    monthly_spending_stats = monthly_spending.groupby('customer_barcode').agg(
+    monthly_spending = transactions_df.groupby(['customer_id', 'month'])['amount'].sum().reset_index()
+    monthly_spending_stats = monthly_spending.groupby('customer_id').agg(
         monthly_spending_mean=('amount', 'mean'),
         monthly_spending_std=('amount', 'std')
     ).reset_index()
 
     # Merge monthly spending statistics into customer_stats
-    customer_stats = pd.merge(customer_stats, monthly_spending_stats, on='customer_barcode', how='left')
+    customer_stats = pd.merge(customer_stats, monthly_spending_stats, on='customer_id', how='left')
 
     # Spending Trend (Linear regression over monthly spending)
     print("Calculating spending trend...")
@@ -77,8 +84,8 @@ def create_customer_feature_table(transactions_df, output_file):
         else:
             return 0  # No trend if only one data point
 
-    spending_trend = monthly_spending.groupby('customer_barcode').apply(calculate_spending_trend).reset_index(name='spending_trend')
-    customer_stats = pd.merge(customer_stats, spending_trend, on='customer_barcode', how='left')
+    spending_trend = monthly_spending.groupby('customer_id').apply(calculate_spending_trend).reset_index(name='spending_trend')
+    customer_stats = pd.merge(customer_stats, spending_trend, on='customer_id', how='left')
 
     # Determine the favorite category (most purchased)
     # if 'category_name' in transactions_df.columns:
@@ -99,7 +106,7 @@ def create_customer_feature_table(transactions_df, output_file):
     transactions_df['week'] = transactions_df['timestamp'].dt.isocalendar().week
 
     # Group weekly purchases for trend analysis
-    weekly_purchase_trend = transactions_df.groupby(['customer_barcode', 'week']).size().reset_index(name='purchases_per_week')
+    weekly_purchase_trend = transactions_df.groupby(['customer_id', 'week']).size().reset_index(name='purchases_per_week')
 
     # Remove any rows with missing or non-numeric data in the trend analysis
     weekly_purchase_trend = weekly_purchase_trend.dropna(subset=['week', 'purchases_per_week'])
@@ -115,16 +122,16 @@ def create_customer_feature_table(transactions_df, output_file):
         else:
             return 0  # No trend if only one data point
 
-    trend = weekly_purchase_trend.groupby('customer_barcode').apply(calculate_trend)
+    trend = weekly_purchase_trend.groupby('customer_id').apply(calculate_trend)
     customer_stats['purchase_trend'] = trend.apply(lambda x: 'Upward' if x > 0 else ('Downward' if x < 0 else 'Stable')).values
 
     # Calculate time between purchases for each customer
     print("Calculating time between purchases...")
-    transactions_df = transactions_df.sort_values(by=['customer_barcode', 'timestamp'])
-    transactions_df['time_diff'] = transactions_df.groupby('customer_barcode')['timestamp'].diff().dt.days
+    transactions_df = transactions_df.sort_values(by=['customer_id', 'timestamp'])
+    transactions_df['time_diff'] = transactions_df.groupby('customer_id')['timestamp'].diff().dt.days
 
-    avg_time_between_purchases = transactions_df.groupby('customer_barcode')['time_diff'].mean().reset_index()
-    customer_stats = pd.merge(customer_stats, avg_time_between_purchases, on='customer_barcode', how='left')
+    avg_time_between_purchases = transactions_df.groupby('customer_id')['time_diff'].mean().reset_index()
+    customer_stats = pd.merge(customer_stats, avg_time_between_purchases, on='customer_id', how='left')
     customer_stats.rename(columns={'time_diff': 'avg_time_between_purchases'}, inplace=True)
 
     # Segmentation (Based on Z-scores and important metrics)
@@ -142,7 +149,7 @@ def create_customer_feature_table(transactions_df, output_file):
 
     # Rearrange the columns in a more logical order
     customer_stats = customer_stats[[
-        'customer_barcode', 'first_purchase', 'last_purchase', 'customer_lifetime', 
+        'customer_id', 'customer_barcode', 'first_purchase', 'last_purchase', 'customer_lifetime', 
         'total_orders', 'order_segment', 'frequency', 'frequency_zscore', 'frequency_segment', 'is_high_frequency_customer',
         'total_items', 'unique_products_purchased', 'average_quantity_per_order', 
         'total_spent', 'average_order_value', 'average_spend_per_item', 'monetary', 'monetary_zscore', 'monetary_segment', 'is_high_value_customer', 
@@ -5,11 +5,17 @@ import os
 
 # Function to load data (similar to your previous analysis script)
 def load_data(file_path):
-    return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    transactions_df = pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    # customer_id is the stable integer key of customer_barcode written by the cleanup, the customer group-bys run on it
+    if 'customer_id' not in transactions_df.columns:
+        raise ValueError(f"{file_path} has no customer_id column, run the full cleanup process to add it.")
+    # Missing customer barcodes have the id -1, those transactions belong to no customer like a missing barcode
+    transactions_df['customer_id'] = transactions_df['customer_id'].astype('int32').replace(-1, pd.NA).astype('Int32')
+    return transactions_df
 
 # Plot 1: Repeat Purchase Rate Histogram
 def plot_repeat_purchase_rate(transactions_df, output_dir):
-    repeat_customers = transactions_df.groupby('customer_barcode')['invoice_id'].nunique().reset_index()
+    repeat_customers = transactions_df.groupby('customer_id')['invoice_id'].nunique().reset_index()
     repeat_customers['repeat_flag'] = repeat_customers['invoice_id'] > 1
 
     sns.countplot(x='repeat_flag', data=repeat_customers, palette='Set2')
@@ -24,7 +30,7 @@ def plot_repeat_purchase_rate(transactions_df, output_dir):
 
 # Plot 2: Customer Segmentation Pie Chart
 def plot_customer_segmentation(transactions_df, output_dir):
-    segmentation = transactions_df.groupby('customer_barcode').agg(order_count=('invoice_id', 'nunique')).reset_index()
+    segmentation = transactions_df.groupby('customer_id').agg(order_count=('invoice_id', 'nunique')).reset_index()
     segmentation['segment'] = pd.cut(segmentation['order_count'], bins=[0, 1, 5, 10, float('inf')], labels=['One-time', 'Low', 'Medium', 'High'])
     
     segment_distribution = segmentation['segment'].value_counts(normalize=True) * 100
@@ -54,7 +60,7 @@ def plot_average_order_value(transactions_df, output_dir):
 
 # Plot 4: Product Affinity Heatmap (Correlations Between Products)
 def plot_product_affinity(transactions_df, output_dir):
-    affinity = transactions_df.groupby('customer_barcode')['item_barcode'].apply(lambda x: list(x)).reset_index()
+    affinity = transactions_df.groupby('customer_id')['item_barcode'].apply(lambda x: list(x)).reset_index()
     all_combinations = pd.DataFrame(
         [(a, b) for items in affinity['item_barcode'] for a in items for b in items if a != b], 
         columns=['item_a', 'item_b']
@@ -107,7 +113,7 @@ def plot_sales_frequency(transactions_df, output_dir):
 # New Plot 7: Customer Distribution by Total Quantity Purchased
 def plot_customer_distribution_by_quantity(transactions_df, output_dir):
     transactions_df['quantity'] = transactions_df['quantity'].astype(int)
-    quantity_per_customer = transactions_df.groupby('customer_barcode')['quantity'].sum().reset_index()
+    quantity_per_customer = transactions_df.groupby('customer_id')['quantity'].sum().reset_index()
 
     plt.figure(figsize=(10, 6))
     sns.histplot(quantity_per_customer['quantity'], bins=20, kde=True, color='purple')
@@ -125,7 +131,7 @@ def plot_customer_distribution_by_spend(transactions_df, output_dir):
     transactions_df['unit_price'] = transactions_df['unit_price'].astype(float)
     transactions_df['amount'] = transactions_df['quantity'] * transactions_df['unit_price']
     
-    spend_per_customer = transactions_df.groupby('customer_barcode')['amount'].sum().reset_index()
+    spend_per_customer = transactions_df.groupby('customer_id')['amount'].sum().reset_index()
 
     plt.figure(figsize=(10, 6))
     sns.histplot(spend_per_customer['amount'], bins=20, kde=True, color='green')
@@ -1,37 +1,72 @@
 import pandas as pd
+import numpy as np
 import os
 
+CATEGORY_LEVELS = ['category_level1', 'category_level2', 'category_level3', 'category_level4']
+
 def load_data(file_path):
     print("Loading transactions data...")
     # Force all columns to be treated as strings
-    return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    transactions_df = pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    # customer_id is the stable integer key of customer_barcode written by the cleanup, the customer group-bys run on it
+    if 'customer_id' not in transactions_df.columns:
+        raise ValueError(f"{file_path} has no customer_id column, run the full cleanup process to add it.")
+    # Missing customer barcodes have the id -1, those transactions belong to no customer like a missing barcode
+    transactions_df['customer_id'] = transactions_df['customer_id'].astype('int32').replace(-1, pd.NA).astype('Int32')
+    return transactions_df
 
 def load_products(file_path):
     print("Loading products data...")
     # Force all columns to be treated as strings
     return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
 
-def merge_transactions_with_products(transactions_df, products_df):
+def load_category_tree(file_path):
+    # Category tree written by the cleanup process (cleaning_processes/category_tree.py), None when there is none
+    if not os.path.exists(file_path):
+        return None
+    print("Loading category tree...")
+    return pd.read_pickle(file_path)
+
+def add_category_levels(transactions_df, category_tree):
+    # Every level is an array lookup from the leaf category of the transaction: its ancestor at that level, then the node name
+    category_ids = transactions_df['category_id'].astype(int).to_numpy()
+    known = category_ids >= 0
+    names = category_tree['nodes']['name'].to_numpy(dtype=object)
+    for depth, level in enumerate(CATEGORY_LEVELS):
+        level_names = np.full(len(category_ids), np.nan, dtype=object)
+        level_names[known] = names[category_tree['ancestors'][category_ids[known], depth]]
+        transactions_df[level] = level_names
+    return transactions_df
+
+def merge_transactions_with_products(transactions_df, products_df, category_tree=None):
     print("Merging transactions with product data...")
     
     # Ensure 'item_barcode' in transactions_df and 'barcode' in products_df are strings and clean any potential whitespace
     transactions_df['item_barcode'] = transactions_df['item_barcode'].str.strip()
-    products_df['barcode'] = products_df['barcode'].str.strip()
-    
-    # Merge the DataFrames on 'item_barcode' and 'barcode'
-    merged_df = pd.merge(transactions_df, products_df[['barcode', 'category_level1', 'category_level2', 'category_level3', 'category_level4']], 
-                         left_on='item_barcode', right_on='barcode', how='left')
+
+    # Transactions with a leaf category get their category levels from the category tree, without a merge
+    if category_tree is not None and 'category_id' in transactions_df.columns:
+        merged_df = add_category_levels(transactions_df, category_tree)
+    else:
+        products_df['barcode'] = products_df['barcode'].str.strip()
+
+        # The product of every transaction by one lookup in the barcode index, NaN for barcodes without a product
+        # (the cleaned products have one row per barcode)
+        products_df = products_df.drop_duplicates(subset='barcode')
+        products = products_df.set_index('barcode', drop=False)[['barcode'] + CATEGORY_LEVELS]
+        matched = products.reindex(transactions_df['item_barcode'])
+        merged_df = transactions_df.copy()
+        for column in matched.columns:
+            merged_df[column] = matched[column].to_numpy()
     
     # Check for missing category values after merge
-    missing_categories = merged_df[['category_level1', 'category_level2', 'category_level3', 'category_level4']].isnull().any(axis=1).sum()
+    missing_categories = merged_df[CATEGORY_LEVELS].isnull().any(axis=1).sum()
     
     if missing_categories > 0:
         print(f"Warning: {missing_categories} transactions do not have a matching category.")
         print("Sample of missing item_barcode values:")
-        print(merged_df[merged_df['category_level1'].isnull()]['item_barcode'].head(10))  # Display first 10 missing barcodes
-        print(merged_df[merged_df['category_level2'].isnull()]['item_barcode'].head(10))  # Display first 10 missing barcodes
-        print(merged_df[merged_df['category_level3'].isnull()]['item_barcode'].head(10))  # Display first 10 missing barcodes
-        print(merged_df[merged_df['category_level4'].isnull()]['item_barcode'].head(10))  # Display first 10 missing barcodes
+        for level in CATEGORY_LEVELS:
+            print(merged_df[merged_df[level].isnull()]['item_barcode'].head(10))  # Display first 10 missing barcodes
 
 
     
@@ -43,7 +78,7 @@ def write_to_report(report_file, content):
         f.write(content + '\n\n')  # Add spaces between sections
 
 def get_basic_statistics(transactions_df, report_file):
-    total_customers = transactions_df['customer_barcode'].nunique()
+    total_customers = transactions_df['customer_id'].nunique()
     total_products = transactions_df['item_barcode'].nunique()
     total_transactions = len(transactions_df)
     
@@ -56,15 +91,15 @@ def get_basic_statistics(transactions_df, report_file):
 
 def calculate_average_transactions_per_customer(transactions_df, report_file):
     total_transactions = len(transactions_df)
-    total_customers = transactions_df['customer_barcode'].nunique()
+    total_customers = transactions_df['customer_id'].nunique()
     avg_transactions_per_customer = total_transactions / total_customers
     
     output = (f"Average number of transactions per customer: {avg_transactions_per_customer:.2f}\n")
     write_to_report(report_file, output)
 
 def calculate_mode_transactions_per_customer(transactions_df, report_file):
-    customer_purchase_counts = transactions_df.groupby('customer_barcode')['item_barcode'].count().reset_index()
-    customer_purchase_counts.columns = ['customer_barcode', 'total_purchases']
+    customer_purchase_counts = transactions_df.groupby('customer_id')['item_barcode'].count().reset_index()
+    customer_purchase_counts.columns = ['customer_id', 'total_purchases']
     
     mode_transactions = customer_purchase_counts['total_purchases'].mode()[0]
     num_customers_with_mode_transactions = customer_purchase_counts[customer_purchase_counts['total_purchases'] == mode_transactions].shape[0]
@@ -80,7 +115,7 @@ def calculate_mode_transactions_per_customer(transactions_df, report_file):
     write_to_report(report_file, output)
 
 def analyze_customer_purchases(transactions_df, report_file):
-    customer_product_counts = transactions_df.groupby('customer_barcode')['item_barcode'].nunique()
+    customer_product_counts = transactions_df.groupby('customer_id')['item_barcode'].nunique()
     multiple_purchases_count = customer_product_counts[customer_product_counts > 1].count()
     
     output = (f"--- Customer Purchases ---\n"
@@ -101,8 +136,8 @@ def analyze_top_customers_and_products(transactions_df, report_file):
     write_to_report(report_file, output)
 
 def analyze_customers_with_less_than_5_purchases(transactions_df, report_file):
-    customer_purchase_counts = transactions_df.groupby('customer_barcode')['item_barcode'].count().reset_index()
-    customer_purchase_counts.columns = ['customer_barcode', 'total_purchases']
+    customer_purchase_counts = transactions_df.groupby('customer_id')['item_barcode'].count().reset_index()
+    customer_purchase_counts.columns = ['customer_id', 'total_purchases']
     
     customers_less_than_5 = customer_purchase_counts[customer_purchase_counts['total_purchases'] < 5]
     count_customers_less_than_5 = len(customers_less_than_5)
@@ -183,6 +218,7 @@ def analyze_sales_by_category(transactions_df, report_file):
 def main():
     transactions_file_path = os.path.join('output', 'Cleaned_ml_transactions_outbox_non_relevant.csv')
     products_file_path = os.path.join('output', 'Cleaned_ml_items.csv')
+    category_tree_path = os.path.join('output', 'category_tree.pkl.gz')
     output_dir = 'Reports'
     
     if not os.path.exists(output_dir):
@@ -195,10 +231,14 @@ def main():
     
     # Load data
     transactions_df = load_data(transactions_file_path)
-    products_df = load_products(products_file_path)
+    category_tree = load_category_tree(category_tree_path)
+    # The products are only needed for transactions without a leaf category
+    products_df = None
+    if category_tree is None or 'category_id' not in transactions_df.columns:
+        products_df = load_products(products_file_path)
     
     # Merge transactions with product data
-    transactions_with_category = merge_transactions_with_products(transactions_df, products_df)
+    transactions_with_category = merge_transactions_with_products(transactions_df, products_df, category_tree)
     
     # Perform analysis and write output to the report
     get_basic_statistics(transactions_with_category, report_file)
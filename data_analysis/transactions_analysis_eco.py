@@ -3,7 +3,13 @@ import os
 
 def load_data(file_path):
     # Load transactions data with appropriate column names
-    return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    transactions_df = pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    # customer_id is the stable integer key of customer_barcode written by the cleanup, the customer group-bys run on it
+    if 'customer_id' not in transactions_df.columns:
+        raise ValueError(f"{file_path} has no customer_id column, run the full cleanup process to add it.")
+    # Missing customer barcodes have the id -1, those transactions belong to no customer like a missing barcode
+    transactions_df['customer_id'] = transactions_df['customer_id'].astype('int32').replace(-1, pd.NA).astype('Int32')
+    return transactions_df
 
 def load_products(file_path):
     # Load products data with appropriate column names
@@ -14,7 +20,7 @@ def write_to_report(report_file, content):
         f.write(content + '\n\n')
 
 def repeat_purchase_rate(transactions_df, report_file):
-    repeat_customers = transactions_df.groupby('customer_barcode')['invoice_id'].nunique().reset_index()
+    repeat_customers = transactions_df.groupby('customer_id')['invoice_id'].nunique().reset_index()
     
     if repeat_customers.shape[0] == 0:
         repeat_rate = 0.0
@@ -31,7 +37,7 @@ def customer_segmentation(transactions_df, report_file):
     transactions_df['timestamp'] = pd.to_datetime(transactions_df['timestamp'], format='%d/%m/%Y %H:%M:%S', dayfirst=True)
 
     # Group by customer and calculate necessary metrics for segmentation
-    customer_stats = transactions_df.groupby('customer_barcode').agg(
+    customer_stats = transactions_df.groupby('customer_id').agg(
         order_count=('invoice_id', 'nunique'),
         total_spent=('amount', 'sum'),
         last_purchase=('timestamp', 'max'),
@@ -135,13 +141,13 @@ def cohort_analysis(transactions_df, report_file):
  
     transactions_df['timestamp'] = pd.to_datetime(transactions_df['timestamp'], format='%d/%m/%Y %H:%M:%S', dayfirst=True)
 
-    transactions_df['cohort'] = transactions_df.groupby('customer_barcode')['timestamp'].transform('min').dt.to_period('M')
-    cohort_counts = transactions_df.groupby(['cohort']).agg(customers=('customer_barcode', 'nunique')).to_string()
+    transactions_df['cohort'] = transactions_df.groupby('customer_id')['timestamp'].transform('min').dt.to_period('M')
+    cohort_counts = transactions_df.groupby(['cohort']).agg(customers=('customer_id', 'nunique')).to_string()
     explanation = "Cohort analysis groups customers by when they made their first purchase and tracks how many remain active (CA).\n"
     write_to_report(report_file, f"--- Cohort Analysis (CA) ---\n{cohort_counts}\n{explanation}")
 
 def product_affinity(transactions_df, report_file):
-    affinity = transactions_df.groupby('customer_barcode')['item_barcode'].apply(lambda x: x.unique()).reset_index()
+    affinity = transactions_df.groupby('customer_id')['item_barcode'].apply(lambda x: x.unique()).reset_index()
     affinity['affinity_count'] = affinity['item_barcode'].apply(lambda x: len(x))
     product_affinity_stats = affinity['affinity_count'].value_counts().head(10).to_string()  # Limit to top 10
     top_affinity_counts = affinity['affinity_count'].value_counts().head(3).to_string()
@@ -158,13 +164,13 @@ def average_order_value(transactions_df, report_file):
     write_to_report(report_file, f"--- Average Order Value (AOV) ---\nAverage order value: {aov:.2f}\nTotal revenue: {total_revenue:.2f}\n{explanation}")
 
 def purchase_frequency(transactions_df, report_file):
-    purchase_counts = transactions_df['customer_barcode'].value_counts().mean()
-    median_purchase_frequency = transactions_df['customer_barcode'].value_counts().median()
+    purchase_counts = transactions_df['customer_id'].value_counts().mean()
+    median_purchase_frequency = transactions_df['customer_id'].value_counts().median()
     explanation = "Purchase frequency shows how often customers make a purchase (PF).\n"
     write_to_report(report_file, f"--- Purchase Frequency (PF) ---\nAverage purchase frequency: {purchase_counts:.2f}\nMedian purchase frequency: {median_purchase_frequency:.2f}\n{explanation}")
 
 def customer_retention_rate(transactions_df, report_file):
-    retained_customers = transactions_df.groupby('customer_barcode')['invoice_id'].nunique().reset_index()
+    retained_customers = transactions_df.groupby('customer_id')['invoice_id'].nunique().reset_index()
     retention_rate = (retained_customers[retained_customers['invoice_id'] > 1].shape[0] / retained_customers.shape[0]) * 100
     total_retained_customers = retained_customers[retained_customers['invoice_id'] > 1].shape[0]
     explanation = "Customer Retention Rate (CRR) shows how many customers returned for another purchase.\n"
@@ -172,8 +178,8 @@ def customer_retention_rate(transactions_df, report_file):
 
 def customer_lifetime_value(transactions_df, report_file):
     transactions_df['amount'] = transactions_df['quantity'].astype(int) * transactions_df['unit_price'].astype(float)
-    clv = transactions_df.groupby('customer_barcode')['amount'].sum().mean()
-    total_clv = transactions_df.groupby('customer_barcode')['amount'].sum().sum()
+    clv = transactions_df.groupby('customer_id')['amount'].sum().mean()
+    total_clv = transactions_df.groupby('customer_id')['amount'].sum().sum()
     explanation = "Customer Lifetime Value (CLV) estimates the average revenue per customer over their entire lifetime.\n"
     write_to_report(report_file, f"--- Customer Lifetime Value (CLV) ---\nAverage CLV: {clv:.2f}\nTotal CLV for all customers: {total_clv:.2f}\n{explanation}")
 
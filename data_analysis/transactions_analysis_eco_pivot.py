@@ -3,7 +3,13 @@ import os
 
 def load_data(file_path):
     # Load transactions data with appropriate column names
-    return pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    transactions_df = pd.read_csv(file_path, dtype=str, quotechar='"', quoting=2)
+    # customer_id is the stable integer key of customer_barcode written by the cleanup, the customer group-bys run on it
+    if 'customer_id' not in transactions_df.columns:
+        raise ValueError(f"{file_path} has no customer_id column, run the full cleanup process to add it.")
+    # Missing customer barcodes have the id -1, those transactions belong to no customer like a missing barcode
+    transactions_df['customer_id'] = transactions_df['customer_id'].astype('int32').replace(-1, pd.NA).astype('Int32')
+    return transactions_df
 
 def load_products(file_path):
     # Load products data with appropriate column names
@@ -15,20 +21,20 @@ def write_to_csv(results, csv_file):
     df.to_csv(csv_file, mode='a', header=not os.path.exists(csv_file), index=False)
 
 def repeat_purchase_rate(transactions_df):
-    repeat_customers = transactions_df.groupby('customer_barcode')['invoice_id'].nunique().reset_index()
+    repeat_customers = transactions_df.groupby('customer_id')['invoice_id'].nunique().reset_index()
     repeat_rate = (repeat_customers[repeat_customers['invoice_id'] > 1].shape[0] / repeat_customers.shape[0]) * 100
     return repeat_rate
 
 def customer_segmentation(transactions_df):
-    segmentation = transactions_df.groupby('customer_barcode').agg(order_count=('invoice_id', 'nunique')).reset_index()
+    segmentation = transactions_df.groupby('customer_id').agg(order_count=('invoice_id', 'nunique')).reset_index()
     segmentation['segment'] = pd.cut(segmentation['order_count'], bins=[0, 1, 5, 10, float('inf')], labels=['One-time', 'Low', 'Medium', 'High'])
     segment_distribution = segmentation['segment'].value_counts(normalize=True) * 100
     return segment_distribution
 
 def cohort_analysis(transactions_df):
     transactions_df['timestamp'] = pd.to_datetime(transactions_df['timestamp'], format='%d/%m/%Y %H:%M:%S', dayfirst=True)
-    transactions_df['cohort'] = transactions_df.groupby('customer_barcode')['timestamp'].transform('min').dt.to_period('M')
-    cohort_counts = transactions_df.groupby(['cohort']).agg(customers=('customer_barcode', 'nunique'))
+    transactions_df['cohort'] = transactions_df.groupby('customer_id')['timestamp'].transform('min').dt.to_period('M')
+    cohort_counts = transactions_df.groupby(['cohort']).agg(customers=('customer_id', 'nunique'))
     return cohort_counts
 
 def average_order_value(transactions_df):
@@ -39,13 +45,13 @@ def average_order_value(transactions_df):
     return aov
 
 def customer_retention_rate(transactions_df):
-    retained_customers = transactions_df.groupby('customer_barcode')['invoice_id'].nunique().reset_index()
+    retained_customers = transactions_df.groupby('customer_id')['invoice_id'].nunique().reset_index()
     retention_rate = (retained_customers[retained_customers['invoice_id'] > 1].shape[0] / retained_customers.shape[0]) * 100
     return retention_rate
 
 def customer_lifetime_value(transactions_df):
     transactions_df['amount'] = transactions_df['quantity'].astype(int) * transactions_df['unit_price'].astype(float)
-    clv = transactions_df.groupby('customer_barcode')['amount'].sum().mean()
+    clv = transactions_df.groupby('customer_id')['amount'].sum().mean()
     return clv
 
 def product_profitability(transactions_df):
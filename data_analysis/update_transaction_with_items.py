@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 import csv
 from tqdm import tqdm
@@ -21,15 +22,20 @@ def update_and_clean_transactions(current_transaction_file, current_items_file,
     total_rows = len(transaction_df)
     progress = tqdm(total=total_rows, desc="Merging", unit="rows", ncols=80)
 
-    # Merging only item_number based on item_barcode
-    merged_df = pd.merge(transaction_df, items_df[['item_number', 'barcode']], left_on='item_barcode', right_on='barcode', how='left')
+    # Merging only item_number based on item_barcode: the row of every item_barcode in the barcode index of the
+    # items (one row per barcode in the cleaned items), then the item_number of those rows
+    item_rows = pd.Index(items_df['barcode']).drop_duplicates().get_indexer(transaction_df['item_barcode'])
+    item_numbers = items_df.drop_duplicates(subset='barcode')['item_number'].to_numpy(dtype=object).take(np.maximum(item_rows, 0))
+    item_numbers[item_rows < 0] = np.nan
+    merged_df = transaction_df.copy()
+    merged_df['item_number'] = item_numbers
     progress.update(total_rows)
     progress.close()
 
     # Dropping unwanted columns and rearranging
-    merged_df = merged_df.drop(columns=['item_id', 'barcode'])
+    merged_df = merged_df.drop(columns=['item_id'])
 
-    column_order = ['customer_barcode', 'invoice_id', 'item_number', 'item_barcode', 'quantity', 'unit_price', 'amount', 'interaction_type', 'timestamp']
+    column_order = ['customer_barcode', 'customer_id', 'invoice_id', 'item_number', 'item_barcode', 'quantity', 'unit_price', 'amount', 'interaction_type', 'timestamp']
     merged_df = merged_df[column_order]
 
     if os.path.exists(new_transaction_file):
@@ -55,7 +61,7 @@ def update_and_clean_transactions(current_transaction_file, current_items_file,
     print("Removing unwanted columns from items data...")
     columns_to_remove = ["category_level1","category_level2","category_level3","category_level4", "department",
                          "vendor_code","vendor_name","uom", "packing", "en_short_desc", "ar_short_desc", "MAX_barcode_FOR_DUPLICATES", 
-                         "MAX_barcode_FOR_DUPLICATED_AR", "MAX_barcode"]
+                         "MAX_barcode_FOR_DUPLICATED_AR", "MAX_barcode", "DUPLICATE_CLUSTER_ID"]
     cleaned_items_df = items_df.drop(columns=columns_to_remove, errors='ignore')
     cleaned_items_df = cleaned_items_df.drop_duplicates(subset='item_number', keep='first')
     cleaned_items_df.columns = [col.lower() for col in cleaned_items_df.columns]
@@ -0,0 +1,126 @@
+import sys
+import numpy as np
+import pandas as pd
+from colorama import Fore, init
+from excel_snapshot import read_excel_snapshot
+
+init(autoreset=True)
+
+KEY_COLUMNS = ['item_number', 'barcode']
+
+# Status codes of the diff rows
+ADDED, DELETED, MODIFIED = 'added', 'deleted', 'modified'
+
+
+def canonical_text(values):
+    """
+    Values as text, missing values stay missing. Whole-number floats lose their '.0': a blank cell turns an int
+    column into floats, so 1001.0 must key and hash like 1001 (and '1001' of a text column).
+    """
+    text = values.astype(str).where(values.notna())
+    if pd.api.types.is_float_dtype(values):
+        is_float = values.notna().to_numpy()
+    elif values.dtype == object:
+        is_float = (values.map(lambda value: isinstance(value, float)) & values.notna()).to_numpy(bool)
+    else:
+        return text
+    positions = np.flatnonzero(is_float)
+    numbers = values.iloc[positions].to_numpy(float)
+    # Floats beyond 2**53 are not exact whole numbers any more, those keep their float text
+    whole = (numbers == np.floor(numbers)) & (np.abs(numbers) < 2 ** 53)
+    text.iloc[positions[whole]] = numbers[whole].astype(np.int64).astype(str)
+    return text
+
+
+def row_keys(df):
+    """
+    item_number/barcode as text plus the occurrence number for keys that repeat, so every row has its own key.
+    Returns the key columns and a 64-bit hash of every key, rows are matched on the hashes without sorting.
+    """
+    keys = pd.DataFrame({column: canonical_text(df[column]).fillna('') for column in KEY_COLUMNS}).reset_index(drop=True)
+    key_hashes = pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy()
+    keys['occurrence'] = pd.Series(key_hashes).groupby(key_hashes, sort=False).cumcount().astype(np.int32).to_numpy()
+    # Mix the occurrence into the key hash, first occurrences keep the hash of their key
+    occurrence_hashes = pd.util.hash_array(keys['occurrence'].to_numpy(np.uint64))
+    occurrence_hashes[keys['occurrence'].to_numpy() == 0] = 0
+    return keys, pd.Index(key_hashes ^ occurrence_hashes)
+
+
+def column_hash(values):
+    # Every column is hashed as canonical text, so the hash does not depend on the dtype; missing values hash alike
+    values = canonical_text(values)
+    return pd.util.hash_pandas_object(values, index=False, categorize=False).to_numpy()
+
+
+def column_hashes(df, columns):
+    # One uint64 hash per row and column
+    if not columns:
+        return np.zeros((len(df), 0), dtype=np.uint64)
+    return np.column_stack([column_hash(df[column]) for column in columns])
+
+
+def diff_frames(old_df, new_df):
+    """
+    Diff two versions of the item master in linear time. Rows are matched on item_number/barcode through a hash
+    index, and every column is hashed once. Returns a DataFrame with the key columns, status
+    (added/deleted/modified) and changed_columns, a bitmask of the compared columns that changed
+    (bit i is columns[i]), plus the list of compared columns. Unchanged rows are left out.
+    """
+    columns = [column for column in new_df.columns if column in old_df.columns]
+    if len(columns) > 64:
+        raise ValueError(f"changed_columns holds up to 64 columns, the files share {len(columns)}")
+    (old_key_columns, old_keys), (new_key_columns, new_keys) = row_keys(old_df), row_keys(new_df)
+    old_hashes, new_hashes = column_hashes(old_df, columns), column_hashes(new_df, columns)
+
+    # Position of every new row in the old version, -1 for added rows
+    old_positions = old_keys.get_indexer(new_keys)
+    matched = old_positions >= 0
+    changed = old_hashes[old_positions[matched]] != new_hashes[matched]
+    bit_values = np.left_shift(np.uint64(1), np.arange(len(columns), dtype=np.uint64))
+    changed_columns = np.zeros(len(new_df), dtype=np.uint64)
+    changed_columns[matched] = (changed * bit_values).sum(axis=1, dtype=np.uint64)
+
+    deleted = ~old_keys.isin(new_keys)
+    status = np.where(~matched, ADDED, np.where(changed_columns > 0, MODIFIED, ''))
+    new_part = new_key_columns.assign(status=status, changed_columns=changed_columns)[status != '']
+    old_part = old_key_columns.assign(status=DELETED, changed_columns=np.uint64(0))[deleted]
+
+    diff = pd.concat([new_part, old_part], ignore_index=True)
+    diff['status'] = pd.Categorical(diff['status'], categories=[ADDED, DELETED, MODIFIED])
+    return diff, columns
+
+
+def changed_column_flags(diff, columns):
+    # One boolean column per compared column, True where that column changed
+    return pd.DataFrame({column: (diff['changed_columns'].to_numpy(np.uint64) >> np.uint64(bit)) & np.uint64(1) == 1
+                         for bit, column in enumerate(columns)}, index=diff.index)
+
+
+def print_diff_summary(diff, columns):
+    counts = diff['status'].value_counts()
+    print(Fore.GREEN + f"Added items: {counts[ADDED]}")
+    print(Fore.RED + f"Deleted items: {counts[DELETED]}")
+    print(Fore.YELLOW + f"Modified items: {counts[MODIFIED]}")
+    modified_flags = changed_column_flags(diff[diff['status'] == MODIFIED], columns).sum()
+    for column, count in modified_flags[modified_flags > 0].sort_values(ascending=False).items():
+        print(Fore.CYAN + f"  {column}: {count} changed")
+
+
+def diff_master(old_path, new_path):
+    print(Fore.CYAN + f"Comparing {old_path} with {new_path}...")
+    old_df = read_excel_snapshot(old_path, dtype={'barcode': str})
+    new_df = read_excel_snapshot(new_path, dtype={'barcode': str})
+
+    for column in sorted(set(new_df.columns) ^ set(old_df.columns)):
+        print(Fore.YELLOW + f"Column only in {'the new' if column in new_df.columns else 'the old'} file: {column}")
+
+    diff, columns = diff_frames(old_df, new_df)
+    print_diff_summary(diff, columns)
+    return diff
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(Fore.RED + "Usage: python diff_master.py <old master .xlsx> <new master .xlsx>")
+        sys.exit(1)
+    diff_master(sys.argv[1], sys.argv[2])
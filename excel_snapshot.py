@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from colorama import Fore, Style, init
+
+# Feather snapshots need pyarrow, without it the snapshots are pickled DataFrames
+try:
+    import pyarrow
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+init(autoreset=True)
+
+
+def file_hash(path):
+    # Content hash of the file, read in blocks
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_paths(excel_path, read_params):
+    # One snapshot per workbook and read_excel parameters (they change the loaded DataFrame), next to the workbook
+    params_key = hashlib.sha256(json.dumps(read_params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+    name = f"{os.path.splitext(os.path.basename(excel_path))[0]}-{params_key}"
+    base = os.path.join(os.path.dirname(excel_path), '.snapshots', name)
+    return f'{base}.json', base
+
+
+def snapshot_is_current(excel_path, meta):
+    """The snapshot matches the workbook: same size and mtime, or the same content after a touch or copy."""
+    stat = os.stat(excel_path)
+    if meta['size'] != stat.st_size:
+        return False
+    if meta['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    return meta['sha256'] == file_hash(excel_path)
+
+
+def read_feather(path, columns=None):
+    # Uncompressed Feather is memory-mapped, only the requested columns are read
+    df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    # Arrow gives None for missing text, read_excel gives NaN
+    text_columns = df.columns[df.dtypes == object]
+    df[text_columns] = df[text_columns].fillna(np.nan)
+    return df
+
+
+def write_snapshot(df, base):
+    # Feather when the DataFrame survives the round trip unchanged, a pickle otherwise (e.g. columns mixing numbers and text)
+    if feather is not None:
+        try:
+            feather.write_feather(df, f'{base}.feather', compression='uncompressed')
+            if read_feather(f'{base}.feather').equals(df):
+                return 'feather'
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+            pass
+        if os.path.exists(f'{base}.feather'):
+            os.remove(f'{base}.feather')
+    df.to_pickle(f'{base}.pkl')
+    return 'pickle'
+
+
+def read_snapshot(base, snapshot_format, columns=None):
+    if snapshot_format == 'feather':
+        return read_feather(f'{base}.feather', columns)
+    df = pd.read_pickle(f'{base}.pkl')
+    return df if columns is None else df[columns]
+
+
+def read_excel_snapshot(excel_path, columns=None, **read_params):
+    """
+    pd.read_excel(excel_path, **read_params), served from a columnar snapshot of the workbook.
+
+    The workbook is parsed once; the snapshot is reused while its size, mtime or content hash match. columns
+    limits the loaded columns, which with a Feather snapshot are the only ones read from disk.
+    """
+    meta_path, base = snapshot_paths(excel_path, read_params)
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if snapshot_is_current(excel_path, meta) and (meta['format'] != 'feather' or feather is not None):
+            print(Fore.CYAN + f"Loading {excel_path} from its snapshot ({meta['format']})...")
+            # Remember the new mtime of a touched or copied workbook, so its content is not hashed again
+            if meta['mtime_ns'] != os.stat(excel_path).st_mtime_ns:
+                meta['mtime_ns'] = os.stat(excel_path).st_mtime_ns
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, indent=2)
+            return read_snapshot(base, meta['format'], columns)
+
+    print(Fore.YELLOW + f"Reading {excel_path} and saving its snapshot...{Style.RESET_ALL}")
+    stat = os.stat(excel_path)
+    df = pd.read_excel(excel_path, **read_params)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    meta = {
+        'excel_path': excel_path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_hash(excel_path),
+        'format': write_snapshot(df, base),
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return df if columns is None else df[columns]
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+# Strings pd.read_excel turns into NaN by default
+EXCEL_NA_VALUES = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+
+def convert_cell(cell):
+    # Value of a cell the way pandas' openpyxl reader converts it: errors and NA strings are missing, whole floats are ints
+    if cell.value is None or cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC and not isinstance(cell.value, bool):
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    if isinstance(cell.value, str) and cell.value in EXCEL_NA_VALUES:
+        return np.nan
+    return cell.value
+
+
+def batch_column_kinds(batch):
+    """Kind of every column of a batch: 'int', 'float', 'datetime' or 'object' (mixed values, kept as they are)."""
+    kinds = {}
+    for column in batch.columns:
+        values = batch[column].dropna()
+        if values.empty:
+            kinds[column] = 'empty'
+        elif values.map(lambda value: isinstance(value, pd.Timestamp) or hasattr(value, 'isoformat')).all():
+            kinds[column] = 'datetime'
+        elif values.map(lambda value: isinstance(value, (int, float, str)) and not isinstance(value, bool)).all() \
+                and pd.to_numeric(values, errors='coerce').notna().all():
+            numbers = pd.to_numeric(values)
+            whole = (numbers == np.floor(numbers)).all() and not values.map(lambda value: isinstance(value, float)).any()
+            kinds[column] = 'int' if whole and len(values) == len(batch) else 'float'
+        else:
+            kinds[column] = 'object'
+    return kinds
+
+
+def merge_column_kinds(kinds, batch_kinds):
+    # Kinds of the whole sheet from the kinds of its batches
+    if kinds is None:
+        return batch_kinds
+    order = ['empty', 'int', 'float']
+    merged = {}
+    for column, kind in batch_kinds.items():
+        previous = kinds[column]
+        if previous == kind:
+            merged[column] = previous
+        elif kind == 'empty' or previous == 'empty':
+            kind = previous if kind == 'empty' else kind
+            # Missing values make an int column float, like NaN in a full load
+            merged[column] = 'float' if kind == 'int' else kind
+        elif previous in order and kind in order:
+            merged[column] = order[max(order.index(previous), order.index(kind))]
+        else:
+            merged[column] = 'object'
+    return merged
+
+
+def apply_column_kinds(batch, kinds):
+    # Cast a batch to the kinds of the whole sheet, so every batch is typed like the full load
+    for column, kind in kinds.items():
+        if column not in batch.columns:
+            continue
+        if kind == 'int':
+            batch[column] = pd.to_numeric(batch[column]).astype(np.int64)
+        elif kind in ('float', 'empty'):
+            batch[column] = pd.to_numeric(batch[column]).astype(np.float64)
+        elif kind == 'datetime':
+            batch[column] = pd.to_datetime(batch[column])
+    return batch
+
+
+def iter_excel_batches(excel_path, batch_size=50000, dtype=None, columns=None):
+    """
+    Stream the first sheet of excel_path as DataFrames of batch_size rows, holding one batch in memory.
+
+    The workbook is opened with openpyxl's read-only row iterator. Cells are converted like pd.read_excel
+    converts them, empty rows at the end of the sheet are dropped and the index continues across batches,
+    so it is the row index of a full load. dtype columns are converted with str, like read_excel's dtype.
+    Every batch keeps its own inferred types; apply_column_kinds casts a batch to the types of the whole
+    sheet (from batch_column_kinds/merge_column_kinds over all batches).
+    """
+    dtype = dtype or {}
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows()
+        header = [cell.value for cell in next(rows, [])]
+        header = [name if name is not None else f'Unnamed: {position}' for position, name in enumerate(header)]
+        positions = [header.index(column) for column in columns] if columns is not None else list(range(len(header)))
+        names = [header[position] for position in positions]
+
+        batch, start, empty_rows = [], 0, 0
+        for row in rows:
+            # read_excel keeps the empty rows, except the ones at the end of the sheet
+            if all(cell.value is None for cell in row):
+                empty_rows += 1
+                continue
+            values = [convert_cell(row[position]) if position < len(row) else np.nan for position in positions]
+            for values in [[np.nan] * len(positions)] * empty_rows + [values]:
+                batch.append(values)
+                if len(batch) == batch_size:
+                    yield typed_batch(batch, names, start, dtype)
+                    start += len(batch)
+                    batch = []
+            empty_rows = 0
+        if batch:
+            yield typed_batch(batch, names, start, dtype)
+    finally:
+        workbook.close()
+
+
+def typed_batch(rows, names, start, dtype):
+    batch = pd.DataFrame(rows, columns=names, index=pd.RangeIndex(start, start + len(rows)), dtype=object)
+    for column, column_type in dtype.items():
+        if column in batch.columns:
+            batch[column] = batch[column].map(column_type, na_action='ignore')
+    return batch
+
@@ -1,87 +1,233 @@
-
 import pandas as pd
 import sys
 from colorama import Fore, Style, init
-from tqdm import tqdm
+from tabulate import tabulate
 import os
+import tempfile
+import numpy as np
+from excel_snapshot import read_excel_snapshot
+from excel_stream import iter_excel_batches, batch_column_kinds, merge_column_kinds, apply_column_kinds
 
 init(autoreset=True)
 
 FILE_PATH = 'data/FARM_ITEM_MASTE_FILE.xlsx'
 LOG_PATH = os.path.join('log', 'errors.txt')
 
+# Checks run on every column, in this order
+COLUMN_CHECKS = [
+    ('ar_full_description', ['unique', 'null_empty']),
+    ('barcode', ['unique', 'null_empty']),
+    ('en_full_description', ['unique', 'null_empty']),
+    ('en_short_desc', ['unique', 'null_empty']),
+    ('ar_short_desc', ['unique', 'null_empty']),
+    ('brand', ['null_empty']),
+    ('category_level1', ['null_empty']),
+    ('category_level2', ['null_empty']),
+    ('category_level3', ['null_empty']),
+    ('category_level4', ['null_empty']),
+]
+
+# Rows per batch in streaming mode (--stream)
+STREAM_BATCH_SIZE = 50000
+# Hashes read at once over all sorted runs when they are merged to find the duplicates in streaming mode
+MERGE_BLOCK_HASHES = 1 << 20
+
 def log_error(message):
     print(Fore.RED + message)
     with open(LOG_PATH, 'a', encoding='utf-8') as f:
         f.write(message + '\n')
 
-def log_warning(message):
-    print(Fore.YELLOW + message)
-    with open(LOG_PATH, 'a', encoding='utf-8') as f:
-        f.write(message + '\n')
+def value_key(value):
+    # Numbers are compared by value (1 and 1.0 alike), other values by type and text, all missing values alike
+    if pd.isna(value):
+        return 'missing:'
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+        return f"number:{int(value) if float(value).is_integer() else float(value)!r}"
+    return f"{type(value).__name__}:{value}"
+
+def value_hashes(values):
+    # 64-bit hash of every value, duplicates in streaming mode are found on these hashes
+    return pd.util.hash_array(values.map(value_key).to_numpy(object), categorize=False)
+
+def column_masks(df, column, checks, duplicate_hashes=None):
+    # All masks of a column from one string conversion of its values
+    # duplicate_hashes (hashes that repeat in the whole sheet) finds the duplicates of a batch in streaming mode
+    values = df[column]
+    text = values.astype(str)
+    masks = {}
+    if 'unique' in checks:
+        if duplicate_hashes is None:
+            masks['unique'] = values.duplicated(keep=False)
+        else:
+            masks['unique'] = pd.Series(in_sorted(value_hashes(values), duplicate_hashes), index=values.index)
+    if 'null_empty' in checks:
+        masks['null_empty'] = values.isnull() | text.str.strip().eq('')
+    return masks
+
+def check_messages(df, column, check, mask):
+    # Log lines of the failing rows, line numbers count the Excel header row
+    lines = df.index[mask] + 2
+    item_numbers = df.loc[mask, 'item_number']
+    if check == 'unique':
+        return [f"Duplicate {column}: Line {line}: {column}='{value}' | item_number={item_number} | brand={brand}"
+                for line, value, item_number, brand in zip(lines, df.loc[mask, column], item_numbers, df.loc[mask, 'brand'])]
+    return [f"{column} is null/empty: Line {line}, item_number={item_number}" for line, item_number in zip(lines, item_numbers)]
+
+def check_fields(df, log_file, column_checks=COLUMN_CHECKS):
+    """Run the checks of every column, writing the findings to log_file. Returns the number of findings per check."""
+    summary = []
+    for column, checks in column_checks:
+        for check, mask in column_masks(df, column, checks).items():
+            log_file.writelines(message + '\n' for message in check_messages(df, column, check, mask))
+            summary.append((column, check, int(mask.sum())))
+    return summary
+
+def in_sorted(hashes, sorted_hashes):
+    # Which hashes are in sorted_hashes, by a binary search so only the pages it touches are read from disk
+    if len(sorted_hashes) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+    return sorted_hashes[positions] == hashes
+
+def read_hashes(hash_file_path, start, stop):
+    return np.fromfile(hash_file_path, dtype=np.uint64, count=stop - start, offset=start * 8)
+
+def merged_hash_blocks(hash_file_path, run_lengths):
+    # The sorted runs of hash_file_path merged into one sorted stream of blocks, reading a block of every run at a time
+    ends = np.cumsum(np.asarray(run_lengths, dtype=np.int64))
+    positions = ends - np.asarray(run_lengths, dtype=np.int64)
+    block_size = max(MERGE_BLOCK_HASHES // max(len(run_lengths), 1), 1)
+    while (positions < ends).any():
+        runs = np.flatnonzero(positions < ends)
+        blocks = [read_hashes(hash_file_path, positions[run], min(positions[run] + block_size, ends[run])) for run in runs]
+        # Every hash up to the smallest block end is in the blocks, the later hashes of every run are larger
+        bound = min(block[-1] for block in blocks)
+        parts = []
+        for run, block in zip(runs, blocks):
+            taken = np.searchsorted(block, bound, side='right')
+            parts.append(block[:taken])
+            positions[run] += taken
+        yield np.sort(np.concatenate(parts))
+
+def duplicated_hashes(hash_file_path, run_lengths, duplicates_path):
+    """
+    Hashes that occur more than once in hash_file_path, a file of sorted runs of run_lengths hashes each (one per
+    batch). The runs are merged block by block, so the memory is bounded by MERGE_BLOCK_HASHES and not the row
+    count. The duplicates are written sorted to duplicates_path and returned memory-mapped from there.
+    """
+    previous, last_written = None, None
+    with open(duplicates_path, 'wb') as duplicates_file:
+        for block in merged_hash_blocks(hash_file_path, run_lengths):
+            # Equal hashes are next to each other, also across blocks
+            repeated = block[1:][block[1:] == block[:-1]]
+            if previous is not None and block[0] == previous:
+                repeated = np.append(repeated, previous)
+            repeated = np.unique(repeated)
+            if last_written is not None:
+                repeated = repeated[repeated != last_written]
+            if len(repeated):
+                repeated.tofile(duplicates_file)
+                last_written = repeated[-1]
+            previous = block[-1]
+    if os.path.getsize(duplicates_path) == 0:
+        return np.empty(0, dtype=np.uint64)
+    return np.memmap(duplicates_path, dtype=np.uint64, mode='r')
+
+def spill_sheet(excel_path, spill_dir, column_checks=COLUMN_CHECKS, batch_size=STREAM_BATCH_SIZE):
+    """
+    The one pass over the workbook in streaming mode. Every batch is pickled to spill_dir, and the value hashes
+    of the columns checked for duplicates are sorted and appended as one run to a file per column, as text and
+    as numbers (a column that turns out numeric compares numeric text equal to the number, like the full load does).
+    Returns the column kinds of the sheet, the batch files and the hashes that repeat in every column, found by
+    merging the runs on disk (see duplicated_hashes).
+
+    Two different values sharing a 64-bit hash would be reported as duplicates; that is very unlikely.
+    """
+    unique_columns = [column for column, checks in column_checks if 'unique' in checks]
+    kinds, batch_files, run_lengths = None, [], []
+    hash_files = {(column, key): open(os.path.join(spill_dir, f'{position}-{key}.hashes'), 'wb')
+                  for position, column in enumerate(unique_columns) for key in ('text', 'numeric')}
+    try:
+        for batch in iter_excel_batches(excel_path, batch_size, dtype={'barcode': str}):
+            kinds = merge_column_kinds(kinds, batch_column_kinds(batch.drop(columns='barcode')))
+            batch_files.append(os.path.join(spill_dir, f'batch-{len(batch_files)}.pkl'))
+            batch.to_pickle(batch_files[-1])
+            run_lengths.append(len(batch))
+            for column in unique_columns:
+                numbers = pd.to_numeric(batch[column], errors='coerce')
+                np.sort(value_hashes(batch[column])).tofile(hash_files[column, 'text'])
+                np.sort(value_hashes(batch[column].where(numbers.isna(), numbers))).tofile(hash_files[column, 'numeric'])
+    finally:
+        for hash_file in hash_files.values():
+            hash_file.close()
+    kinds = kinds or {}
+    duplicate_hashes = {column: duplicated_hashes(hash_files[column, 'numeric' if kinds.get(column) in ('int', 'float') else 'text'].name,
+                                                  run_lengths, os.path.join(spill_dir, f'{position}.duplicates'))
+                        for position, column in enumerate(unique_columns)}
+    return kinds, batch_files, duplicate_hashes
+
+def check_fields_streaming(excel_path, log_file, column_checks=COLUMN_CHECKS, batch_size=STREAM_BATCH_SIZE):
+    """
+    check_fields over the sheet streamed in batches, holding one batch in memory, the duplicated hashes are
+    searched on disk.
+    The workbook is read once; the checks run on its batches spilled to a temporary folder, typed like the full load.
+    The findings of every check go to their own temporary file, so the log keeps the order of check_fields.
+    """
+    with tempfile.TemporaryDirectory() as spill_dir:
+        kinds, batch_files, duplicate_hashes = spill_sheet(excel_path, spill_dir, column_checks, batch_size)
+        findings = {(column, check): [tempfile.TemporaryFile('w+', encoding='utf-8'), 0]
+                    for column, checks in column_checks for check in checks}
+        try:
+            for batch_file in batch_files:
+                batch = apply_column_kinds(pd.read_pickle(batch_file), kinds)
+                for column, checks in column_checks:
+                    for check, mask in column_masks(batch, column, checks, duplicate_hashes.get(column)).items():
+                        findings[column, check][0].writelines(message + '\n' for message in check_messages(batch, column, check, mask))
+                        findings[column, check][1] += int(mask.sum())
+
+            summary = []
+            for (column, check), (check_file, count) in findings.items():
+                check_file.seek(0)
+                for block in iter(lambda: check_file.read(1 << 20), ''):
+                    log_file.write(block)
+                summary.append((column, check, count))
+            return summary
+        finally:
+            for check_file, _ in findings.values():
+                check_file.close()
+            # The memory-mapped duplicates are released before their folder is removed
+            duplicate_hashes.clear()
 
-def check_unique(df, column, display_name):
-    duplicates = df[df.duplicated(column, keep=False)]
-    if not duplicates.empty:
-        for _, row in tqdm(duplicates.iterrows(), total=duplicates.shape[0], desc=f'Checking duplicates in {display_name}'):
-            line = row.name + 2
-            context = f"Line {line}: {column}='{row[column]}' | item_number={row['item_number']} | brand={row['brand']}"
-            log_error(f"Duplicate {display_name}: {context}")
-
-def check_null_empty(df, column, display_name):
-    condition = df[column].isnull() | df[column].astype(str).str.strip().eq('')
-    filtered = df[condition]
-    for idx in tqdm(filtered.index, desc=f'Checking null/empty in {display_name}'):
-        line = idx + 2
-        log_error(f"{display_name} is null/empty: Line {line}, item_number={df.at[idx, 'item_number']}")
-
-def check_whitespace(df, column, display_name):
-    condition = df[column].astype(str).str.startswith(' ') | df[column].astype(str).str.endswith(' ')
-    filtered = df[condition]
-    for idx in tqdm(filtered.index, desc=f'Checking whitespace in {display_name}'):
-        line = idx + 2
-        log_warning(f"{display_name} has leading/trailing whitespace: Line {line}, item_number={df.at[idx, 'item_number']}")
-
-def check_fields(df):
-    check_unique(df, 'ar_full_description', 'ar_full_description')
-    check_null_empty(df, 'ar_full_description', 'ar_full_description')
-    
-    check_unique(df, 'barcode', 'barcode')
-    check_null_empty(df, 'barcode', 'barcode')
-    #check_whitespace(df, 'barcode', 'barcode')
-
-    check_unique(df, 'en_full_description', 'en_full_description')
-    check_null_empty(df, 'en_full_description', 'en_full_description')
-    
-    #check_whitespace(df, 'en_full_description', 'en_full_description')
-
-    check_unique(df, 'en_short_desc', 'en_short_desc')
-    check_null_empty(df, 'en_short_desc', 'en_short_desc')
-    #check_whitespace(df, 'en_short_desc', 'en_short_desc')
-
-    check_unique(df, 'ar_short_desc', 'ar_short_desc')
-    check_null_empty(df, 'ar_short_desc', 'ar_short_desc')
-    #check_whitespace(df, 'ar_short_desc', 'ar_short_desc')
-
-    fields = ['brand', 'category_level1', 'category_level2', 'category_level3', 'category_level4']
-    for field in fields:
-        condition = df[field].isnull() | df[field].astype(str).str.strip().eq('')
-        filtered = df[condition]
-        for idx in tqdm(filtered.index, desc=f'Checking null/empty in {field}'):
-            line = idx + 2
-            log_error(f"{field} is null/empty: Line {line}, item_number={df.at[idx, 'item_number']}")
+def print_summary(summary):
+    table = [[column, check, f"{Fore.RED if count else Fore.GREEN}{count}{Style.RESET_ALL}"]
+             for column, check, count in summary]
+    print(tabulate(table, headers=["Column", "Check", "Findings"], tablefmt="fancy_grid"))
 
 def main():
     print(Fore.CYAN + "Starting validation...")
     if not os.path.exists('log'):
         os.makedirs('log')
     open(LOG_PATH, 'w').close()
+    # --stream validates the workbook in batches with bounded memory instead of loading it whole
+    if '--stream' in sys.argv:
+        try:
+            with open(LOG_PATH, 'a', encoding='utf-8', buffering=1 << 20) as log_file:
+                summary = check_fields_streaming(FILE_PATH, log_file)
+        except Exception as e:
+            log_error(f"Failed to read Excel file: {e}")
+            sys.exit(1)
+        print_summary(summary)
+        print(Fore.GREEN + "Validation completed. Check log/errors.txt for details.")
+        return
     try:
-        df = pd.read_excel(FILE_PATH, dtype={'barcode': str})
+        df = read_excel_snapshot(FILE_PATH, dtype={'barcode': str})
     except Exception as e:
         log_error(f"Failed to read Excel file: {e}")
         sys.exit(1)
-    check_fields(df)
+    # One buffered writer for all findings
+    with open(LOG_PATH, 'a', encoding='utf-8', buffering=1 << 20) as log_file:
+        summary = check_fields(df, log_file)
+    print_summary(summary)
     print(Fore.GREEN + "Validation completed. Check log/errors.txt for details.")
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The cleaning scripts import each other by module name, like when they are run from their folder
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'cleaning_processes'))
+sys.path.insert(0, root)
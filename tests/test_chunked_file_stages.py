@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+from correct_category_levels import correct_category_levels
+from delete_incorrect_products import delete_incorrect_products
+from trim_spaces_commas import trim_spaces_commas
+
+
+def items():
+    return pd.DataFrame({
+        'item_number': ['1001', '1002', '1003', '1004', '1005'],
+        'barcode': ['06281234567894', '4006381333931', '6291041500213', '5000112637922', '0012345678905'],
+        'en_full_description': [' NIDO  MILK\nPOWDER ', 'TEMP ITEMS TO BE DELETED', 'BASMATI`RICE', None,
+                                'TEMP ITEMS TO BE DELETED'],
+        'brand': ['NIDO', None, ' TILDA ', '', 'X'],
+        'category_level1': ['FOOD', 'BEVERAGES', 'NULL', 'FOOD', None],
+        'category_level2': ['DAIRY', '', 'GROCERY', None, 'SNACKS'],
+        'category_level3': ['NULL', None, 'RICE', 'SALT', ''],
+        'category_level4': ['', 'TEA', None, 'NULL', 'CHIPS'],
+    })
+
+
+@pytest.mark.parametrize('chunksize', [2, 100])
+def test_chunked_stages_match_the_full_load(tmp_path, monkeypatch, chunksize):
+    # delete_incorrect_products writes its log to the Logs folder of the working directory
+    monkeypatch.chdir(tmp_path)
+    items().to_csv('items.csv', index=False)
+
+    outputs = {}
+    for mode, params in [('full', {}), ('chunked', {'chunksize': chunksize})]:
+        trim_spaces_commas('items.csv', f'{mode}_trimmed.csv', **params)
+        delete_incorrect_products(f'{mode}_trimmed.csv', f'{mode}_deleted.csv', **params)
+        correct_category_levels(f'{mode}_deleted.csv', f'{mode}_levels.csv', f'Logs/{mode}_levels_log.csv', **params)
+        outputs[mode] = [(tmp_path / f'{mode}_{step}.csv').read_bytes() for step in ['trimmed', 'deleted', 'levels']]
+        outputs[mode].append((tmp_path / 'Logs' / f'{mode}_levels_log.csv').read_bytes())
+
+    assert outputs['chunked'] == outputs['full']
+
+
+def test_chunked_stages_keep_the_header_of_a_file_without_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    items().iloc[:0].to_csv('items.csv', index=False)
+
+    trim_spaces_commas('items.csv', 'full.csv')
+    trim_spaces_commas('items.csv', 'chunked.csv', chunksize=2)
+
+    assert (tmp_path / 'chunked.csv').read_bytes() == (tmp_path / 'full.csv').read_bytes()
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from clean_non_popular_transactions import (THRESHOLDS, clean_transactions, clean_transactions_incremental,
+                                            encode_transactions, prune_transactions, sweep_thresholds)
+
+
+def transactions(rows=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer_barcode': rng.integers(0, 120, rows).astype(str),
+        'invoice_id': rng.integers(0, 900, rows).astype(str),
+        'item_barcode': rng.integers(0, 200, rows).astype(str),
+    })
+
+
+def test_sweep_returns_the_grid_order():
+    df = transactions()
+    grid = [{'invoices': 8, 'transactions': 20}, {'invoices': 3}, {'barcode_uses': 12}, {}]
+
+    result = sweep_thresholds(df, grid)
+
+    assert result[list(THRESHOLDS)].to_dict('records') == [{**THRESHOLDS, **thresholds} for thresholds in grid]
+    (customers, _), (invoices, _), (items, _) = encode_transactions(df)
+    for thresholds, surviving in zip(grid, result['surviving_transactions']):
+        alive, _, _ = prune_transactions(customers, invoices, items, {**THRESHOLDS, **thresholds})
+        assert surviving == alive.sum()
+
+
+def test_sweep_of_a_dict_grid_follows_the_product_order():
+    result = sweep_thresholds(transactions(), {'invoices': [8, 3], 'barcode_uses': [12, 5]})
+
+    assert result[['invoices', 'barcode_uses']].values.tolist() == [[8, 12], [8, 5], [3, 12], [3, 5]]
+
+
+def customer_rows(customer, first_invoice, rows):
+    # Six invoices over six items, the barcodes and customers have leading zeros
+    return [[customer, str(first_invoice + row % 6), f'00{row % 6 + 1}', '1.0', f'0{row // 6 + 1}/01/2024 10:00:00']
+            for row in range(rows)]
+
+
+def test_incremental_run_writes_the_same_file_as_a_full_run(tmp_path):
+    columns = ['customer_barcode', 'invoice_id', 'item_barcode', 'quantity', 'timestamp']
+    # The last customer has too few transactions in the first batch, its rows join the output with the second batch
+    first_batch = pd.DataFrame([row for customer in range(6) for row in customer_rows(f'0{customer}', customer * 10, 12)]
+                               + customer_rows('07', 70, 3), columns=columns)
+    second_batch = pd.DataFrame(customer_rows('07', 73, 10), columns=columns)
+    input_file = tmp_path / 'transactions.csv'
+
+    first_batch.to_csv(input_file, index=False)
+    clean_transactions_incremental(str(input_file), str(tmp_path / 'incremental.csv'), str(tmp_path / 'incremental.txt'))
+    second_batch.to_csv(input_file, mode='a', header=False, index=False)
+    clean_transactions_incremental(str(input_file), str(tmp_path / 'incremental.csv'), str(tmp_path / 'incremental.txt'))
+    clean_transactions(str(input_file), str(tmp_path / 'full.csv'), str(tmp_path / 'full.txt'))
+
+    assert (tmp_path / 'incremental.csv').read_text() == (tmp_path / 'full.csv').read_text()
+    assert pd.read_csv(tmp_path / 'full.csv', dtype=str)['customer_barcode'].unique().tolist() == \
+        ['00', '01', '02', '03', '04', '05', '07']
+
+
+def test_incremental_runs_over_several_batches_keep_the_rows_of_a_full_run(tmp_path):
+    # Sparse customers and barcodes, so many rows stay pending and join the output in a later batch
+    df = transactions(rows=4000, seed=1).assign(timestamp='01/01/2024 10:00:00')
+    df['customer_barcode'] = np.random.default_rng(2).integers(0, 400, len(df)).astype(str)
+    input_file = tmp_path / 'transactions.csv'
+
+    for start, stop in [(0, 1500), (1500, 1600), (1600, 4000)]:
+        df[start:stop].to_csv(input_file, mode='a' if start else 'w', header=not start, index=False)
+        clean_transactions_incremental(str(input_file), str(tmp_path / 'incremental.csv'), str(tmp_path / 'incremental.txt'))
+    clean_transactions(str(input_file), str(tmp_path / 'full.csv'), str(tmp_path / 'full.txt'))
+
+    incremental = pd.read_csv(tmp_path / 'incremental.csv', dtype=str)
+    full = pd.read_csv(tmp_path / 'full.csv', dtype=str)
+    assert 0 < len(full) < len(df)
+    assert sorted(map(tuple, incremental.values)) == sorted(map(tuple, full.values))
+
+
+def test_an_edit_before_the_watermark_falls_back_to_a_full_run(tmp_path):
+    df = transactions(rows=2000).assign(timestamp='01/01/2024 10:00:00')
+    input_file = tmp_path / 'transactions.csv'
+    df.to_csv(input_file, index=False)
+    clean_transactions_incremental(str(input_file), str(tmp_path / 'incremental.csv'), str(tmp_path / 'incremental.txt'))
+
+    # The customer of the first row in the output is replaced in place, far before the end of the file and keeping its size
+    first_row = (tmp_path / 'incremental.csv').read_text().split('\n')[1]
+    customer = first_row.split(',')[0]
+    input_file.write_text(input_file.read_text().replace(first_row, 'X' * len(customer) + first_row[len(customer):], 1))
+    clean_transactions_incremental(str(input_file), str(tmp_path / 'incremental.csv'), str(tmp_path / 'incremental.txt'))
+    clean_transactions(str(input_file), str(tmp_path / 'full.csv'), str(tmp_path / 'full.txt'))
+
+    assert (tmp_path / 'incremental.csv').read_text() == (tmp_path / 'full.csv').read_text()
@@ -0,0 +1,154 @@
+import os
+import pandas as pd
+import pytest
+from clean_up_all import item_cleaning_stages
+from correct_category_levels import CATEGORY_LEVELS
+from pipeline import run_stages
+from barcode_aliases import read_updated_transactions
+
+
+def items():
+    return pd.DataFrame({
+        'item_number': ['1001', '1002', '1003'],
+        'en_full_description': ['NIDO MILK POWDER 900G', 'LIPTON TEA 100 BAGS', 'BASMATI RICE 5KG'],
+        'ar_full_description': ['حليب نيدو', 'شاي ليبتون', 'رز بسمتي'],
+        'barcode': ['6281234567894', '4006381333931', '6291041500213'],
+        'UOM': ['PCS', 'PCS', 'KG'],
+        'packing': ['1', '1', '1'],
+        'en_short_desc': ['NIDO MILK POWDER', 'LIPTON TEA', 'BASMATI RICE'],
+        'ar_short_desc': ['حليب نيدو', 'شاي ليبتون', 'رز بسمتي'],
+        'brand': ['NIDO', 'LIPTON', ''],
+        'category_level1': ['FOOD', 'BEVERAGES', 'FOOD'],
+        'category_level2': ['DAIRY', '', 'GROCERY'],
+        'category_level3': ['NULL', None, 'RICE'],
+        'category_level4': ['', 'TEA', None],
+    })
+
+
+def test_item_cleaning_stages_fill_the_category_levels(tmp_path, monkeypatch):
+    # The stages write their logs to the Logs folder of the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Logs').mkdir()
+
+    df = run_stages(items(), item_cleaning_stages()).set_index('item_number')
+
+    assert df.loc[['1001', '1002', '1003'], CATEGORY_LEVELS].values.tolist() == [
+        ['FOOD', 'DAIRY', 'DAIRY', 'DAIRY'],
+        ['BEVERAGES', 'BEVERAGES', 'BEVERAGES', 'TEA'],
+        ['FOOD', 'GROCERY', 'RICE', 'RICE'],
+    ]
+    assert df.loc[['1001', '1002', '1003'], 'category_name'].tolist() == ['DAIRY', 'TEA', 'RICE']
+
+
+def test_rerun_with_row_cache_matches_a_run_from_scratch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Logs').mkdir()
+    run_stages(items(), item_cleaning_stages(row_cache_dir='rows'))
+
+    # One item changed, one added: only those rows go through the row-local stages again
+    changed = items()
+    changed.loc[1, 'category_level4'] = 'NULL'
+    changed.loc[3] = changed.loc[2]
+    changed.loc[3, ['item_number', 'barcode', 'category_level2']] = ['1004', '5000112637922', None]
+
+    rerun = run_stages(changed.copy(), item_cleaning_stages(row_cache_dir='rows'))
+    from_scratch = run_stages(changed.copy(), item_cleaning_stages())
+
+    pd.testing.assert_frame_equal(rerun, from_scratch)
+    assert rerun.set_index('item_number').loc[['1002', '1004'], CATEGORY_LEVELS].values.tolist() == [
+        ['BEVERAGES', 'BEVERAGES', 'BEVERAGES', 'BEVERAGES'],
+        ['FOOD', 'FOOD', 'RICE', 'RICE'],
+    ]
+
+
+def test_streamed_item_cleaning_matches_an_in_memory_run(tmp_path, monkeypatch):
+    from clean_up_all import clean_items, cleaned_with_max_barcode_file
+
+    # A temp item and an invalid barcode, so both streamed stages write their logs
+    df = items()
+    df.loc[3] = df.loc[2]
+    df.loc[3, ['item_number', 'en_full_description', 'barcode']] = ['1004', 'TEMP ITEMS TO BE DELETED', '12345']
+    df.loc[4] = df.loc[0]
+    df.loc[4, ['item_number', 'barcode']] = ['1005', '62812345678']
+
+    outputs = {}
+    for mode, chunksize in [('in_memory', None), ('streamed', 2)]:
+        for folder in ['Data', 'Output', 'Logs']:
+            os.makedirs(tmp_path / mode / folder)
+        monkeypatch.chdir(tmp_path / mode)
+        df.to_csv('Data/ml_items.csv', index=False, encoding='utf-8-sig')
+        outputs[mode] = clean_items(use_cache=False, chunksize=chunksize)
+
+    assert outputs['streamed']['item_number'].tolist() == ['1001', '1002', '1003', '1005']
+    for output in [cleaned_with_max_barcode_file, 'Logs/Items_to_be_deleted.txt', 'Logs/invalid_barcodes.csv']:
+        assert (tmp_path / 'streamed' / output).read_bytes() == (tmp_path / 'in_memory' / output).read_bytes()
+
+
+def transactions(rows):
+    return pd.DataFrame(rows, columns=['customer_barcode', 'invoice_id', 'item_barcode', 'quantity', 'timestamp'])
+
+
+def cleaned_items():
+    df = items().assign(MODIFIED_SHORT_DESC=items()['en_short_desc'])
+    df['MAX_barcode'] = df['barcode']
+    return df
+
+
+@pytest.mark.parametrize('category_changed', [False, True])
+def test_incremental_transaction_update_matches_a_full_update(tmp_path, monkeypatch, category_changed):
+    from clean_up_all import transactions_updated_file, update_transactions_with_items
+
+    first_batch = transactions([
+        ['C1', '1', '6281234567894', '1', '01/01/2024 10:00:00'],
+        ['', '2', '4006381333931', '2', '01/01/2024 11:00:00'],
+        ['C1', '3', '0000000000001', '1', '02/01/2024 09:00:00'],
+    ])
+    second_batch = transactions([
+        ['C3', '4', '6291041500213', '5', '03/01/2024 08:00:00'],
+        ['C2', '5', '6281234567894', '1', '03/01/2024 09:00:00'],
+    ])
+
+    # A changed category gives the already updated transactions another leaf node, the barcode aliases stay the same
+    second_items = cleaned_items()
+    if category_changed:
+        second_items.loc[0, 'category_level4'] = 'CHEESE'
+
+    outputs = {}
+    for mode in ['incremental', 'full']:
+        os.makedirs(tmp_path / mode / 'Data')
+        os.makedirs(tmp_path / mode / 'Output')
+        os.makedirs(tmp_path / mode / 'Logs')
+        os.symlink('Logs', tmp_path / mode / 'logs')
+        monkeypatch.chdir(tmp_path / mode)
+        first_batch.to_csv('Data/ml_transactions_outbox.csv', index=False)
+        if mode == 'incremental':
+            update_transactions_with_items(cleaned_items())
+        # The second batch is appended to the outbox, the incremental run only reads it
+        second_batch.to_csv('Data/ml_transactions_outbox.csv', mode='a', header=False, index=False)
+        new_transactions_df, _ = update_transactions_with_items(second_items, incremental=mode == 'incremental')
+        outputs[mode] = (tmp_path / mode / transactions_updated_file).read_bytes()
+        if mode == 'incremental':
+            assert new_transactions_df['invoice_id'].tolist() == ['4', '5']
+
+    assert outputs['incremental'] == outputs['full']
+    # The missing customer reads back as missing, as load_csv reads it
+    assert read_updated_transactions(tmp_path / 'full' / transactions_updated_file)['customer_barcode'].isna().tolist() == \
+        [False, True, False, False]
+
+
+def test_transactions_only_update_reads_the_cleaned_items(tmp_path, monkeypatch):
+    import clean_up_all
+
+    for folder in ['Data', 'Output', 'Logs']:
+        os.makedirs(tmp_path / folder)
+    os.symlink('Logs', tmp_path / 'logs')
+    monkeypatch.chdir(tmp_path)
+    cleaned_items().to_csv(clean_up_all.cleaned_with_max_barcode_file, index=False)
+    transactions([['C1', '1', '6281234567894', '1', '01/01/2024 10:00:00']]).to_csv(clean_up_all.transactions_file, index=False)
+    # The items are not cleaned again
+    monkeypatch.setattr(clean_up_all, 'clean_items', None)
+
+    clean_up_all.update_transactions_only(use_cache=False)
+
+    updated = read_updated_transactions(clean_up_all.transactions_updated_file)
+    assert updated[['customer_barcode', 'item_barcode']].values.tolist() == [['C1', '6281234567894']]
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from correct_category_levels import CATEGORY_LEVELS, LEVEL_BITS, correct_category_levels_df
+
+
+def items(levels):
+    return pd.DataFrame(levels, columns=CATEGORY_LEVELS, dtype=object)
+
+
+def test_missing_levels_are_filled_from_the_level_above(tmp_path):
+    df = items([
+        ['FOOD', 'DAIRY', 'MILK', 'FRESH MILK'],
+        [' FOOD ', None, '', 'NULL'],
+        ['FOOD', ' DAIRY ', ' null ', np.nan],
+    ])
+    df = correct_category_levels_df(df, str(tmp_path / 'log.csv'))
+
+    assert df[CATEGORY_LEVELS].values.tolist() == [
+        ['FOOD', 'DAIRY', 'MILK', 'FRESH MILK'],
+        [' FOOD ', 'FOOD', 'FOOD', 'FOOD'],
+        ['FOOD', ' DAIRY ', 'DAIRY', 'DAIRY'],
+    ]
+    assert df['category_name'].tolist() == ['FRESH MILK', 'FOOD', 'DAIRY']
+
+
+def test_log_has_the_rows_and_corrected_levels(tmp_path):
+    log_file_path = tmp_path / 'log.csv'
+    df = items([
+        ['FOOD', 'DAIRY', 'MILK', 'FRESH MILK'],
+        ['NULL', 'DAIRY', 'MILK', ''],
+    ])
+    df = correct_category_levels_df(df, str(log_file_path))
+
+    assert df.loc[1, CATEGORY_LEVELS].tolist() == ['NULL', 'DAIRY', 'MILK', 'MILK']
+    log = pd.read_csv(log_file_path, encoding='utf-8-sig')
+    assert log['row'].tolist() == [1]
+    assert log['corrected_levels'].tolist() == [LEVEL_BITS['category_level1'] | LEVEL_BITS['category_level4']]
+
+
+def test_levels_are_filled_whatever_the_column_types(tmp_path):
+    # The filled levels are assigned to the columns, not left to writes through row views
+    df = items([['FOOD', '', 'MILK', None]])
+    df['packing'] = [1.5]
+    df = correct_category_levels_df(df, str(tmp_path / 'log.csv'))
+
+    assert df.loc[0, CATEGORY_LEVELS].tolist() == ['FOOD', 'FOOD', 'MILK', 'MILK']
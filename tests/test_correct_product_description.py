@@ -0,0 +1,29 @@
+import pandas as pd
+from correct_product_description import correct_product_description_chunk
+
+
+def items(short_descs, full_descs):
+    return pd.DataFrame({
+        'en_short_desc': short_descs,
+        'en_full_description': full_descs,
+        'barcode': [str(6281234567890 + i) for i in range(len(short_descs))],
+    }, dtype=str)
+
+
+def test_rules_apply_to_hash_and_product_number_rows():
+    df = correct_product_description_chunk(items(
+        ['#X1', '#Y2', '*KEEP*', '123'],
+        ['TEA #X1 BOX', 'SUGAR', 'ANYTHING', '#Z9 - OIL'],
+    ))
+
+    assert df['MODIFIED_SHORT_DESC'].tolist() == ['TEA BOX #X1', 'SUGAR #Y2', '', 'OIL #Z9']
+
+
+def test_chunk_without_hash_or_product_number_rows():
+    # No short description starts with '#' and no full description has a product number
+    df = correct_product_description_chunk(items(
+        ['MILK', 'BASMATI RICE BAG'],
+        ['NIDO MILK 1L', 'BASMATI RICE BAG 5KG'],
+    ))
+
+    assert df['MODIFIED_SHORT_DESC'].tolist() == ['NIDO 1L MILK', 'BASMATI RICE BAG']
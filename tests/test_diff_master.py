@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from diff_master import ADDED, DELETED, MODIFIED, changed_column_flags, diff_frames
+
+
+def master(**columns):
+    return pd.DataFrame(columns)
+
+
+def test_blank_cell_does_not_change_the_other_rows():
+    # A blank cell turns the int columns of the new file into floats: 1001 becomes 1001.0
+    old_df = master(item_number=[1001, 1002, 1003], barcode=['6281234567894', '4006381333931', '6291041500213'],
+                    packing=[1, 12, 6], description=['MILK', 'TEA', 'RICE'])
+    new_df = master(item_number=[1001.0, 1002.0, np.nan], barcode=['6281234567894', '4006381333931', '6291041500213'],
+                    packing=[1.0, np.nan, 6.0], description=['MILK', 'TEA', 'RICE'])
+
+    diff, columns = diff_frames(old_df, new_df)
+
+    assert diff[['item_number', 'status']].values.tolist() == [['1002', MODIFIED], ['', ADDED], ['1003', DELETED]]
+    assert changed_column_flags(diff, columns).loc[0].to_dict() == {
+        'item_number': False, 'barcode': False, 'packing': True, 'description': False}
+
+
+def test_numbers_match_their_text():
+    old_df = master(item_number=['1001', '1002'], barcode=['6281234567894', '4006381333931'], packing=['1', '1.5'])
+    new_df = master(item_number=[1001.0, 1002.0], barcode=['6281234567894', '4006381333931'], packing=[1.0, 1.5])
+
+    diff, _ = diff_frames(old_df, new_df)
+
+    assert diff.empty
@@ -0,0 +1,59 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+import main
+from main import COLUMN_CHECKS, check_fields, check_fields_streaming, duplicated_hashes
+
+HEADER = ['item_number', 'barcode', 'en_full_description', 'ar_full_description', 'en_short_desc', 'ar_short_desc',
+          'brand', 'category_level1', 'category_level2', 'category_level3', 'category_level4']
+ROWS = [
+    [1001, 6281234567894, 'MILK 1L', 'حليب', 'MILK', 'حليب', 'NIDO', 'FOOD', 'DAIRY', 'MILK', 'FRESH'],
+    [1002, '6281234567894', ' TEA 100 ', 'شاي', 'TEA', 'شاي', None, 'FOOD', None, 'TEA', 'BAGS'],
+    [1003, 4006381333931, 'RICE 5KG', 'رز', 12, 'رز', 'LIPTON', 'FOOD', 'GROCERY', '', 'RICE'],
+    [1004, None, 'MILK 1L', 'NULL', '12', 'حليب', 'NIDO', 'FOOD', 'DAIRY', 'MILK', 'FRESH'],
+    [None, None, None, None, None, None, None, None, None, None, None],
+    [1005, 6291041500213, 'OIL 1.5L', 'زيت', 12.5, 'زيت', 'NIDO', 'FOOD', 'GROCERY', 'OIL', 'NULL'],
+    [1006, 5000112637922, 'RICE 5KG', 'زيت', 12.5, 'رز', 'NIDO', 'FOOD', 'GROCERY', 'RICE', 'RICE'],
+    [None, None, None, None, None, None, None, None, None, None, None],
+]
+
+
+def write_workbook(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 100])
+def test_streaming_matches_the_full_load(tmp_path, batch_size):
+    excel_path = tmp_path / 'items.xlsx'
+    write_workbook(excel_path, ROWS)
+
+    full_log, streamed_log = io.StringIO(), io.StringIO()
+    full_summary = check_fields(pd.read_excel(excel_path, dtype={'barcode': str}), full_log, COLUMN_CHECKS)
+    streamed_summary = check_fields_streaming(str(excel_path), streamed_log, COLUMN_CHECKS, batch_size)
+
+    assert streamed_summary == full_summary
+    assert streamed_log.getvalue() == full_log.getvalue()
+    assert ('en_short_desc', 'unique', 2) in streamed_summary
+
+
+def test_duplicates_of_sorted_runs_merged_in_small_blocks(tmp_path, monkeypatch):
+    # Blocks of a few hashes, so equal hashes are split across blocks and runs
+    monkeypatch.setattr(main, 'MERGE_BLOCK_HASHES', 12)
+    runs = [np.sort(np.random.default_rng(seed).integers(0, 60, size, dtype=np.uint64)) for seed, size in
+            enumerate([40, 1, 25, 0, 33])]
+    np.concatenate(runs).tofile(tmp_path / 'hashes')
+
+    duplicates = duplicated_hashes(str(tmp_path / 'hashes'), [len(run) for run in runs], str(tmp_path / 'duplicates'))
+
+    values, counts = np.unique(np.concatenate(runs), return_counts=True)
+    assert np.array(duplicates).tolist() == values[counts > 1].tolist()
+    del duplicates
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+from normalize_barcodes import normalize_barcodes_df
+
+
+def test_barcodes_are_normalized_and_classified(tmp_path):
+    df = pd.DataFrame({
+        'item_number': ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10'],
+        'barcode': [' 6281234567895 ', '="4006381333931"', '6281234567890.0', '6.29E+12', '6.281234567894e12',
+                    '2012345678901', np.nan, '10628123456787', '12345', 'AB1234567890'],
+    })
+    log_file_path = tmp_path / 'invalid_barcodes.csv'
+
+    df = normalize_barcodes_df(df, str(log_file_path))
+
+    # Scientific notation lost digits, it is left as it is and reported as invalid
+    assert df['barcode'].tolist()[:6] == ['6281234567895', '4006381333931', '6281234567890', '6.29E+12',
+                                          '6.281234567894e12', '2012345678901']
+    assert df['barcode'].isna().tolist()[6]
+    # Only a restricted circulation prefix is internal, other lengths and letters are invalid
+    assert df['barcode_type'].tolist() == ['valid', 'valid', 'invalid', 'invalid', 'invalid', 'internal', 'invalid',
+                                           'valid', 'invalid', 'invalid']
+    invalid = pd.read_csv(log_file_path, dtype=str, encoding='utf-8-sig')
+    assert invalid['item_number'].tolist() == ['3', '4', '5', '7', '9', '10']
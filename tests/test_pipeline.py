@@ -0,0 +1,62 @@
+import inspect
+import pandas as pd
+from cluster_duplicates import cluster_duplicates_df
+from near_duplicates import near_duplicates_df
+from normalize_barcodes import normalize_barcodes_df
+from pipeline import project_modules, restore_csv_missing_values, run_stages, stage_cache_key
+from surrogate_keys import add_key_ids
+
+
+def module_names(function):
+    return [module.__name__ for module in project_modules(inspect.getmodule(function))]
+
+
+def test_project_modules_follow_the_imports():
+    assert module_names(near_duplicates_df) == ['cluster_duplicates', 'near_duplicates', 'pipeline']
+    assert module_names(add_key_ids) == ['normalize_barcodes', 'pipeline', 'surrogate_keys']
+    assert module_names(cluster_duplicates_df) == ['cluster_duplicates', 'pipeline']
+
+
+def test_editing_an_imported_module_changes_the_stage_key(monkeypatch):
+    key = stage_cache_key('input', 'near_duplicates', near_duplicates_df, {})
+    original_getsource = inspect.getsource
+
+    def edited_getsource(module):
+        source = original_getsource(module)
+        return source + '\n# edited\n' if module.__name__ == 'cluster_duplicates' else source
+
+    monkeypatch.setattr(inspect, 'getsource', edited_getsource)
+    assert stage_cache_key('input', 'near_duplicates', near_duplicates_df, {}) != key
+
+
+def test_cached_stages_replay_their_declared_logs(tmp_path):
+    log_file = str(tmp_path / 'invalid_barcodes.csv')
+    stages = [('normalize_barcodes', normalize_barcodes_df, {'log_file_path': log_file})]
+    with_invalid = pd.DataFrame({'item_number': ['1', '2'], 'barcode': ['6281234567895', '12345']})
+    all_valid = pd.DataFrame({'item_number': ['1'], 'barcode': ['6281234567895']})
+
+    def run(df):
+        return run_stages(df.copy(), stages, cache_dir=str(tmp_path / 'cache'), stage_logs={'normalize_barcodes': [log_file]})
+
+    run(with_invalid)
+    written = (tmp_path / 'invalid_barcodes.csv').read_bytes()
+
+    # A stage that writes no log this time leaves no stale log behind, also when replayed from the cache
+    run(all_valid)
+    assert not (tmp_path / 'invalid_barcodes.csv').exists()
+    (tmp_path / 'invalid_barcodes.csv').write_text('stale')
+    run(all_valid)
+    assert not (tmp_path / 'invalid_barcodes.csv').exists()
+
+    run(with_invalid)
+    assert (tmp_path / 'invalid_barcodes.csv').read_bytes() == written
+
+
+def test_only_text_columns_get_the_csv_missing_values():
+    df = pd.DataFrame({'barcode': ['NA', '123'], 'cluster_id': [0, 1]}, index=[5, 7])
+
+    df = restore_csv_missing_values(df)
+
+    assert df['barcode'].isna().tolist() == [True, False]
+    assert df['cluster_id'].dtype == 'int64'
+    assert df.index.tolist() == [0, 1]
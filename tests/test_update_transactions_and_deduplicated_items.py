@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from update_transactions_and_deduplicated_items import update_transactions_df
+
+
+def test_not_found_items_are_logged_once_each(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Logs').mkdir()
+    (tmp_path / 'logs').symlink_to('Logs')
+    items_df = pd.DataFrame({'barcode': ['111', '222', '333'], 'MAX_barcode': ['333', '222', '333']})
+    transactions_df = pd.DataFrame({'item_barcode': ['111', '999', '222', '999', '888', np.nan]})
+
+    transactions_df, deduplicated_items = update_transactions_df(transactions_df, items_df)
+
+    assert transactions_df['item_barcode'].tolist() == ['333', '222']
+    assert sorted(deduplicated_items['barcode']) == ['222', '333']
+    # The barcodes of the dropped transactions once each, in first-seen order, the missing one left out
+    assert (tmp_path / 'Logs' / 'not_found_items.csv').read_text(encoding='utf-8-sig').splitlines() == ['item_barcode', '999', '888']
+
+
+def test_no_not_found_log_when_every_barcode_is_found(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Logs').mkdir()
+    (tmp_path / 'logs').symlink_to('Logs')
+    items_df = pd.DataFrame({'barcode': ['111', '222'], 'MAX_barcode': ['111', '222']})
+
+    transactions_df, _ = update_transactions_df(pd.DataFrame({'item_barcode': ['222', '111']}), items_df)
+
+    assert transactions_df['item_barcode'].tolist() == ['222', '111']
+    assert not (tmp_path / 'Logs' / 'not_found_items.csv').exists()